@@ -0,0 +1,265 @@
+# alerts.py
+# Email alerts that never hold up the monitoring loop.
+#
+# The monitor hands every PingResult to AlertDispatcher.report(), which only
+# puts it on a queue. A background thread keeps track of which hosts are up or
+# down, sends an alert only when a host changes state, collects the changes
+# for a few seconds into one digest email and reuses one logged-in SMTP
+# connection for all of them. A digest that cannot be sent is tried again a
+# few times, together with the changes that come in meanwhile, and logged as
+# lost if it still fails. A host name that cannot be resolved was not
+# pinged at all, so it is reported as UNRESOLVED instead of DOWN.
+
+import time
+import queue
+import logging
+import smtplib
+import threading
+from collections import deque
+from datetime import datetime
+from email.mime.text import MIMEText
+
+_STOP = object() # Tells the dispatcher thread to finish
+
+
+class HostState:
+    """
+    What the dispatcher knows about one host.
+    """
+    __slots__ = ('up', 'resolved', 'changes', 'flapping')
+
+    def __init__(self):
+        self.up = None # Unknown until the first result
+        self.resolved = None # Whether the name resolved in the last result
+        self.changes = deque() # Times of recent up/down changes
+        self.flapping = False
+
+
+class AlertDispatcher:
+    """
+    Sends down/up alerts as digest emails from a background thread.
+
+    Args:
+        smtp_server (str), smtp_port (int): Mail server to send through.
+        sender (str), receiver (str): Email addresses.
+        password (str): Login password, None to skip the login.
+        use_tls (bool): Upgrade the connection with STARTTLS.
+        digest_interval (float): Collect alerts for this many seconds into one email.
+        flap_window (float), flap_threshold (int): A host that changes state
+            flap_threshold times within flap_window seconds is "flapping"; its
+            individual changes are not sent until it has been stable for a whole window.
+        idle_timeout (float): Close the SMTP connection after this many idle seconds.
+        alert_on_first_down (bool): Alert for hosts that are already down the first time we see them.
+        retry_interval (float), max_retries (int): Try a digest that could not be sent again after
+            retry_interval seconds, up to max_retries times, then log its alerts as lost.
+    """
+
+    def __init__(self, smtp_server, smtp_port, sender, receiver, password=None, use_tls=True,
+                 digest_interval=10.0, flap_window=600.0, flap_threshold=4, idle_timeout=60.0,
+                 alert_on_first_down=True, max_queue=100000, retry_interval=30.0, max_retries=3):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.sender = sender
+        self.receiver = receiver
+        self.password = password
+        self.use_tls = use_tls
+        self.digest_interval = digest_interval
+        self.flap_window = flap_window
+        self.flap_threshold = flap_threshold
+        self.idle_timeout = idle_timeout
+        self.alert_on_first_down = alert_on_first_down
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+
+        self.states = {} # host -> HostState, only used by the dispatcher thread
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.lost = 0 # Alerts given up on because the mail server could not be reached
+        self.emails_sent = 0
+        self._smtp = None
+        self._last_used = 0
+        self._thread = threading.Thread(target=self._run, name="AlertDispatcher", daemon=True)
+        self._thread.start()
+
+    def report(self, result):
+        """
+        Hands a PingResult to the dispatcher. Never blocks.
+        """
+        try:
+            self.queue.put_nowait((result.host, result.success, result.resolved, result.timestamp, result.summary()))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """
+        Sends any collected alerts and closes the SMTP connection.
+        """
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        events = [] # (host, "DOWN"/"UP"/"FLAPPING"/"UNRESOLVED"/"RESOLVED", timestamp, summary)
+        logged = 0 # Events already logged by an earlier attempt to send them
+        failures = 0 # Failed attempts to send these events
+        digest_deadline = None
+        stopping = False
+        while not stopping:
+            if digest_deadline is not None:
+                timeout = max(0, digest_deadline - time.monotonic())
+            else:
+                timeout = self.idle_timeout
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                event = self._update_state(*item)
+                if event is not None:
+                    events.append(event)
+                    if digest_deadline is None:
+                        digest_deadline = time.monotonic() + self.digest_interval
+
+            if events and (stopping or time.monotonic() >= digest_deadline):
+                if not self._send_digest(events, logged):
+                    failures += 1
+                    logged = len(events)
+                    if not stopping and failures <= self.max_retries:
+                        # Kept, with the changes that come in meanwhile, for the next attempt
+                        digest_deadline = time.monotonic() + self.retry_interval
+                        continue
+                    self.lost += len(events)
+                    logging.error(f"Giving up on {len(events)} alert(s) after {failures} failed attempt(s): "
+                                  + ", ".join(f"{host} {kind}" for host, kind, _, _ in events))
+                events = []
+                logged = failures = 0
+                digest_deadline = None
+            elif self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._disconnect()
+        self._disconnect()
+
+    def _update_state(self, host, success, resolved, timestamp, summary):
+        """
+        Records a result and returns the event to alert on, or None.
+
+        Results of names that could not be resolved leave the up/down state
+        alone: the host was not pinged, so nothing is known about it.
+        """
+        state = self.states.get(host)
+        if state is None:
+            state = self.states[host] = HostState()
+        now = time.monotonic()
+        while state.changes and now - state.changes[0] > self.flap_window:
+            state.changes.popleft()
+
+        was_resolved, state.resolved = state.resolved, resolved
+        if not resolved:
+            if was_resolved or (was_resolved is None and self.alert_on_first_down):
+                return (host, "UNRESOLVED", timestamp, summary)
+            return None
+        event = self._update_up_state(state, host, success, now, timestamp, summary)
+        if event is None and was_resolved is False:
+            return (host, "RESOLVED", timestamp, summary)
+        return event
+
+    def _update_up_state(self, state, host, success, now, timestamp, summary):
+        # The up/down and flapping part of _update_state, for hosts that were pinged
+        if state.up is None:
+            state.up = success
+            if not success and self.alert_on_first_down:
+                return (host, "DOWN", timestamp, summary)
+            return None
+
+        if success == state.up:
+            if state.flapping and not state.changes:
+                # Stable for a whole window again
+                state.flapping = False
+                return (host, "UP" if success else "DOWN", timestamp, summary)
+            return None
+
+        state.up = success
+        state.changes.append(now)
+        if state.flapping:
+            return None
+        if len(state.changes) >= self.flap_threshold:
+            state.flapping = True
+            return (host, "FLAPPING", timestamp, summary)
+        return (host, "UP" if success else "DOWN", timestamp, summary)
+
+    def _send_digest(self, events, logged=0):
+        # Logs the events from `logged` on and emails all of them; returns False if that failed
+        down = [event for event in events if event[1] == "DOWN"]
+        unresolved = [event for event in events if event[1] == "UNRESOLVED"]
+        if len(events) == 1:
+            host, kind, _, _ = events[0]
+            severity = {"DOWN": "CRITICAL", "UNRESOLVED": "WARNING"}.get(kind, "NOTICE")
+            subject = f"{severity}: Host {host} is {kind}"
+        else:
+            subject = (f"Host alerts: {len(down)} down, {len(unresolved)} unresolved, "
+                       f"{len(events) - len(down) - len(unresolved)} other changes")
+        entries = []
+        for host, kind, timestamp, summary in events:
+            when = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+            entry = f"[{when}] {host} is {kind}"
+            if kind not in ("UP", "RESOLVED"):
+                entry += "\n    " + summary.replace("\n", "\n    ")
+            entries.append(entry)
+        if logged < len(events):
+            if any(event[1] == "DOWN" for event in events[logged:]):
+                logging.critical("\n".join(entries[logged:]))
+            else:
+                logging.warning("\n".join(entries[logged:]))
+        return self._send(subject, "\n".join(entries))
+
+    def _send(self, subject, body):
+        # Returns True if the email was sent
+        msg = MIMEText(body)
+        msg['Subject'] = subject
+        msg['From'] = self.sender
+        msg['To'] = self.receiver
+        # One retry on a fresh connection in case the server dropped the pooled one
+        for attempt in range(2):
+            try:
+                self._connect().send_message(msg)
+                self._last_used = time.monotonic()
+                self.emails_sent += 1
+                logging.info(f"Email alert sent: '{subject}'")
+                return True
+            except (smtplib.SMTPServerDisconnected, ConnectionError, OSError) as e:
+                self._disconnect()
+                if attempt:
+                    logging.error(f"Failed to send email alert: {e}")
+            except Exception as e:
+                logging.error(f"Failed to send email alert: {e}")
+                return False
+        return False
+
+    def _connect(self):
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+            try:
+                if self.use_tls:
+                    smtp.starttls() # Upgrade connection to TLS
+                if self.password is not None:
+                    smtp.login(self.sender, self.password)
+            except BaseException:
+                smtp.close()
+                raise
+            self._smtp = smtp
+        return self._smtp
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass # The server may already be gone
+            self._smtp = None
@@ -0,0 +1,241 @@
+# bench_alerts.py
+# Checks of alerts.AlertDispatcher against a local stand-in SMTP server, so
+# no mail is sent anywhere: state changes are collected into digest emails,
+# flapping hosts are reported once instead of on every change, host names
+# that cannot be resolved are reported as UNRESOLVED and not as DOWN, and a
+# connection the server dropped is replaced by a new one.
+#
+# Usage: python bench_alerts.py
+
+import gc
+import time
+import email
+import logging
+import warnings
+import threading
+import socketserver
+
+from alerts import AlertDispatcher
+from ping_result import PingResult
+
+DIGEST_INTERVAL = 0.3
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """
+    Speaks just enough SMTP for smtplib and keeps every message it gets.
+    With drop_after_message it hangs up after each message, like a server
+    that closes idle connections.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, drop_after_message=False, port=0):
+        super().__init__(("127.0.0.1", port), SmtpHandler)
+        self.drop_after_message = drop_after_message
+        self.messages = []
+        self.connections = 0
+        self.open_connections = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+            self.server.open_connections += 1
+        try:
+            self.talk()
+        finally:
+            with self.server.lock:
+                self.server.open_connections -= 1
+
+    def talk(self):
+        self.reply("220 localhost SMTP sink")
+        for line in self.rfile:
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in self.rfile:
+                    if data_line == b".\r\n":
+                        break
+                    data.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                with self.server.lock:
+                    self.server.messages.append(email.message_from_bytes(b"".join(data)))
+                self.reply("250 OK")
+                if self.server.drop_after_message:
+                    return
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else: # MAIL, RCPT, RSET, NOOP
+                self.reply("250 OK")
+
+
+def result(host, success):
+    return PingResult.from_rtts(host, [0.5] if success else [None])
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def dispatcher(sink, **options):
+    options.setdefault("digest_interval", DIGEST_INTERVAL)
+    return AlertDispatcher("127.0.0.1", sink.port, "monitor@example.com", "ops@example.com",
+                           use_tls=False, **options)
+
+
+def check_digest():
+    # Changes that come in within digest_interval go out as one email
+    sink = SmtpSink()
+    with dispatcher(sink) as alerts:
+        for host in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+            alerts.report(result(host, True))
+        for host in ("10.0.0.1", "10.0.0.2"):
+            alerts.report(result(host, False))
+        alerts.report(result("10.0.0.3", True)) # No change, no alert
+        wait_for(lambda: len(sink.messages) == 1)
+        time.sleep(DIGEST_INTERVAL * 2)
+        assert len(sink.messages) == 1, [message["Subject"] for message in sink.messages]
+        message = sink.messages[0]
+        assert message["Subject"] == "Host alerts: 2 down, 0 unresolved, 0 other changes", message["Subject"]
+        body = message.get_payload()
+        assert "10.0.0.1 is DOWN" in body and "10.0.0.2 is DOWN" in body and "10.0.0.3" not in body
+
+        alerts.report(result("10.0.0.1", True))
+        wait_for(lambda: len(sink.messages) == 2)
+        assert sink.messages[1]["Subject"] == "NOTICE: Host 10.0.0.1 is UP", sink.messages[1]["Subject"]
+    sink.close()
+    assert sink.connections == 1, f"{sink.connections} connections for two emails"
+    print("digest checks passed")
+
+
+def check_flapping(flap_window=1.0):
+    # After flap_threshold changes the host is reported as FLAPPING once, then
+    # its changes are held back until it has been stable for a whole window
+    sink = SmtpSink()
+    with dispatcher(sink, flap_window=flap_window, flap_threshold=4) as alerts:
+        alerts.report(result("flappy", True))
+        for success in (False, True, False, True, False, True, False):
+            alerts.report(result("flappy", success))
+        wait_for(lambda: len(sink.messages) == 1)
+        body = sink.messages[0].get_payload()
+        assert body.count("flappy is") == 4 and "flappy is FLAPPING" in body, body
+
+        # Stable (down) for longer than the window: one more alert with the state it settled in
+        deadline = time.monotonic() + flap_window * 1.5
+        while time.monotonic() < deadline:
+            alerts.report(result("flappy", False))
+            time.sleep(0.05)
+        wait_for(lambda: len(sink.messages) == 2)
+        assert sink.messages[1]["Subject"] == "CRITICAL: Host flappy is DOWN", sink.messages[1]["Subject"]
+        time.sleep(DIGEST_INTERVAL * 2)
+        assert len(sink.messages) == 2
+    sink.close()
+    print("flapping checks passed")
+
+
+def check_unresolved():
+    # A name that does not resolve was not pinged: it is neither up nor down
+    sink = SmtpSink()
+    with dispatcher(sink) as alerts:
+        alerts.report(result("name.example", True))
+        alerts.report(PingResult.unresolved("name.example", "Name or service not known"))
+        wait_for(lambda: len(sink.messages) == 1)
+        assert sink.messages[0]["Subject"] == "WARNING: Host name.example is UNRESOLVED", sink.messages[0]["Subject"]
+
+        # Still unresolved: no new alert. Resolved again and up: it never was down
+        alerts.report(PingResult.unresolved("name.example", "Name or service not known"))
+        alerts.report(result("name.example", True))
+        wait_for(lambda: len(sink.messages) == 2)
+        assert sink.messages[1]["Subject"] == "NOTICE: Host name.example is RESOLVED", sink.messages[1]["Subject"]
+
+        # Resolved again but down: that is the alert
+        alerts.report(PingResult.unresolved("name.example", "Name or service not known"))
+        alerts.report(result("name.example", False))
+        alerts.report(PingResult.unresolved("other.example", "Name or service not known"))
+        wait_for(lambda: len(sink.messages) == 3)
+        subject = sink.messages[2]["Subject"]
+        assert subject == "Host alerts: 1 down, 2 unresolved, 0 other changes", subject
+        time.sleep(DIGEST_INTERVAL * 2)
+        assert len(sink.messages) == 3
+    sink.close()
+    print("unresolved checks passed")
+
+
+def check_reconnect():
+    # The server hangs up after every message: each email is sent on a new connection
+    sink = SmtpSink(drop_after_message=True)
+    with dispatcher(sink) as alerts:
+        for number, success in enumerate((False, True, False)):
+            alerts.report(result("10.0.0.9", success))
+            wait_for(lambda: len(sink.messages) == number + 1)
+        assert alerts.emails_sent == 3
+    sink.close()
+    assert sink.connections == 3, sink.connections
+
+    # Mail server down: the alert is kept and goes out with the next change once the server is back
+    sink = SmtpSink()
+    port = sink.port
+    sink.close()
+    alerts = AlertDispatcher("127.0.0.1", port, "monitor@example.com", "ops@example.com", use_tls=False,
+                             digest_interval=0.05, retry_interval=0.2)
+    alerts.report(result("10.0.0.8", False))
+    time.sleep(0.5)
+    assert alerts.emails_sent == 0 and alerts.lost == 0
+    sink = SmtpSink(port=port)
+    alerts.report(result("10.0.0.8", True))
+    wait_for(lambda: len(sink.messages) == 1)
+    assert sink.messages[0]["Subject"] == "Host alerts: 1 down, 0 unresolved, 1 other changes"
+    alerts.close()
+    sink.close()
+
+    # Still down after max_retries more attempts: the alert is logged as lost
+    alerts = AlertDispatcher("127.0.0.1", port, "monitor@example.com", "ops@example.com", use_tls=False,
+                             digest_interval=0.05, retry_interval=0.05, max_retries=2)
+    alerts.report(result("10.0.0.7", False))
+    wait_for(lambda: alerts.lost == 1)
+    assert alerts.emails_sent == 0
+    alerts.close()
+
+    # A failed STARTTLS (the sink does not offer it) closes the connection instead of leaving it to the GC
+    sink = SmtpSink()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+        alerts = AlertDispatcher("127.0.0.1", sink.port, "monitor@example.com", "ops@example.com", use_tls=True,
+                                 digest_interval=0.05, max_retries=0)
+        alerts.report(result("10.0.0.6", False))
+        wait_for(lambda: alerts.lost == 1)
+        alerts.close()
+        gc.collect()
+    assert not [warning for warning in caught if issubclass(warning.category, ResourceWarning)], caught
+    wait_for(lambda: sink.connections == 2 and sink.open_connections == 0)
+    sink.close()
+    print("reconnect checks passed")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.CRITICAL + 1) # Alerts are logged too, keep them out of the output
+    check_digest()
+    check_flapping()
+    check_unresolved()
+    check_reconnect()
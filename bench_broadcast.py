@@ -0,0 +1,213 @@
+# bench_broadcast.py
+# Fan-out latency of Server.broadcast_message with 1,000 receivers, one of
+# which never reads its socket, for each slow-consumer policy.
+#
+# Before per-client outboxes the stalled receiver made sendall() block while
+# holding the server lock, so every broadcast stopped once its socket
+# buffers were full.
+#
+# First it checks what each policy does to a client that stops reading,
+# with limits small enough that the client really reaches them.
+#
+# Usage: python bench_broadcast.py [number_of_receivers] [number_of_messages]
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import threading
+import subprocess
+
+from protocol import DEFAULT_CODEC, FrameReader, encode_message
+from bench_server import HOST, PORT, open_files, wait_for_server
+from bench_topics import wait_for_port
+
+CODE = "import server; server.Server({host!r}, {port}, max_queue=50, slow_consumer_policy={policy!r}).start()"
+POLICIES = ["drop_oldest", "disconnect", "backpressure"]
+
+
+# Servers with small slow-consumer limits for the policy checks
+CHECK_SERVERS = {
+    "threads": "import server; server.Server({host!r}, {port}, max_queue=20, slow_consumer_policy={policy!r}, "
+               "backpressure_timeout={timeout}).start()",
+    "asyncio": "import server; server.AsyncServer({host!r}, {port}, max_buffer=64 * 1024, "
+               "slow_consumer_policy={policy!r}, backpressure_timeout={timeout}).start()",
+}
+CHECK_MESSAGES = 400
+CHECK_MESSAGE_SIZE = 20000 # 8 MB in all, more than the socket buffers of a stalled client hold
+
+
+def connect(receive_buffer=None):
+    # A chat connection the server has registered (it answered hello)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if receive_buffer is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    sock.connect((HOST, PORT))
+    sock.sendall(encode_message({"type": "hello"}))
+    sock.settimeout(5)
+    reader = FrameReader()
+    while not any(DEFAULT_CODEC.decode(payload).get("type") == "welcome" for payload in reader.frames()):
+        assert reader.recv_into(sock), "server closed the connection"
+    return sock
+
+
+def count_messages(sock, quiet=2.0):
+    """
+    Reads chat messages until the connection is closed or nothing arrives for `quiet` seconds.
+
+    Returns:
+        tuple: (number of messages, True if the connection was closed,
+        time.perf_counter() when the last message arrived)
+    """
+    reader = FrameReader()
+    sock.settimeout(quiet)
+    count = 0
+    last = None
+    closed = True
+    try:
+        while reader.recv_into(sock):
+            for _ in reader.frames():
+                count += 1
+                last = time.perf_counter()
+    except socket.timeout:
+        closed = False
+    except ConnectionResetError:
+        pass
+    return count, closed, last
+
+
+def check_policy(kind, policy, stall, timeout=0.5):
+    """
+    Broadcasts CHECK_MESSAGES messages while one client does not read for
+    `stall` seconds.
+
+    Returns:
+        tuple: (messages the stalled client got, True if it was disconnected,
+        seconds until a client that reads all the time had every message)
+    """
+    code = CHECK_SERVERS[kind].format(host=HOST, port=PORT, policy=policy, timeout=timeout)
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port()
+        sender, reader, stalled = connect(), connect(), connect(receive_buffer=4096)
+        got = []
+        reading = threading.Thread(target=lambda: got.append(count_messages(reader)))
+        reading.start()
+        start = time.perf_counter()
+        # In batches, so the clients that do read keep up with the small limits. From a
+        # thread, because with backpressure the server stops reading from the sender
+        def send():
+            batch = encode_message("x" * CHECK_MESSAGE_SIZE) * 10
+            for _ in range(CHECK_MESSAGES // 10):
+                sender.sendall(batch)
+                time.sleep(0.01)
+        sending = threading.Thread(target=send)
+        sending.start()
+        time.sleep(stall)
+        stalled_count, closed, _ = count_messages(stalled)
+        sending.join()
+        reading.join()
+        count, _, last = got[0]
+        assert count == CHECK_MESSAGES, f"the reading client got {count} of {CHECK_MESSAGES}"
+        for sock in (sender, reader, stalled):
+            sock.close()
+        return stalled_count, closed, last - start
+    finally:
+        process.kill()
+        process.wait()
+
+
+def check_policies(kind):
+    count, closed, _ = check_policy(kind, "drop_oldest", stall=1.0)
+    assert not closed and 0 < count < CHECK_MESSAGES, (count, closed)
+    print(f"{kind} drop_oldest: the stalled client stays connected and got {count} of {CHECK_MESSAGES} messages")
+
+    count, closed, _ = check_policy(kind, "disconnect", stall=1.0)
+    assert closed and count < CHECK_MESSAGES, (count, closed)
+    print(f"{kind} disconnect: the stalled client was disconnected after {count} messages")
+
+    # Backpressure: the sender waits for a client that catches up within the timeout...
+    count, closed, delivered = check_policy(kind, "backpressure", stall=1.0, timeout=5.0)
+    assert not closed and count == CHECK_MESSAGES and delivered >= 1.0, (count, closed, delivered)
+    print(f"{kind} backpressure: the others had every message after {delivered:.1f}s, "
+          f"the stalled client got every message too")
+    # ...and disconnects one that does not
+    count, closed, delivered = check_policy(kind, "backpressure", stall=2.0, timeout=0.5)
+    assert closed and count < CHECK_MESSAGES and delivered < 2.0, (count, closed, delivered)
+    print(f"{kind} backpressure: the stalled client was disconnected, the others had every message "
+          f"after {delivered:.1f}s")
+
+
+async def run(n_receivers, n_messages, server_pid):
+    await wait_for_server()
+    await asyncio.sleep(0.2)
+    files_before = open_files(server_pid)
+
+    # The stalled client: tiny receive buffer and it never reads
+    stalled = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    stalled.connect((HOST, PORT))
+
+    connections = []
+    for batch_start in range(0, n_receivers, 100):
+        batch = [asyncio.open_connection(HOST, PORT) for _ in range(min(100, n_receivers - batch_start))]
+        connections.extend(await asyncio.gather(*batch))
+        while open_files(server_pid) < files_before + 1 + len(connections):
+            await asyncio.sleep(0.01)
+    await asyncio.sleep(0.5)
+
+    message = encode_message("x" * 3000)
+    received = 0
+    expected = 0
+    all_received = asyncio.Event()
+
+    async def receive(reader):
+        nonlocal received
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            received += len(data)
+            if received >= expected:
+                all_received.set()
+
+    receivers = [asyncio.ensure_future(receive(reader)) for reader, _ in connections[1:]]
+    sender = connections[0][1]
+
+    latencies = []
+    for i in range(n_messages):
+        expected = (i + 1) * len(message) * (len(connections) - 1)
+        all_received.clear()
+        start = time.perf_counter()
+        sender.write(message)
+        await asyncio.wait_for(all_received.wait(), timeout=60)
+        latencies.append(time.perf_counter() - start)
+
+    for task in receivers:
+        task.cancel()
+    for _, writer in connections:
+        writer.close()
+    stalled.close()
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], latencies[-1]
+
+
+if __name__ == "__main__":
+    n_receivers = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    n_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    here = os.path.dirname(os.path.abspath(__file__))
+    for kind in CHECK_SERVERS:
+        check_policies(kind)
+
+    for policy in POLICIES:
+        process = subprocess.Popen([sys.executable, "-c", CODE.format(host=HOST, port=PORT, policy=policy)],
+                                   cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            p50, p99, worst = asyncio.run(run(n_receivers, n_messages, process.pid))
+            print(f"{policy:<13} {n_receivers} receivers + 1 stalled: fan-out p50 {p50 * 1000:6.1f} ms, "
+                  f"p99 {p99 * 1000:7.1f} ms, max {worst * 1000:7.1f} ms")
+        finally:
+            process.kill()
+            process.wait()
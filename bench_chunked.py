@@ -0,0 +1,192 @@
+# bench_chunked.py
+# Checks and speed of the chunked transfer protocol (socket_ftp.send_file_chunked
+# and socket_server.receive_file_chunked):
+#
+# - received_files/report.pdf and a large random file arrive byte-identical
+# - a transfer cut off halfway is resumed by sending only the missing chunks,
+#   also after the server was restarted in between
+# - damaged chunks are refused and sent again
+# - offers with too small chunks, too many chunks or a too big file are
+#   refused, and an old-style upload named "XFER..." is still received
+#   while one named ".something" is refused
+# - the .part and .state files of abandoned uploads are removed once they are old
+# - throughput with 1 and several parallel connections
+#
+# Usage: python bench_chunked.py [size_in_MB]
+
+import io
+import os
+import sys
+import time
+import socket
+import filecmp
+import tempfile
+import threading
+import contextlib
+
+import socket_ftp
+import socket_server
+from protocol import FrameReader, HEADER, encode_message
+from transfer import TRANSFER_MAGIC, TRANSFER_VERSION, file_checksums, read_message
+
+PORT = 65435
+CHUNK_SIZE = 1024 * 1024
+
+
+class RunningServer:
+    def __init__(self, save_dir, **options):
+        self.save_dir = save_dir
+        self.options = options
+
+    def __enter__(self):
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=socket_server.start_server,
+                                       kwargs=dict(save_dir=self.save_dir, stop_event=self.stop, port=PORT,
+                                                   **self.options))
+        self.thread.start()
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', PORT)).close()
+                return self
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("Server did not start")
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+
+def send(path, **options):
+    # Without dedup, so files sent again are really transferred again
+    return socket_ftp.send_file_chunked(path, port=PORT, chunk_size=CHUNK_SIZE, dedup=False, **options)
+
+
+def send_some_chunks(path, n_chunks, damage=False):
+    # A sender that sends the first chunks and then drops the connection
+    file_hash, crcs, _ = file_checksums(path, CHUNK_SIZE)
+    offer = {"type": "offer", "name": os.path.basename(path), "size": os.path.getsize(path),
+             "chunk_size": CHUNK_SIZE, "hash": file_hash}
+    with socket.create_connection(('127.0.0.1', PORT)) as s, open(path, 'rb') as f:
+        s.sendall(TRANSFER_MAGIC + bytes([TRANSFER_VERSION]) + encode_message(offer))
+        reader = FrameReader()
+        assert read_message(s, reader)["type"] == "have"
+        for index in range(n_chunks):
+            data = bytearray(f.read(CHUNK_SIZE))
+            if damage:
+                data[0] ^= 0xFF
+            s.sendall(encode_message({"type": "chunk", "index": index, "crc": crcs[index]}) + HEADER.pack(len(data)))
+            s.sendall(data)
+        if damage:
+            s.sendall(encode_message({"type": "end"}))
+            return read_message(s, reader)
+    return None
+
+
+def offer_reply(**fields):
+    offer = dict({"type": "offer", "name": "refused.bin", "size": 1000, "chunk_size": CHUNK_SIZE, "hash": "0" * 64},
+                 **fields)
+    with socket.create_connection(('127.0.0.1', PORT)) as s:
+        s.sendall(TRANSFER_MAGIC + bytes([TRANSFER_VERSION]) + encode_message(offer))
+        return read_message(s, FrameReader())
+
+
+def main(size_mb):
+    socket_server.PORT = PORT
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()) as log:
+        save_dir = os.path.join(tmp, "received")
+        big = os.path.join(tmp, "big.bin")
+        with open(big, 'wb') as f:
+            f.write(os.urandom(size_mb * 1024 * 1024))
+        n_chunks = size_mb
+        results = []
+
+        with RunningServer(save_dir):
+            # Small file, smaller than one chunk
+            report = os.path.join("received_files", "report.pdf")
+            assert send(report) == os.path.getsize(report)
+            assert filecmp.cmp(report, os.path.join(save_dir, "report.pdf"), shallow=False)
+
+            # Empty file
+            empty = os.path.join(tmp, "empty.txt")
+            open(empty, 'wb').close()
+            assert send(empty) == 0 and os.path.getsize(os.path.join(save_dir, "empty.txt")) == 0
+
+            # Offers that would make the server allocate too much are refused
+            assert offer_reply(chunk_size=1)["reason"] == "Bad chunk size"
+            assert offer_reply(size=1 << 60)["reason"].startswith("File is bigger than the limit")
+            chunk_size = socket_server.MIN_CHUNK_SIZE
+            huge = {"type": "offer", "name": "huge.bin", "size": socket_server.MAX_CHUNKS * chunk_size + 1,
+                    "chunk_size": chunk_size, "hash": "0" * 64}
+            assert socket_server._check_offer(huge, max_file_size=None).startswith("Too many chunks")
+
+            # An old-style upload whose name starts like the chunked protocol
+            with socket.create_connection(('127.0.0.1', PORT)) as s:
+                s.sendall(b"XFER.txt\nold protocol")
+                s.shutdown(socket.SHUT_WR)
+                s.recv(1)
+            with open(os.path.join(save_dir, "XFER.txt"), 'rb') as f:
+                assert f.read() == b"old protocol"
+            with socket.create_connection(('127.0.0.1', PORT)) as s:
+                s.sendall(b"../.hidden.part\nold protocol")
+                s.shutdown(socket.SHUT_WR)
+                s.recv(1)
+            assert not os.path.exists(os.path.join(save_dir, ".hidden.part"))
+
+            # Abandoned uploads are removed once they are older than the limit, others are kept
+            stale, fresh = os.path.join(save_dir, ".stale.bin.0.part"), os.path.join(save_dir, ".fresh.bin.0.state")
+            for path in (stale, fresh):
+                open(path, 'wb').close()
+            old = time.time() - socket_server.PARTIAL_MAX_AGE - 60
+            os.utime(stale, (old, old))
+            assert socket_server.remove_abandoned_uploads(save_dir) == 1
+            assert not os.path.exists(stale) and os.path.exists(fresh)
+            os.remove(fresh)
+
+            # Cut off halfway, then resumed
+            send_some_chunks(big, n_chunks // 2)
+            time.sleep(0.2)
+            assert not os.path.exists(os.path.join(save_dir, "big.bin")), "incomplete file is visible"
+            sent = send(big)
+            assert sent == (n_chunks - n_chunks // 2) * CHUNK_SIZE, sent
+            assert filecmp.cmp(big, os.path.join(save_dir, "big.bin"), shallow=False)
+            results.append(f"resume after interruption sent {sent >> 20} of {size_mb} MB")
+
+            # Damaged chunks are refused
+            damaged = os.path.join(tmp, "damaged.bin")
+            with open(damaged, 'wb') as f:
+                f.write(os.urandom(4 * CHUNK_SIZE))
+            ack = send_some_chunks(damaged, 2, damage=True)
+            assert ack["bad"] == [0, 1] and ack["written"] == 0, ack
+            assert send(damaged) == 4 * CHUNK_SIZE
+            assert filecmp.cmp(damaged, os.path.join(save_dir, "damaged.bin"), shallow=False)
+
+            # Cut off, server restarted, then resumed
+            os.remove(os.path.join(save_dir, "big.bin"))
+            send_some_chunks(big, n_chunks // 4)
+            time.sleep(0.2)
+        with RunningServer(save_dir):
+            sent = send(big)
+            assert sent == (n_chunks - n_chunks // 4) * CHUNK_SIZE, sent
+            assert filecmp.cmp(big, os.path.join(save_dir, "big.bin"), shallow=False)
+            results.append(f"resume after server restart sent {sent >> 20} of {size_mb} MB")
+
+            # Throughput
+            for connections in (1, 2, 4, 8):
+                os.remove(os.path.join(save_dir, "big.bin"))
+                start = time.perf_counter()
+                send(big, connections=connections)
+                elapsed = time.perf_counter() - start
+                assert filecmp.cmp(big, os.path.join(save_dir, "big.bin"), shallow=False)
+                results.append(f"{connections} connection(s): {size_mb} MB in {elapsed:5.2f}s = "
+                               f"{size_mb / elapsed:7.1f} MB/s (including checksums)")
+
+        leftovers = [name for name in os.listdir(save_dir) if name.startswith('.') and name != '.store']
+        assert not leftovers, leftovers
+    for line in results:
+        print(line)
+    print("All checks passed.")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 256)
@@ -0,0 +1,103 @@
+# bench_dedup.py
+# Bytes on the wire and throughput of the chunked transfer protocol with
+# deduplication (content_store.py) and chunk compression:
+#
+# - the same file uploaded again under another name
+# - a new version of a file with one changed chunk
+# - a compressible corpus (log lines) without compression, with zlib and with lzma
+# - random data with compression on, which should be skipped
+# - a client that is not in dedup_hosts, which has to send everything
+#
+# Usage: python bench_dedup.py [size_in_MB]
+
+import io
+import os
+import sys
+import time
+import random
+import filecmp
+import tempfile
+import contextlib
+
+import socket_ftp
+import socket_server
+import transfer
+from bench_chunked import PORT, CHUNK_SIZE, RunningServer
+
+
+def send(path, **options):
+    start = time.perf_counter()
+    sent = socket_ftp.send_file_chunked(path, port=PORT, chunk_size=CHUNK_SIZE, **options)
+    return sent, time.perf_counter() - start
+
+
+def make_log_corpus(path, size):
+    rng = random.Random(1)
+    hosts = [f"10.0.{i}.{j}" for i in range(4) for j in range(1, 60)]
+    with open(path, 'w') as f:
+        written = 0
+        while written < size:
+            line = (f"2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:"
+                    f"{rng.randint(0, 59):02d} {rng.choice(hosts)} {rng.choice(['UP', 'UP', 'UP', 'DOWN'])} "
+                    f"latency={rng.uniform(0.1, 80):.3f}ms loss={rng.choice([0, 0, 0, 20, 100])}%\n")
+            written += f.write(line)
+
+
+def main(size_mb):
+    socket_server.PORT = PORT
+    size = size_mb * 1024 * 1024
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        save_dir = os.path.join(tmp, "received")
+        random_file = os.path.join(tmp, "artifact.bin")
+        with open(random_file, 'wb') as f:
+            f.write(os.urandom(size))
+        corpus = os.path.join(tmp, "monitor.log")
+        make_log_corpus(corpus, size)
+
+        def report(label, path, sent, elapsed):
+            saved = os.path.join(save_dir, os.path.basename(path))
+            assert filecmp.cmp(path, saved, shallow=False), label
+            results.append(f"{label:<34} {sent / 1e6:8.2f} MB on the wire "
+                           f"({100 * sent / os.path.getsize(path):5.1f}%), {size_mb / elapsed:7.1f} MB/s")
+
+        with RunningServer(save_dir):
+            report("first upload", random_file, *send(random_file))
+
+            copy = os.path.join(tmp, "artifact-copy.bin")
+            with open(random_file, 'rb') as src, open(copy, 'wb') as dst:
+                dst.write(src.read())
+            report("same content, other name", copy, *send(copy))
+
+            changed = os.path.join(tmp, "artifact-v2.bin")
+            with open(random_file, 'rb') as src, open(changed, 'wb') as dst:
+                data = bytearray(src.read())
+                data[len(data) // 2] ^= 0xFF
+                dst.write(data)
+            report("one chunk changed", changed, *send(changed))
+
+            report("same content, dedup off", copy, *send(copy, dedup=False))
+
+            for compression, level in ((None, None), ("zlib", 1), ("zlib", 6), ("lzma", 1)):
+                if compression is not None and compression not in transfer.COMPRESSORS:
+                    continue
+                label = f"log corpus, {compression or 'no'} compression" + (f" {level}" if level else "")
+                report(label, corpus, *send(corpus, dedup=False, compression=compression, compression_level=level))
+
+            report("random data, zlib (skipped)", random_file,
+                   *send(random_file, dedup=False, compression="zlib"))
+
+        # Knowing the hash of a stored file must not be enough to get a copy of it
+        with RunningServer(save_dir, dedup_hosts=()):
+            untrusted = os.path.join(tmp, "artifact-untrusted.bin")
+            with open(random_file, 'rb') as src, open(untrusted, 'wb') as dst:
+                dst.write(src.read())
+            sent, elapsed = send(untrusted)
+            assert sent == size, sent
+            report("same content, untrusted client", untrusted, sent, elapsed)
+    for line in results:
+        print(line)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
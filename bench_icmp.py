@@ -0,0 +1,45 @@
+# bench_icmp.py
+# Measures how many probes per second the in-process ICMP prober does against
+# loopback, compared with starting the ping command for every probe.
+#
+# Usage: python bench_icmp.py [number_of_probes]
+# Needs root/CAP_NET_RAW, or a group listed in net.ipv4.ping_group_range.
+
+import sys
+import time
+import shutil
+import logging
+
+import icmp
+import ping
+
+
+def loopback_targets(n):
+    # Every 127.x.y.z address answers on Linux, so each probe can use its own target
+    return [f"127.{(i >> 16) & 0xFF}.{(i >> 8) & 0xFF}.{i & 0xFF or 1}" for i in range(1, n + 1)]
+
+
+if __name__ == "__main__":
+    n_probes = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    logging.getLogger().setLevel(logging.ERROR)
+
+    targets = loopback_targets(n_probes)
+    with icmp.IcmpProber() as prober:
+        print(f"ICMP socket: {'raw' if prober.is_raw else 'datagram'}")
+        start = time.perf_counter()
+        results = prober.ping_many(targets, timeout=1)
+        elapsed = time.perf_counter() - start
+    answered = sum(1 for rtts, _ in results.values() if rtts[0] is not None)
+    print(f"In-process ICMP: {len(targets)} probes, {answered} answered, "
+          f"{len(targets) / elapsed:,.0f} probes/s")
+
+    if shutil.which('ping'):
+        ping.PING_BACKEND = 'subprocess'
+        sample = targets[:200]
+        start = time.perf_counter()
+        for host in sample:
+            ping.ping_host(host)
+        elapsed = time.perf_counter() - start
+        print(f"ping command:    {len(sample)} probes, {len(sample) / elapsed:,.0f} probes/s")
+    else:
+        print("ping command not found, skipping the subprocess comparison.")
@@ -0,0 +1,90 @@
+# bench_ipaddr.py
+# Addresses per second of ipaddr.is_private_ip (one ipaddress object per call)
+# compared with the batch IpClassifier, on a mix of public and private IPv4
+# and IPv6 addresses with a few invalid strings. Both must agree, also on
+# the edge cases in SPECIAL_ADDRESSES. Also checks the built-in table used
+# where the ipaddress module does not expose its private networks.
+#
+# Usage: python bench_ipaddr.py [number_of_addresses]
+
+import sys
+import time
+import random
+import socket
+import ipaddress
+
+import ipaddr
+
+# Exceptions inside private ranges (in newer Pythons), ranges next to them and IPv4-mapped addresses
+SPECIAL_ADDRESSES = ["192.0.0.8", "192.0.0.9", "192.0.0.10", "192.0.0.11", "2001:1::1", "2001:1::3", "2001:3::1",
+                     "2001:4::1", "2001:20::1", "2001:2f:ffff::1", "64:ff9b:1::1", "64:ff9b::1",
+                     "::ffff:8.8.8.8", "::ffff:10.0.0.1", "::ffff:192.0.0.9", "::fffe:ffff:ffff", "::1:0:0:0"]
+
+
+def make_addresses(n, rng):
+    private_prefixes = [(10 << 24, 8), (172 << 24 | 16 << 16, 12), (192 << 24 | 168 << 16, 16)]
+    addresses = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.5:
+            addresses.append(socket.inet_ntoa(rng.getrandbits(32).to_bytes(4, 'big')))
+        elif kind < 0.85:
+            base, bits = rng.choice(private_prefixes)
+            value = base | rng.getrandbits(32 - bits)
+            addresses.append(socket.inet_ntoa(value.to_bytes(4, 'big')))
+        elif kind < 0.99:
+            prefix = rng.choice([0xfd00, 0x2a00, 0xfe80, 0x2001])
+            value = prefix << 112 | rng.getrandbits(112)
+            addresses.append(socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, 'big')))
+        else:
+            addresses.append(rng.choice(["not-an-ip", "256.1.1.1", "10.0.0", "fe80::1::2"]))
+    return addresses
+
+
+def check_fallback_table():
+    # Networks built from ipaddr's own table mark the same SPECIAL_ADDRESSES private as the table says
+    tables = [([ipaddress.ip_network(cidr) for cidr in networks], [ipaddress.ip_network(cidr) for cidr in exceptions])
+              for networks, exceptions in ipaddr._IS_PRIVATE_TABLES]
+    classifier = ipaddr.IpClassifier(include_defaults=False)
+    classifier.add_networks(ipaddr._private_networks(tables), ipaddr.PRIVATE)
+    for text in SPECIAL_ADDRESSES:
+        address = ipaddress.ip_address(text)
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        networks, exceptions = tables[address.version == 6]
+        private = any(address in network for network in networks) and not any(address in e for e in exceptions)
+        assert (classifier.classify(text) == ipaddr.PRIVATE) == private, text
+
+
+def timed(label, n, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:7.2f}s {n / elapsed / 1e6:7.2f} M addresses/s")
+    return result
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    rng = random.Random(1)
+    check_fallback_table()
+    print(f"Generating {n} addresses...")
+    addresses = make_addresses(n, rng) + SPECIAL_ADDRESSES
+
+    # Site networks and a blocklist on top of the default ranges
+    classifier = ipaddr.IpClassifier()
+    classifier.add_networks(["10.20.0.0/16", "10.30.0.0/16", "fd00:1::/32"], "site")
+    classifier.add_networks([str(ipaddress.IPv4Network((rng.getrandbits(32) >> 8 << 8, 24)))
+                             for _ in range(10000)], "blocked")
+
+    expected = timed("is_private_ip per call", n, lambda: [ipaddr.is_private_ip(a) for a in addresses])
+    result = timed("are_private_ips (batch)", n, lambda: ipaddr.are_private_ips(addresses))
+    assert result == expected, "batch result differs from is_private_ip"
+    timed("IpClassifier.classify_many (+10k nets)", n, lambda: classifier.classify_many(addresses))
+
+    ipv4 = [a for a in addresses if '.' in a and ':' not in a and ipaddr.address_to_int(a)[0] == 4]
+    packed = b''.join(socket.inet_aton(a) for a in ipv4)
+    codes = timed(f"classify_packed ({len(ipv4)} IPv4)", len(ipv4), lambda: classifier.classify_packed(packed))
+    labels = classifier.classify_many(ipv4)
+    assert [classifier.labels[code] for code in codes] == labels
+    print("Batch results match is_private_ip.")
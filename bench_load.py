@@ -0,0 +1,44 @@
+# bench_load.py
+# Capacity of server.py measured with the load test of client.py.
+#
+# For the thread-per-client Server and the asyncio AsyncServer it runs the
+# load test twice: as fast as possible (throughput), then at half that rate
+# (latency at a load the server keeps up with).
+#
+# Usage: python bench_load.py [connections] [messages_per_sender] [senders]
+
+import os
+import sys
+import asyncio
+import subprocess
+
+import client
+from bench_server import HOST, PORT, SERVERS, wait_for_server
+
+
+def run(connections, messages, senders):
+    asyncio.run(wait_for_server())
+    saturated = client.run_load_test(HOST, PORT, connections=connections, senders=senders, messages=messages)
+    assert saturated.lost == 0, saturated.summary()
+    rate = saturated.sent / saturated.elapsed / 2 / senders # Per sender
+    paced = client.run_load_test(HOST, PORT, connections=connections, senders=senders, messages=messages,
+                                 rate=rate)
+    return saturated, paced, rate * senders
+
+
+if __name__ == "__main__":
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    senders = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    for name, code in SERVERS.items():
+        process = subprocess.Popen([sys.executable, "-c", code.format(host=HOST, port=PORT)], cwd=here,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            saturated, paced, rate = run(connections, messages, senders)
+            print(f"{name}, as fast as possible:\n{saturated.summary()}")
+            print(f"{name}, {rate:,.0f} messages/s:\n{paced.summary()}\n")
+        finally:
+            process.kill()
+            process.wait()
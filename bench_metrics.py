@@ -0,0 +1,252 @@
+# bench_metrics.py
+# Checks of metrics.py and what the instrumentation costs.
+#
+# The hot paths that record metrics (broadcast fan-out in server.Server, the
+# receive loop of socket_server.receive_file and ping sweeps) are timed as
+# they are and with their metrics swapped for metrics.NullMetric, best of
+# several alternating runs.
+#
+# Usage: python bench_metrics.py [upload_size_in_MB]
+
+import io
+import os
+import sys
+import time
+import socket
+import tempfile
+import logging
+import threading
+import contextlib
+import urllib.request
+
+import metrics
+import ping
+import server
+import socket_server
+from bench_icmp import loopback_targets
+
+ROUNDS = 7
+
+
+def check_metrics():
+    registry = metrics.Registry()
+    requests = registry.counter("requests_total", "Requests", method="get")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    clients = registry.gauge("clients", "Clients")
+    assert registry.counter("requests_total", "Requests", method="get") is requests
+
+    # Per-thread cells add up to the exact total
+    def work():
+        for _ in range(100000):
+            requests.inc()
+            latency.observe(0.5)
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Threads that have ended do not keep a cell each
+    def short_work():
+        requests.inc()
+        latency.observe(0.5)
+    for _ in range(50):
+        threads = [threading.Thread(target=short_work) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert requests.value == 401000, requests.value
+    assert len(requests._cells.cells) <= 2 * metrics.COMPACT_CELLS, len(requests._cells.cells)
+    assert len(latency._cells.cells) <= 2 * metrics.COMPACT_CELLS, len(latency._cells.cells)
+    latency.observe(0.1) # Bounds are inclusive
+    latency.observe(7)
+    clients.inc(3)
+    clients.dec()
+    assert requests.value == 401000 and clients.value == 2
+
+    text = registry.render()
+    for line in ('# TYPE requests_total counter', 'requests_total{method="get"} 401000',
+                 'latency_seconds_bucket{le="0.1"} 1', 'latency_seconds_bucket{le="1.0"} 401001',
+                 'latency_seconds_bucket{le="+Inf"} 401002', 'latency_seconds_count 401002',
+                 'latency_seconds_sum 200507.1', 'clients 2'):
+        assert line in text.splitlines(), (line, text)
+    try:
+        registry.gauge("requests_total", "Requests", method="get")
+        raise AssertionError("a counter was returned as a gauge")
+    except ValueError:
+        pass
+
+    # A gauge function that fails does not break the other metrics
+    registry.gauge("broken", "Broken", function=lambda: 1 / 0)
+    assert 'clients 2' in registry.render()
+
+    # Served over HTTP and written to a snapshot file
+    http_server = metrics.start_http_server(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{http_server.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert 'clients 2' in response.read().decode()
+        try:
+            urllib.request.urlopen(url + "/profile")
+            raise AssertionError("/profile is served while the profiler is off")
+        except urllib.error.HTTPError as e:
+            assert e.code == 404
+
+        # The profiler sees where a busy thread spends its time
+        profiler = metrics.start_profiler(interval=0.005)
+        stop = threading.Event()
+
+        def busy_loop():
+            while not stop.is_set():
+                sum(range(1000))
+        thread = threading.Thread(target=busy_loop)
+        thread.start()
+        time.sleep(0.3)
+        with urllib.request.urlopen(url + "/profile") as response:
+            assert "busy_loop (bench_metrics.py:" in response.read().decode()
+        stop.set()
+        thread.join()
+        assert metrics.stop_profiler() is profiler and profiler.samples > 10
+    finally:
+        http_server.shutdown()
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "metrics.prom")
+        stop_event = metrics.start_snapshots(filename, interval=0.05, registry=registry)
+        time.sleep(0.2)
+        stop_event.set()
+        with open(filename) as f:
+            assert 'clients 2' in f.read()
+        time.sleep(0.1)
+        assert os.listdir(directory) == ["metrics.prom"] # No temporary files left
+    print("metrics checks passed")
+
+
+def best_of(function, disabled, instrumented, rounds=ROUNDS):
+    """
+    Times function() with the instrumentation and with it swapped for
+    NullMetric, alternating, and returns the best time of each.
+    """
+    times = {"instrumented": [], "disabled": []}
+    for _ in range(rounds):
+        for mode, replacements in (("instrumented", instrumented), ("disabled", disabled)):
+            for module, name, value in replacements:
+                setattr(module, name, value)
+            start = time.perf_counter()
+            function()
+            times[mode].append(time.perf_counter() - start)
+    for module, name, value in instrumented:
+        setattr(module, name, value)
+    return min(times["instrumented"]), min(times["disabled"])
+
+
+def swap(module, *names):
+    # (disabled, instrumented) replacement lists for module-level metrics
+    null = metrics.NullMetric()
+    disabled = []
+    for name in names:
+        value = getattr(module, name)
+        disabled.append((module, name, {key: null for key in value} if isinstance(value, dict) else null))
+    return disabled, [(module, name, getattr(module, name)) for name in names]
+
+
+def report(label, unit, count, instrumented, disabled):
+    overhead = (instrumented / disabled - 1) * 100
+    print(f"{label:<30} {count / instrumented:>12,.0f} {unit}/s instrumented, "
+          f"{count / disabled:>12,.0f} disabled, overhead {overhead:+.1f}%")
+
+
+class FakeOutbox:
+    def __init__(self, client_id):
+        self.client_id = client_id
+
+    def put(self, data):
+        return True
+
+
+def bench_broadcast(n_messages=2000, n_clients=50, rounds=50):
+    # Many short rounds: the best of them is hit by the least noise from the rest of the machine
+    chat = server.Server(server.HOST, 0)
+    for number in range(n_clients):
+        chat.add_client(object(), ("127.0.0.1", number), FakeOutbox(number))
+
+    def run():
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for i in range(n_messages):
+                chat.broadcast_message({"text": "hello", "n": i}, sender_conn=None)
+
+    instrumented, disabled = best_of(run, *swap(server, "MESSAGES_FORWARDED", "BROADCAST_SECONDS"), rounds=rounds)
+    report(f"broadcast to {n_clients} clients", "messages", n_messages, instrumented, disabled)
+
+
+def bench_receive(size_mb):
+    data = os.urandom(1024 * 1024)
+
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            receiver, sender = socket.socketpair()
+
+            def send():
+                with sender:
+                    sender.sendall(b"upload.bin\n")
+                    for _ in range(size_mb):
+                        sender.sendall(data)
+            thread = threading.Thread(target=send)
+            thread.start()
+            with receiver, contextlib.redirect_stdout(io.StringIO()):
+                socket_server.receive_file(receiver, "bench", save_dir=directory)
+            thread.join()
+
+    instrumented, disabled = best_of(run, *swap(socket_server, "UPLOAD_BYTES"))
+    report("receive_file loop", "MB", size_mb, instrumented, disabled)
+
+
+def bench_sweep(n_hosts=2000):
+    # Loopback addresses over the in-process ICMP prober: the fastest sweep there is
+    targets = list(dict.fromkeys(loopback_targets(n_hosts)))
+    logging.disable(logging.WARNING)
+
+    results = {}
+
+    def run():
+        results.update(ping.sweep_hosts(targets, timeout=1))
+        assert all(result.success for result in results.values())
+
+    def record():
+        for _ in range(20):
+            for result in results.values():
+                ping._record_result(result)
+
+    replacements = swap(ping, "PROBES", "RTT_SECONDS", "SWEEP_SECONDS")
+    try:
+        instrumented, disabled = best_of(run, *replacements)
+    finally:
+        logging.disable(logging.NOTSET)
+    report(f"sweep of {len(targets)} hosts", "probes", len(targets), instrumented, disabled)
+    # The sweep itself varies by more than the metrics cost, so time the recording on its own too
+    recording, nothing = best_of(record, *replacements)
+    cost = (recording - nothing) / (20 * len(results))
+    print(f"{'':<30} recording a result takes {cost * 1e6:.2f} us, "
+          f"{cost / (disabled / len(targets)) * 100:.1f}% of the time per probe")
+
+
+def bench_primitives(n=1000000):
+    counter = metrics.Counter("c", "", {})
+    histogram = metrics.Histogram("h", "", {})
+    for label, function in (("Counter.inc", counter.inc), ("Histogram.observe", lambda: histogram.observe(0.003)),
+                            ("NullMetric.inc", metrics.NullMetric().inc)):
+        start = time.perf_counter()
+        for _ in range(n):
+            function()
+        print(f"{label:<30} {(time.perf_counter() - start) / n * 1e9:>8.0f} ns per call")
+
+
+if __name__ == "__main__":
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    check_metrics()
+    bench_primitives()
+    bench_broadcast()
+    bench_receive(size_mb)
+    bench_sweep()
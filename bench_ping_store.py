@@ -0,0 +1,89 @@
+# bench_ping_store.py
+# Loads a few million samples for one host into PingStore and times range,
+# rollup and percentile queries against re-reading a CSV log, then loads
+# history that comes in out of order (like an imported CSV file).
+#
+# Usage: python bench_ping_store.py [number_of_samples]
+
+import os
+import sys
+import csv
+import time
+import random
+import logging
+import tempfile
+
+from ping_store import PingStore, LOST
+
+HOST = "10.0.0.1"
+START = 1_700_000_000
+
+
+def timed(label, function, *args, **kwargs):
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    print(f"{label:<42} {(time.perf_counter() - start) * 1000:>9.1f} ms")
+    return value
+
+
+def csv_p99(filename, start, end):
+    # What answering the question took before: read and parse the whole log
+    latencies = []
+    with open(filename, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            timestamp = float(row[0])
+            if row[1] == HOST and start <= timestamp < end and row[3] != "N/A":
+                latencies.append(float(row[3]))
+    latencies.sort()
+    return latencies[int(0.99 * len(latencies))]
+
+
+if __name__ == "__main__":
+    n_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    logging.getLogger().setLevel(logging.ERROR)
+    random.seed(1)
+
+    store = PingStore()
+    step = 86400 * 7 / n_samples # One week of history
+    start = time.perf_counter()
+    for i in range(n_samples):
+        latency = LOST if i % 200 == 0 else random.lognormvariate(2.5, 0.4)
+        store.add_sample(HOST, START + i * step, latency, 100.0 if latency == LOST else 0.0)
+    elapsed = time.perf_counter() - start
+    print(f"Ingest: {n_samples:,} samples, {n_samples / elapsed:,.0f} samples/s")
+
+    day_start = START + 86400 * 3
+    day_end = day_start + 86400
+    timestamps, _, _ = timed("range() last 24h", store.range, HOST, day_start, day_end)
+    print(f"  {len(timestamps):,} samples in range")
+    timed("percentile(99) last 24h", store.percentile, HOST, 99, day_start, day_end)
+    timed("percentile(99) last hour (exact)", store.percentile, HOST, 99, day_end - 3600, day_end)
+    timed("rollup() 1h buckets over 24h", store.rollup, HOST, 3600, day_start, day_end)
+    timed("rollup() 1m buckets over 1h", store.rollup, HOST, 60, day_end - 3600, day_end)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, "ping_results.csv")
+        timestamps, latencies, _ = store.range(HOST)
+        with open(log, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["Timestamp", "Host", "Status", "Latency (ms)"])
+            for timestamp, latency in zip(timestamps, latencies):
+                writer.writerow([timestamp, HOST, "Success", "N/A" if latency == LOST else f"{latency:.3f}"])
+        timed("CSV re-read p99 last 24h (old way)", csv_p99, log, day_start, day_end)
+
+    # Out of order: every sample is older than the newest one stored
+    n_unsorted = min(n_samples, 500_000)
+    samples = [(START + i * step, 10.0 + i % 7, 0.0) for i in range(n_unsorted)]
+    shuffled = samples[:]
+    random.shuffle(shuffled)
+    store = PingStore()
+
+    def load_unsorted():
+        for sample in shuffled:
+            store.add_sample(HOST, *sample)
+        return store.range(HOST)
+    timestamps, latencies, _ = timed(f"Unsorted ingest of {n_unsorted:,} + range()", load_unsorted)
+    assert list(timestamps) == [sample[0] for sample in samples]
+    assert list(latencies) == [sample[1] for sample in samples]
@@ -0,0 +1,121 @@
+# bench_protocol.py
+# Fuzz checks for FrameReader (frames split and merged at random points)
+# and throughput of framing + BinaryCodec compared with the old
+# pickle-per-recv() approach, for small and large messages.
+#
+# Usage: python bench_protocol.py
+
+import os
+import time
+import pickle
+import random
+import socket
+
+from protocol import BinaryCodec, FrameReader, ProtocolError, encode_message
+
+codec = BinaryCodec()
+
+
+def random_message(rng, depth=0):
+    kind = rng.randrange(8 if depth < 3 else 6)
+    if kind == 0:
+        return None
+    if kind == 1:
+        return rng.random() < 0.5
+    if kind == 2:
+        return rng.randrange(-2 ** 70, 2 ** 70)
+    if kind == 3:
+        return rng.random() * 1e6
+    if kind == 4:
+        return "".join(chr(rng.randrange(32, 0x3000)) for _ in range(rng.randrange(50)))
+    if kind == 5:
+        return os.urandom(rng.randrange(5000))
+    if kind == 6:
+        return [random_message(rng, depth + 1) for _ in range(rng.randrange(5))]
+    return {f"k{i}": random_message(rng, depth + 1) for i in range(rng.randrange(5))}
+
+
+def fuzz_framing(rounds=200):
+    """
+    Sends random messages in one stream cut at random places and checks
+    every message comes out once, unchanged and in order.
+    """
+    rng = random.Random(4)
+    for _ in range(rounds):
+        messages = [random_message(rng) for _ in range(rng.randrange(1, 30))]
+        stream = b"".join(encode_message(message) for message in messages)
+        reader = FrameReader(initial_size=rng.choice([16, 1024, 65536]))
+        decoded = []
+        position = 0
+        while position < len(stream):
+            size = rng.choice([1, 2, 3, 5, 100, 4096, 100000])
+            reader.feed(stream[position:position + size])
+            position += size
+            decoded.extend(codec.decode(payload) for payload in reader.frames())
+        assert decoded == messages, "framing fuzz failed"
+
+    # Garbage must raise ProtocolError, never anything else
+    for _ in range(5000):
+        garbage = os.urandom(rng.randrange(1, 40))
+        try:
+            codec.decode(garbage)
+        except ProtocolError:
+            pass
+    print(f"Fuzz: {rounds} random streams and 5000 garbage payloads OK")
+
+
+def socket_fuzz():
+    """
+    The same through a real socket pair, reading with recv_into().
+    """
+    rng = random.Random(5)
+    left, right = socket.socketpair()
+    messages = [random_message(rng) for _ in range(300)]
+    stream = b"".join(encode_message(message) for message in messages)
+    reader = FrameReader()
+    decoded = []
+    position = 0
+    while len(decoded) < len(messages):
+        if position < len(stream):
+            size = rng.randrange(1, 20000)
+            left.sendall(stream[position:position + size])
+            position += size
+        reader.recv_into(right)
+        decoded.extend(codec.decode(payload) for payload in reader.frames())
+    assert decoded == messages, "socket fuzz failed"
+    left.close()
+    right.close()
+    print("Fuzz: 300 messages through a socket pair OK")
+
+
+def throughput(label, message, count):
+    stream = b"".join(encode_message(message) for _ in range(count))
+    start = time.perf_counter()
+    for _ in range(count):
+        encode_message(message)
+    encode_time = time.perf_counter() - start
+
+    reader = FrameReader()
+    start = time.perf_counter()
+    for position in range(0, len(stream), 65536):
+        reader.feed(stream[position:position + 65536])
+        for payload in reader.frames():
+            codec.decode(payload)
+    decode_time = time.perf_counter() - start
+
+    pickled = pickle.dumps(message)
+    start = time.perf_counter()
+    for _ in range(count):
+        pickle.loads(pickle.dumps(message))
+    pickle_time = time.perf_counter() - start
+    print(f"{label:<24} frame+encode {count / encode_time:>10,.0f} msg/s, "
+          f"parse+decode {count / decode_time:>10,.0f} msg/s ({len(stream) / decode_time / 1e6:,.0f} MB/s), "
+          f"pickle round trip {count / pickle_time:>10,.0f} msg/s ({len(pickled)} bytes)")
+
+
+if __name__ == "__main__":
+    fuzz_framing()
+    socket_fuzz()
+    throughput("small (40 byte str)", "hello everybody, how is it going today?", 200000)
+    throughput("chat dict", {"user": "alice", "room": "general", "text": "hi " * 20, "seq": 42}, 100000)
+    throughput("large (1 MB bytes)", os.urandom(1024 * 1024), 200)
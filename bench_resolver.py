@@ -0,0 +1,167 @@
+# bench_resolver.py
+# Checks of resolver.ResolverCache and of the monitor sweeps that use it.
+# A stub resolver replaces DNS, so this runs without network access; the
+# sweeps ping 127.0.0.x addresses.
+#
+# Usage: python bench_resolver.py
+
+import time
+import logging
+import threading
+
+import ping
+from result_sink import result_to_row
+from resolver import ResolverCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubResolver:
+    """
+    Answers from a dict: name -> (address, ttl). Names that are missing fail.
+    """
+
+    def __init__(self, answers, delay=0.0):
+        self.answers = dict(answers)
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, host):
+        with self.lock:
+            self.calls.append(host)
+        if self.delay:
+            time.sleep(self.delay)
+        if host not in self.answers:
+            raise OSError(f"[stub] unknown name {host}")
+        address, ttl = self.answers[host]
+        return [address], ttl
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def check_cache():
+    clock = FakeClock()
+    stub = StubResolver({"a.test": ("127.0.0.2", 100), "b.test": ("127.0.0.3", None)})
+    cache = ResolverCache(resolve=stub, ttl=50, negative_ttl=10, refresh_ahead=0.8, clock=clock)
+
+    # Literal addresses are never looked up
+    assert cache.resolve_many(["127.0.0.1", "::1"]) == {"127.0.0.1": ("127.0.0.1", None), "::1": ("::1", None)}
+    assert stub.calls == []
+
+    # Misses are resolved, then answered from the cache
+    assert cache.resolve_many(["a.test", "b.test"]) == {"a.test": ("127.0.0.2", None), "b.test": ("127.0.0.3", None)}
+    assert sorted(stub.calls) == ["a.test", "b.test"]
+    cache.resolve_many(["a.test", "b.test"])
+    assert len(stub.calls) == 2 and cache.stats.hits == 2
+
+    # After 80% of the TTL the cached address is still returned, but refreshed in the background
+    stub.answers["a.test"] = ("127.0.0.4", 100)
+    clock.now += 81
+    assert cache.lookup("a.test") == ("127.0.0.2", None)
+    wait_for(lambda: stub.calls.count("a.test") == 2)
+    wait_for(lambda: cache.lookup("a.test") == ("127.0.0.4", None))
+    assert cache.stats.refreshes >= 1
+    # b.test had no TTL from the resolver, so the default of 50s applies: expired by now
+    calls = len(stub.calls)
+    cache.lookup("b.test")
+    assert cache.stats.misses == 3 and len(stub.calls) >= calls + 1
+
+    # A failed refresh keeps the old address until it expires
+    del stub.answers["a.test"]
+    clock.now += 81
+    assert cache.lookup("a.test") == ("127.0.0.4", None)
+    wait_for(lambda: cache.failed_hosts().get("a.test") == 1)
+    assert cache.lookup("a.test") == ("127.0.0.4", None)
+    clock.now += 20
+    address, error = cache.lookup("a.test")
+    assert address is None and "unknown name" in error
+
+    # Failures are cached for negative_ttl and counted separately
+    calls = stub.calls.count("nope.test")
+    assert cache.lookup("nope.test")[0] is None
+    assert cache.lookup("nope.test")[0] is None
+    assert stub.calls.count("nope.test") == calls + 1
+    clock.now += 11
+    cache.lookup("nope.test")
+    assert stub.calls.count("nope.test") == calls + 2
+    assert cache.failed_hosts()["nope.test"] == 2
+    cache.close()
+    print(f"cache checks passed: {cache.stats}")
+
+
+def check_timeout():
+    stub = StubResolver({"slow.test": ("127.0.0.5", 60)}, delay=0.3)
+    cache = ResolverCache(resolve=stub, timeout=0.05)
+    address, error = cache.lookup("slow.test")
+    assert address is None and "longer than" in error and cache.stats.timeouts == 1
+    # The answer is cached as soon as it arrives
+    wait_for(lambda: cache.lookup("slow.test") == ("127.0.0.5", None))
+    assert stub.calls == ["slow.test"]
+    cache.close()
+    print("timeout checks passed")
+
+
+def check_eviction():
+    stub = StubResolver({f"host{i}.test": ("127.0.0.2", 60) for i in range(5)})
+    cache = ResolverCache(resolve=stub, max_entries=3)
+    cache.resolve_many(["host0.test", "host1.test", "host2.test"])
+    cache.lookup("host0.test") # Now host1.test is the least recently used
+    cache.resolve_many(["host3.test", "host4.test"])
+    assert list(cache.entries) == ["host0.test", "host3.test", "host4.test"], list(cache.entries)
+    assert cache.stats.evictions == 2
+    cache.lookup("host1.test")
+    assert stub.calls.count("host1.test") == 2
+    cache.close()
+
+    # close() cancels lookups that are still queued
+    stub = StubResolver({f"host{i}.test": ("127.0.0.2", 60) for i in range(10)}, delay=0.2)
+    cache = ResolverCache(resolve=stub, max_workers=1, timeout=0.01)
+    cache.resolve_many([f"host{i}.test" for i in range(10)])
+    cache.close()
+    time.sleep(0.5)
+    assert len(stub.calls) == 1, stub.calls
+    print("eviction checks passed")
+
+
+def check_sweep():
+    stub = StubResolver({f"host{i}.test": (f"127.0.0.{i % 5 + 1}", 300) for i in range(100)}, delay=0.05)
+    cache = ResolverCache(resolve=stub, max_workers=8, timeout=5)
+    hosts = [f"host{i}.test" for i in range(100)] + ["missing.test", "127.0.0.1"]
+
+    start = time.perf_counter()
+    results = ping.sweep_hosts(hosts, timeout=1, resolver=cache)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    results = ping.sweep_hosts(hosts, timeout=1, resolver=cache)
+    second = time.perf_counter() - start
+
+    assert len(stub.calls) == 101, len(stub.calls) # Every name resolved exactly once
+    assert all(results[f"host{i}.test"].success for i in range(100))
+    assert results["host7.test"].address == "127.0.0.3"
+    missing = results["missing.test"]
+    assert not missing.success and not missing.resolved and "unknown name" in missing.error
+    assert result_to_row(missing)[2] == "Unresolved"
+    assert results["127.0.0.1"].success and results["127.0.0.1"].resolved
+    cache.close()
+    print(f"sweep checks passed: first sweep {first:.2f}s (101 lookups of 50 ms), "
+          f"second sweep {second:.2f}s (all cached)")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.ERROR)
+    check_cache()
+    check_timeout()
+    check_eviction()
+    check_sweep()
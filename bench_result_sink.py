@@ -0,0 +1,74 @@
+# bench_result_sink.py
+# Rows per second written by log_result_to_csv (open/write/close per row)
+# compared with the batched CsvResultSink, after a check that the sink keeps
+# writing when the file cannot be reopened for a while after a rotation.
+#
+# Usage: python bench_result_sink.py [number_of_rows]
+
+import os
+import sys
+import time
+import logging
+import tempfile
+
+import ping
+from ping_result import PingResult
+from result_sink import CsvResultSink
+
+
+def make_results(n):
+    return [PingResult.from_rtts(f"10.0.{(i >> 8) & 0xFF}.{i & 0xFF}", [0.5 + i % 7, None if i % 11 == 0 else 0.7])
+            for i in range(n)]
+
+
+def check_rotation_failure(tmp):
+    filename = os.path.join(tmp, "rotate.csv")
+    results = make_results(10)
+    sink = CsvResultSink(filename, batch_size=1, flush_interval=0.01, max_bytes=1)
+    real_open, failures = sink._open, [2] # The reopen after the rotation and the retry of the next batch fail
+
+    def failing_open():
+        if failures[0]:
+            failures[0] -= 1
+            raise OSError("disk not ready")
+        real_open()
+    sink._open = failing_open
+    logging.disable(logging.ERROR)
+    for result in results[:3]:
+        sink.write(result)
+        time.sleep(0.05)
+    sink._open = real_open
+    logging.disable(logging.NOTSET)
+    sink.write(results[3])
+    sink.close()
+    assert sink.written == 3 and sink.dropped == 1, (sink.written, sink.dropped)
+    with open(filename + ".1") as f: # Every batch was rotated out
+        assert results[3].host in f.read()
+    print("rotation checks passed")
+
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logging.getLogger().setLevel(logging.ERROR)
+    results = make_results(n_rows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        check_rotation_failure(tmp)
+        old_file = os.path.join(tmp, "old.csv")
+        sample = results[:min(n_rows, 20000)]
+        start = time.perf_counter()
+        for result in sample:
+            ping.log_result_to_csv(result, filename=old_file)
+        elapsed = time.perf_counter() - start
+        print(f"log_result_to_csv:               {len(sample) / elapsed:>10,.0f} rows/s")
+
+        for include_raw_output in (True, False):
+            new_file = os.path.join(tmp, f"new_{include_raw_output}.csv")
+            start = time.perf_counter()
+            with CsvResultSink(new_file, include_raw_output=include_raw_output) as sink:
+                for result in results:
+                    sink.write(result)
+            elapsed = time.perf_counter() - start
+            label = "CsvResultSink" + ("" if include_raw_output else " (no raw output)")
+            print(f"{label + ':':<33} {n_rows / elapsed:>10,.0f} rows/s, "
+                  f"{os.path.getsize(new_file) / n_rows:.0f} bytes/row, {sink.dropped} dropped")
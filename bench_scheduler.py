@@ -0,0 +1,67 @@
+# bench_scheduler.py
+# Checks how evenly HostScheduler spreads 100, 1,000 and 10,000 hosts (or the
+# number given) over a 60 second interval (simulated clock), also after some
+# hosts were replaced, and measures the scheduling lag of a real run.
+#
+# Usage: python bench_scheduler.py [number_of_hosts]
+
+import sys
+import threading
+
+from ping_scheduler import HostScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def check_spread(n_hosts, interval=60):
+    clock = FakeClock()
+    scheduler = HostScheduler(interval=interval, clock=clock)
+    hosts = [f"10.{i >> 16 & 0xFF}.{i >> 8 & 0xFF}.{i & 0xFF}" for i in range(n_hosts)]
+    for host in hosts:
+        scheduler.add_host(host)
+    # Replace every third host: the new ones take over the free slots
+    for i in range(0, n_hosts, 3):
+        scheduler.remove_host(hosts[i])
+        hosts[i] = f"new-{i}"
+        scheduler.add_host(hosts[i])
+
+    per_second = []
+    runs = {}
+    for _ in range(interval * 3):
+        clock.now += 1
+        due = scheduler.due()
+        per_second.append(len(due))
+        for host in due:
+            runs[host] = runs.get(host, 0) + 1
+
+    expected = n_hosts / interval
+    busiest = max(per_second)
+    print(f"Spread: {n_hosts} hosts over {interval}s, expected {expected:.0f}/s, "
+          f"busiest second {busiest}, quietest {min(per_second)}")
+    assert busiest <= expected * 1.1 + 1, "hosts are bunched up"
+    assert all(count == 3 for count in runs.values()) and sorted(runs) == sorted(hosts), \
+        "a host ran too often or too rarely"
+    print("Every host ran exactly once per interval.")
+
+
+def measure_lag(n_hosts, interval=2.0, duration=6.0):
+    scheduler = HostScheduler(interval=interval)
+    for i in range(n_hosts):
+        scheduler.add_host(f"host-{i}")
+    stop = threading.Event()
+    threading.Timer(duration, stop.set).start()
+    scheduler.run(lambda hosts: None, stop_event=stop)
+    print(f"Real run ({n_hosts} hosts, {interval}s interval, {duration}s): {scheduler.stats}")
+
+
+if __name__ == "__main__":
+    n_hosts = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for n in sorted({100, 1000, n_hosts}):
+        check_spread(n)
+    measure_lag(n_hosts)
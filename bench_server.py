@@ -0,0 +1,117 @@
+# bench_server.py
+# Load test for server.py: opens many local chat clients and compares the
+# thread-per-client Server with the asyncio AsyncServer.
+#
+# For each server it reports the memory used per connected client and how
+# many messages per second are delivered when one client broadcasts to all
+# the others.
+#
+# Usage: python bench_server.py [number_of_clients] [number_of_messages]
+
+import os
+import sys
+import time
+import asyncio
+import subprocess
+
+from protocol import encode_message
+
+HOST = '127.0.0.1'
+PORT = 65433
+
+SERVERS = {
+    "threads": "import server; server.Server({host!r}, {port}).start()",
+    "asyncio": "import server; server.AsyncServer({host!r}, {port}).start()",
+}
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def open_files(pid):
+    return len(os.listdir(f"/proc/{pid}/fd"))
+
+
+async def wait_for_server():
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection(HOST, PORT)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("Server did not start")
+
+
+async def run_clients(n_clients, n_messages, server_pid):
+    await wait_for_server()
+    await asyncio.sleep(0.2)
+    memory_before = rss_kb(server_pid)
+    files_before = open_files(server_pid)
+
+    connections = []
+    for batch_start in range(0, n_clients, 100):
+        batch = [asyncio.open_connection(HOST, PORT) for _ in range(min(100, n_clients - batch_start))]
+        connections.extend(await asyncio.gather(*batch))
+        # Small batches, each accepted before the next, so the listen backlog never overflows
+        while open_files(server_pid) < files_before + len(connections):
+            await asyncio.sleep(0.01)
+    await asyncio.sleep(0.5)
+    memory_per_client = (rss_kb(server_pid) - memory_before) * 1024 / n_clients
+
+    message = encode_message("x" * 100)
+    received = 0
+    all_received = asyncio.Event()
+    expected = 0
+
+    async def receive(reader):
+        nonlocal received
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            received += len(data)
+            if received >= expected:
+                all_received.set()
+
+    receivers = [asyncio.ensure_future(receive(reader)) for reader, _ in connections[1:]]
+    sender = connections[0][1]
+
+    start = time.perf_counter()
+    for i in range(n_messages):
+        expected = (i + 1) * len(message) * (n_clients - 1)
+        all_received.clear()
+        sender.write(message)
+        try:
+            await asyncio.wait_for(all_received.wait(), timeout=60)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Only {received} of {expected} bytes arrived") from None
+    elapsed = time.perf_counter() - start
+
+    for task in receivers:
+        task.cancel()
+    for _, writer in connections:
+        writer.close()
+    return memory_per_client, n_messages * (n_clients - 1) / elapsed
+
+
+if __name__ == "__main__":
+    n_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    n_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    for name, code in SERVERS.items():
+        process = subprocess.Popen([sys.executable, "-c", code.format(host=HOST, port=PORT)], cwd=here,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            memory, rate = asyncio.run(run_clients(n_clients, n_messages, process.pid))
+            print(f"{name:<8} {n_clients} clients: {memory / 1024:8.1f} KiB per connection, "
+                  f"{rate:>10,.0f} messages delivered/s")
+        finally:
+            process.kill()
+            process.wait()
@@ -0,0 +1,82 @@
+# bench_startup.py
+# Startup cost of the cli.py commands, from `python -X importtime`.
+#
+# For every command it reports the wall time of the whole run (best of
+# several), the time spent importing modules and the slowest imports, next
+# to a bare interpreter and to importing all the tools at once. It also
+# checks that commands do not import what they do not need, so a change that
+# makes `ping` load asyncio or the mail modules again fails here.
+#
+# Usage: python bench_startup.py
+
+import os
+import sys
+import time
+import subprocess
+
+RUNS = 5
+
+COMMANDS = {
+    "python -c pass": ["-c", "pass"],
+    "import everything": ["-c", "import ping, server, socket_server, socket_ftp, client, alerts, asyncio"],
+    "cli.py --help": ["cli.py", "--help"],
+    "cli.py ping 127.0.0.1": ["cli.py", "-q", "ping", "127.0.0.1"],
+    "cli.py sweep (2 hosts)": ["cli.py", "-q", "sweep", "127.0.0.1", "127.0.0.2"],
+    "cli.py send-file (no file)": ["cli.py", "send-file", "/nonexistent"],
+}
+
+# Modules a command must not import
+NOT_IMPORTED = {
+    "cli.py --help": ["ping", "metrics", "socket", "logging"],
+    "cli.py ping 127.0.0.1": ["asyncio", "smtplib", "email", "http.server", "platform", "server", "socket_server",
+                              "socket_ftp", "client", "alerts", "multiprocessing"],
+    "cli.py sweep (2 hosts)": ["smtplib", "email", "http.server", "server", "socket_server", "alerts"],
+    "cli.py send-file (no file)": ["ping", "asyncio", "smtplib", "http.server"],
+}
+
+
+def import_times(args):
+    """
+    Runs python -X importtime with args.
+
+    Returns:
+        dict: module -> (self time, cumulative time) in seconds
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime"] + args, capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6, len(name) - len(name.lstrip()))
+    return times
+
+
+def wall_time(args):
+    best = float('inf')
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    failures = []
+    for label, args in COMMANDS.items():
+        times = import_times(args)
+        total = sum(self_time for self_time, _, _ in times.values())
+        # The slowest imports done directly by the command (not by other imports)
+        top = sorted(((cumulative, name) for name, (_, cumulative, depth) in times.items() if depth == 1),
+                     reverse=True)[:4]
+        print(f"{label:<28} {wall_time(args) * 1000:6.1f} ms total, {total * 1000:5.1f} ms importing "
+              f"{len(times):3} modules; slowest: {', '.join(f'{name} {t * 1000:.1f}' for t, name in top)}")
+        for module in NOT_IMPORTED.get(label, ()):
+            if any(name == module or name.startswith(module + ".") for name in times):
+                failures.append(f"{label} imports {module}")
+    if failures:
+        print("\n".join(failures))
+        sys.exit(1)
+    print("startup checks passed")
@@ -0,0 +1,100 @@
+# bench_sweep.py
+# Compares one monitoring cycle done with the old serial loop (ping_host one
+# host at a time) against the concurrent asyncio sweep (sweep_hosts).
+#
+# It also checks that a sweep of more hosts than max_in_flight gets enough
+# time for all of its waves, and that hosts a too short deadline never got
+# to are left out of the results instead of being reported as down, and
+# that the in-process ICMP round keeps to the deadline and records metrics.
+#
+# Usage: python bench_sweep.py [number_of_hosts] [max_in_flight]
+
+import sys
+import time
+import logging
+
+import ping
+
+TIMEOUT = 1
+
+
+def make_targets(n):
+    """
+    Half loopback addresses (answer fast), half TEST-NET addresses (never answer).
+    """
+    targets = []
+    for i in range(n):
+        if i % 2 == 0:
+            targets.append(f"127.0.{(i // 254) % 254}.{i % 254 + 1}")
+        else:
+            targets.append(f"192.0.2.{i % 254 + 1}" if i < 508 else f"198.51.100.{i % 254 + 1}")
+    return targets
+
+
+def check_deadline():
+    # Over the ping command, so the pings really go out in waves of max_in_flight
+    backend, ping.PING_BACKEND = ping.PING_BACKEND, 'subprocess'
+    try:
+        hosts = [f"192.0.2.{i + 1}" for i in range(40)]
+        results = ping.sweep_hosts(hosts, timeout=TIMEOUT, max_in_flight=10)
+        assert set(results) == set(hosts), f"{len(hosts) - len(results)} hosts were not probed"
+        assert not any(result.success or result.error == "CycleTimeout" for result in results.values())
+
+        # A deadline shorter than the waves: the hosts of the later waves are not probed
+        results = ping.sweep_hosts(hosts, timeout=TIMEOUT, max_in_flight=10, cycle_timeout=TIMEOUT * 1.5)
+        assert 10 <= len(results) < len(hosts), len(results)
+        assert not any(result.success for result in results.values())
+    finally:
+        ping.PING_BACKEND = backend
+    print("deadline checks passed")
+
+
+def check_icmp():
+    if ping.get_icmp_prober() is None:
+        print("no ICMP socket, skipping the ICMP checks")
+        return
+    # ping_host over ICMP counts its probe like the ping command does
+    probes = ping.PROBES["success"].value
+    assert ping.ping_host("127.0.0.1", timeout=TIMEOUT)[0]
+    assert ping.PROBES["success"].value == probes + 1
+
+    # 3 rounds of 1s to hosts that never answer, but only 0.5s for the whole sweep
+    hosts = [f"192.0.2.{i + 1}" for i in range(20)]
+    start = time.perf_counter()
+    results = ping.sweep_hosts(hosts, count=3, timeout=TIMEOUT, cycle_timeout=0.5)
+    elapsed = time.perf_counter() - start
+    assert elapsed < 1.5, elapsed
+    assert set(results) == set(hosts) and all(result.error == "CycleTimeout" for result in results.values())
+    print(f"ICMP checks passed: the sweep returned after {elapsed:.2f}s")
+
+
+def serial_cycle(hosts):
+    start = time.perf_counter()
+    for host in hosts:
+        ping.ping_host(host, timeout=TIMEOUT)
+    return time.perf_counter() - start
+
+
+def sweep_cycle(hosts, max_in_flight):
+    start = time.perf_counter()
+    ping.sweep_hosts(hosts, timeout=TIMEOUT, max_in_flight=max_in_flight)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n_hosts = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    max_in_flight = int(sys.argv[2]) if len(sys.argv) > 2 else ping.DEFAULT_MAX_IN_FLIGHT
+    logging.getLogger().setLevel(logging.ERROR) # Keep per-host logging out of the timing
+
+    check_deadline()
+    check_icmp()
+    hosts = make_targets(n_hosts)
+
+    # The serial loop is far too slow for the full list, time a sample and scale it up
+    sample = hosts[:20]
+    serial_time = serial_cycle(sample) * n_hosts / len(sample)
+    print(f"Serial loop:   ~{serial_time:.1f}s per cycle for {n_hosts} hosts (estimated from {len(sample)})")
+
+    sweep_time = sweep_cycle(hosts, max_in_flight)
+    print(f"Asyncio sweep: {sweep_time:.1f}s per cycle for {n_hosts} hosts (max_in_flight={max_in_flight})")
+    print(f"Speed-up:      {serial_time / sweep_time:.0f}x")
@@ -0,0 +1,175 @@
+# bench_topics.py
+# Checks of the topic subscriptions and direct messages of server.py, and
+# what delivering a message costs as more clients connect.
+#
+# The checks talk to both servers over loopback. The benchmark calls
+# Server.publish and Server.broadcast_message directly with stand-in
+# outboxes, so it measures the server's delivery cost alone: publishing to a
+# topic with 10 subscribers should cost the same with 100 or 100,000
+# clients connected, while a broadcast grows with the number of clients.
+#
+# Usage: python bench_topics.py
+
+import io
+import os
+import sys
+import time
+import socket
+import contextlib
+import subprocess
+
+import server
+from protocol import DEFAULT_CODEC, FrameReader, encode_message
+from bench_server import HOST, PORT, SERVERS
+
+TOPIC_SIZE = 10
+CLIENT_COUNTS = (100, 1000, 10000, 100000)
+
+
+class ChatConnection:
+    def __init__(self):
+        self.sock = socket.create_connection((HOST, PORT))
+        self.sock.settimeout(2)
+        self.reader = FrameReader()
+        self.pending = []
+        self.send({"type": "hello"})
+        self.id = self.receive()["id"]
+
+    def send(self, message):
+        self.sock.sendall(encode_message(message))
+
+    def receive(self):
+        while not self.pending:
+            if not self.reader.recv_into(self.sock):
+                raise ConnectionError("server closed the connection")
+            self.pending.extend(DEFAULT_CODEC.decode(payload) for payload in self.reader.frames())
+        return self.pending.pop(0)
+
+    def sync(self):
+        # Messages of one client are handled in order, so once the welcome is
+        # back everything sent before it has been handled
+        self.send({"type": "hello"})
+        welcome = self.receive()
+        assert welcome == {"type": "welcome", "id": self.id}, welcome
+
+    def assert_nothing_received(self):
+        self.sock.settimeout(0.2)
+        try:
+            message = self.receive()
+            raise AssertionError(f"client {self.id} received {message}")
+        except socket.timeout:
+            pass
+        finally:
+            self.sock.settimeout(2)
+
+    def close(self):
+        self.sock.close()
+
+
+def wait_for_port():
+    for _ in range(100):
+        try:
+            socket.create_connection((HOST, PORT)).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Server did not start")
+
+
+def check_server():
+    a, b, c, d = (ChatConnection() for _ in range(4))
+    assert len({a.id, b.id, c.id, d.id}) == 4
+
+    for subscriber in (b, c):
+        subscriber.send({"type": "subscribe", "topic": "news"})
+        subscriber.send({"type": "subscribe", "topic": "news"}) # Twice is the same as once
+        subscriber.sync()
+    a.send({"type": "publish", "topic": "news", "text": "first"})
+    for subscriber in (b, c):
+        assert subscriber.receive() == {"type": "publish", "topic": "news", "text": "first", "from": a.id}
+    d.assert_nothing_received()
+
+    # The publisher does not get its own message back, unsubscribed clients get nothing
+    c.send({"type": "unsubscribe", "topic": "news"})
+    c.sync()
+    b.send({"type": "publish", "topic": "news", "text": "second"})
+    b.sync()
+    c.assert_nothing_received()
+    a.assert_nothing_received()
+
+    # Direct messages
+    a.send({"type": "direct", "to": d.id, "text": "psst"})
+    assert d.receive() == {"type": "direct", "to": d.id, "text": "psst", "from": a.id}
+    a.send({"type": "direct", "to": 999999, "text": "anyone?"})
+    assert a.receive()["type"] == "error"
+    b.assert_nothing_received()
+
+    # Bad control messages are answered with an error
+    for bad in ({"type": "subscribe"}, {"type": "subscribe", "topic": ""}, {"type": "direct", "to": "b"}):
+        a.send(bad)
+        assert a.receive()["type"] == "error", bad
+
+    # Everything else still goes to everyone
+    a.send("hello all")
+    for other in (b, c, d):
+        assert other.receive() == "hello all"
+
+    # A client that disconnects leaves its topics
+    b.close()
+    time.sleep(0.2)
+    a.send({"type": "publish", "topic": "news", "text": "third"})
+    a.send({"type": "direct", "to": b.id, "text": "gone?"})
+    assert a.receive()["type"] == "error"
+    for client in (a, c, d):
+        client.close()
+
+
+class FakeOutbox:
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.received = 0
+
+    def put(self, data):
+        self.received += 1
+        return True
+
+
+def per_message(function, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        function()
+    return (time.perf_counter() - start) / n
+
+
+def bench_delivery():
+    print(f"Delivery cost per message, topic with {TOPIC_SIZE} subscribers:")
+    for n_clients in CLIENT_COUNTS:
+        chat = server.Server(server.HOST, 0)
+        conns = [object() for _ in range(n_clients)]
+        for number, conn in enumerate(conns):
+            chat.add_client(conn, ("127.0.0.1", number), FakeOutbox(number))
+        for conn in conns[::n_clients // TOPIC_SIZE][:TOPIC_SIZE]:
+            chat.subscribe(conn, "news")
+        message = {"type": "publish", "topic": "news", "text": "x" * 100}
+        with contextlib.redirect_stdout(io.StringIO()):
+            publish = per_message(lambda: chat.publish("news", message), 20000)
+            broadcast = per_message(lambda: chat.broadcast_message("x" * 100, None), max(3, 200000 // n_clients))
+            direct = per_message(lambda: chat.send_direct(n_clients // 2, message), 20000)
+        assert chat.outboxes[conns[0]].received > 20000
+        print(f"{n_clients:>7} clients: publish {publish * 1e6:7.1f} us, direct {direct * 1e6:5.1f} us, "
+              f"broadcast to all {broadcast * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name, code in SERVERS.items():
+        process = subprocess.Popen([sys.executable, "-c", code.format(host=HOST, port=PORT)], cwd=here,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port()
+            check_server()
+            print(f"{name}: checks passed")
+        finally:
+            process.kill()
+            process.wait()
+    bench_delivery()
@@ -0,0 +1,93 @@
+# bench_transfer.py
+# Loopback file transfer speed: the old 4 KB read/sendall + recv(4096)/print
+# loops compared with socket_ftp.send_file / socket_server.receive_file
+# (sendfile and recv_into).
+#
+# Usage: python bench_transfer.py [size_in_MB]
+
+import io
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+import contextlib
+
+import socket_ftp
+import socket_server
+
+
+def legacy_send(s, path):
+    # What socket_ftp did before: 4 KB chunks, a progress line per chunk
+    s.sendall(f"{os.path.basename(path)}\n".encode('utf-8'))
+    time.sleep(0.1) # The old receiver read the filename with one recv(1024), keep it separate
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        sent = 0
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                break
+            s.sendall(chunk)
+            sent += len(chunk)
+            print(f"\rSent {sent}/{size} bytes...", end='')
+
+
+def legacy_receive(conn, addr, save_dir):
+    # What socket_server did before: recv(4096), print every chunk, write it
+    filename = os.path.basename(conn.recv(1024).decode('utf-8').strip())
+    with open(os.path.join(save_dir, filename), 'wb') as f:
+        while True:
+            data = conn.recv(4096)
+            print(data)
+            if not data:
+                break
+            f.write(data)
+
+
+def transfer(path, save_dir, sender, receiver):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+
+    def serve():
+        conn, addr = listener.accept()
+        with conn:
+            receiver(conn, addr, save_dir)
+
+    server_thread = threading.Thread(target=serve)
+    server_thread.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) as output, socket.create_connection(listener.getsockname()) as s:
+        sender(s, path)
+        s.shutdown(socket.SHUT_WR)
+        server_thread.join()
+    output.close()
+    elapsed = time.perf_counter() - start
+    listener.close()
+    return elapsed
+
+
+if __name__ == "__main__":
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "payload.bin")
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+        save_dir = os.path.join(tmp, "received")
+        os.makedirs(save_dir)
+
+        modes = [
+            ("old 4 KB loops", legacy_send, legacy_receive),
+            ("readinto + recv_into", lambda s, p: socket_ftp.send_file(s, p, use_sendfile=False),
+             lambda c, a, d: socket_server.receive_file(c, a, save_dir=d)),
+            ("sendfile + recv_into", socket_ftp.send_file,
+             lambda c, a, d: socket_server.receive_file(c, a, save_dir=d)),
+        ]
+        for label, sender, receiver in modes:
+            elapsed = transfer(path, save_dir, sender, receiver)
+            same = os.path.getsize(os.path.join(save_dir, "payload.bin")) == size_mb * 1024 * 1024
+            print(f"{label:<22} {size_mb} MB in {elapsed:6.2f}s = {size_mb / elapsed:8.1f} MB/s"
+                  f"{'' if same else '  (SIZE MISMATCH)'}")
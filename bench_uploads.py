@@ -0,0 +1,152 @@
+# bench_uploads.py
+# Many clients uploading to socket_server.start_server at the same time.
+#
+# Runs 100 concurrent uploads (plus one client that sends very slowly) against
+# servers with different worker pool sizes and reports the aggregate
+# throughput and how long the uploads took to complete (median, p99, max).
+# With a single worker every upload waits behind the slow one. A check
+# first makes sure the size limit given to start_server cancels uploads that
+# are too big, and that the progress lines of concurrent uploads stay apart.
+#
+# Usage: python bench_uploads.py [number_of_uploads] [size_in_MB]
+
+import io
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+import contextlib
+
+import socket_ftp
+import socket_server
+
+SLOW_CLIENT_SECONDS = 2.0 # How long the slow client takes to send its file
+
+
+def upload(path, results, index):
+    start = time.perf_counter()
+    with socket.create_connection((socket_server.HOST, socket_server.PORT)) as s:
+        socket_ftp.send_file(s, path)
+        s.shutdown(socket.SHUT_WR)
+        s.recv(1) # Wait until the server has saved the file and closed the connection
+    results[index] = time.perf_counter() - start
+
+
+def slow_upload(path):
+    with socket.create_connection((socket_server.HOST, socket_server.PORT)) as s:
+        s.sendall(b"slow.bin\n")
+        for _ in range(20):
+            s.sendall(b"x" * 1024)
+            time.sleep(SLOW_CLIENT_SECONDS / 20)
+        s.shutdown(socket.SHUT_WR)
+        s.recv(1)
+
+
+def plain_upload(path):
+    # Like upload, without the client's own progress output; the server may hang up early
+    try:
+        with socket.create_connection((socket_server.HOST, socket_server.PORT)) as s, open(path, 'rb') as f:
+            s.sendall(os.path.basename(path).encode() + b"\n")
+            s.sendfile(f)
+            s.shutdown(socket.SHUT_WR)
+            s.recv(1)
+    except ConnectionError:
+        pass
+
+
+def wait_for_server():
+    for _ in range(100):
+        try:
+            socket.create_connection((socket_server.HOST, socket_server.PORT)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Server did not start")
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def check_limits(paths, save_dir):
+    # The limit is half the size of the uploads, so paths[0] and paths[1] are bigger than it and the small file is not
+    limit = min(os.path.getsize(path) for path in paths[:2]) // 2
+    small = os.path.join(os.path.dirname(paths[0]), "small.bin")
+    with open(small, 'wb') as f:
+        f.write(b"x" * 1000)
+    stop = threading.Event()
+    server = threading.Thread(target=socket_server.start_server,
+                              kwargs=dict(save_dir=save_dir, stop_event=stop, max_file_size=limit,
+                                          port=socket_server.PORT))
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        server.start()
+        wait_for_server()
+        clients = [threading.Thread(target=plain_upload, args=(path,)) for path in (paths[0], paths[1], small)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        stop.set()
+        server.join()
+    assert os.listdir(save_dir) == ["small.bin"], os.listdir(save_dir)
+    assert "\r" not in output.getvalue()
+    assert output.getvalue().count(f"bigger than the limit of {limit} bytes") == 2, output.getvalue()
+    print("size limit checks passed")
+
+
+def run(n_uploads, paths, save_dir, max_workers):
+    stop = threading.Event()
+    server = threading.Thread(target=socket_server.start_server,
+                              kwargs=dict(max_workers=max_workers, max_queued=n_uploads + 10,
+                                          save_dir=save_dir, stop_event=stop, port=socket_server.PORT))
+    results = [None] * n_uploads
+    with contextlib.redirect_stdout(io.StringIO()):
+        server.start()
+        wait_for_server()
+        slow = threading.Thread(target=slow_upload, args=(paths[0],))
+        slow.start()
+        time.sleep(0.05) # Let the slow client take the first worker
+        clients = [threading.Thread(target=upload, args=(paths[i % len(paths)], results, i))
+                   for i in range(n_uploads)]
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+        slow.join()
+        stop.set()
+        server.join()
+    return elapsed, results
+
+
+if __name__ == "__main__":
+    n_uploads = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    size_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    socket_server.PORT = 65434
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(8):
+            path = os.path.join(tmp, f"upload{i}.bin")
+            with open(path, 'wb') as f:
+                f.write(os.urandom(size_mb * 1024 * 1024))
+            paths.append(path)
+
+        check_limits(paths, os.path.join(tmp, "limited"))
+        for max_workers in (1, 16, n_uploads):
+            save_dir = os.path.join(tmp, f"received{max_workers}")
+            elapsed, results = run(n_uploads, paths, save_dir, max_workers)
+            saved = sorted(os.listdir(save_dir))
+            # Only finished files are visible, never a .part file
+            assert saved == sorted(["slow.bin"] + [os.path.basename(p) for p in paths]), saved
+            for path in paths:
+                with open(path, 'rb') as a, open(os.path.join(save_dir, os.path.basename(path)), 'rb') as b:
+                    assert a.read() == b.read()
+            total_mb = n_uploads * size_mb
+            print(f"{max_workers:>3} workers: {n_uploads} x {size_mb} MB in {elapsed:5.2f}s = "
+                  f"{total_mb / elapsed:7.1f} MB/s, completion p50 {percentile(results, 0.5):5.2f}s "
+                  f"p99 {percentile(results, 0.99):5.2f}s max {max(results):5.2f}s")
@@ -0,0 +1,78 @@
+# bench_validate.py
+# Lines per second of ipaddr.validate_lines compared with the try/except
+# ipaddress.ip_address approach, on a host list with mixed valid and invalid
+# IPv4 and IPv6 entries. Also checks that both agree on what is valid and
+# that the normalized forms are the same strings.
+#
+# Usage: python bench_validate.py [number_of_lines]
+
+import sys
+import time
+import random
+import socket
+import ipaddress
+
+import ex1
+import ipaddr
+
+
+def make_lines(n, rng):
+    bad = ["10.0.0", "10.0.0.256", "010.0.0.1", "host.example", "1::2::3", "fe80::g", "1.2.3.4.5",
+           "12345::1", "::ffff:1.2.3", ""]
+    lines = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.7:
+            text = socket.inet_ntoa(rng.getrandbits(32).to_bytes(4, 'big'))
+        elif kind < 0.85:
+            text = socket.inet_ntop(socket.AF_INET6, rng.getrandbits(128).to_bytes(16, 'big'))
+            if rng.random() < 0.5:
+                text = text.upper()
+        elif kind < 0.87:
+            text = rng.choice(["::ffff:", "::", "64:ff9b::"]) + socket.inet_ntoa(rng.getrandbits(32).to_bytes(4, 'big'))
+        else:
+            text = rng.choice(bad)
+        lines.append(f"  {text}\n" if rng.random() < 0.1 else text + "\n")
+    return lines
+
+
+def try_except(lines):
+    results = []
+    for number, line in enumerate(lines, 1):
+        text = line.strip()
+        if not text or text[0] == '#':
+            continue
+        try:
+            results.append((number, str(ipaddress.ip_address(text))))
+        except ValueError as e:
+            results.append((number, None))
+    return results
+
+
+def timed(label, n, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed:6.2f}s {n / elapsed / 1e6:6.2f} M lines/s")
+    return result
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    lines = make_lines(n, random.Random(1))
+
+    expected = timed("try/except ipaddress.ip_address", n, lambda: try_except(lines))
+    results = timed("ipaddr.validate_lines", n, lambda: list(ipaddr.validate_lines(lines)))
+    timed("ex1.validate_ip_address per line", n, lambda: [ex1.validate_ip_address(line.strip()) for line in lines])
+
+    assert len(results) == len(expected)
+    for result, (number, address) in zip(results, expected):
+        assert result.line == number
+        assert (result.address is None) == (address is None), result
+        if address is not None:
+            assert result.address == address, (result.address, address)
+        else:
+            assert result.error and 0 <= result.position <= len(result.text)
+    assert not any(ex1.validate_ip_address(value) for value in (None, 1234, b"1.2.3.4"))
+    invalid = sum(result.address is None for result in results)
+    print(f"{invalid} invalid entries found, results agree with ipaddress.")
@@ -0,0 +1,311 @@
+# cli.py
+# One command line for the ping monitor and the socket tools.
+#
+#   python cli.py ping 8.8.8.8                        - exit status 0 if it answers, 1 if not
+#   python cli.py sweep --hosts-file hosts.txt --csv results.csv
+#   python cli.py monitor example.com 10.0.0.1 --interval 30 --metrics-port 9108
+#   python cli.py chat-server --mode async --workers 4
+#   python cli.py send-file backup.tar --host 10.0.0.5 --compression zlib
+#   python cli.py receive-files --dir incoming --workers 32
+#   python cli.py load-test --connections 50 --senders 5
+#
+# Options can also come from an INI file given with --config, one section
+# per command; [DEFAULT] applies to all of them. Command line options win.
+#
+#   [DEFAULT]
+#   host = 10.0.0.5
+#   [monitor]
+#   hosts = 8.8.8.8 example.com
+#   interval = 30
+#   csv = /var/log/ping_results.csv
+#
+# Only argparse and configparser are imported up front. Every command imports
+# the modules it needs when it runs, so a one-shot ping (e.g. from cron) does
+# not load the chat server, asyncio or the mail modules; see bench_startup.py.
+
+import os
+import sys
+import argparse
+import configparser
+
+HOST = '127.0.0.1'
+PORT = 65432 # Used by the chat server and the file transfer, like in the scripts
+
+
+def read_hosts(args):
+    # Hosts from the command line (or config file), then from --hosts-file
+    hosts = list(args.hosts)
+    if args.hosts_file:
+        with open(args.hosts_file) as f:
+            hosts += [host for host in (line.split('#', 1)[0].strip() for line in f) if host]
+    if not hosts:
+        raise SystemExit("No hosts given")
+    return list(dict.fromkeys(hosts))
+
+
+def start_metrics(args):
+    import metrics
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+    if getattr(args, 'metrics_file', None):
+        metrics.start_snapshots(args.metrics_file)
+
+
+def status_line(host, result):
+    if result.success:
+        return f"{host}\tup\t{result.avg:.3f} ms"
+    return f"{host}\t{'down' if result.resolved else 'unresolved'}\t{result.error or ''}".rstrip()
+
+
+def cmd_ping(args):
+    import ping
+    result = ping.probe_host(args.host, count=args.count, timeout=args.timeout)
+    print(result.summary())
+    return 0 if result.success else 1
+
+
+def cmd_sweep(args):
+    import ping
+    hosts = read_hosts(args)
+    results = ping.sweep_hosts(hosts, count=args.count, timeout=args.timeout, max_in_flight=args.max_in_flight)
+    sink = ping.get_result_sink(args.csv) if args.csv else None
+    for host in hosts:
+        result = results.get(host)
+        if result is None:
+            print(f"{host}\tnot probed")
+            continue
+        print(status_line(host, result))
+        if sink is not None:
+            sink.write(result)
+    return 0 if len(results) == len(hosts) and all(result.success for result in results.values()) else 1
+
+
+def cmd_monitor(args):
+    import ping
+    hosts = read_hosts(args)
+    start_metrics(args)
+    options = dict(interval_seconds=args.interval, count=args.count, timeout=args.timeout,
+                   max_in_flight=args.max_in_flight)
+    if args.alerts: # With --csv too, the results are also logged
+        sink = ping.get_result_sink(args.csv) if args.csv else None
+        ping.monitor_hosts_with_alerts(hosts, sink=sink, **options)
+    elif args.csv:
+        ping.monitor_hosts_with_csv(hosts, log_file=args.csv, **options)
+    else:
+        ping.monitor_hosts(hosts, **options)
+    return 0
+
+
+def cmd_chat_server(args):
+    import server
+    options = dict(max_buffer=args.max_buffer, slow_consumer_policy=args.policy)
+    if args.mode == "async" and args.workers > 1:
+        # Worker processes each have their own numbers, so there is no single metrics endpoint for them
+        server.start_workers(args.host, args.port, args.workers, **options)
+        return 0
+    start_metrics(args)
+    if args.mode == "async":
+        server.AsyncServer(args.host, args.port, **options).start()
+    else:
+        server.Server(args.host, args.port, max_queue=args.max_queue, slow_consumer_policy=args.policy).start()
+    return 0
+
+
+def cmd_send_file(args):
+    import socket_ftp
+    if not os.path.isfile(args.file):
+        print(f"Error: File '{args.file}' not found or not a regular file.", file=sys.stderr)
+        return 1
+    try:
+        sent = socket_ftp.send_file_chunked(args.file, host=args.host, port=args.port, connections=args.connections,
+                                            retries=args.retries, dedup=args.dedup, compression=args.compression)
+    except OSError as e: # ConnectionError included
+        print(f"Error: Could not send '{args.file}': {e}", file=sys.stderr)
+        return 1
+    print(f"Sent '{os.path.basename(args.file)}' ({sent} bytes over the wire).")
+    return 0
+
+
+def cmd_receive_files(args):
+    import socket_server
+    os.makedirs(args.dir, exist_ok=True)
+    start_metrics(args)
+    socket_server.start_server(max_workers=args.workers, max_queued=args.max_queued, idle_timeout=args.idle_timeout,
+                               save_dir=args.dir, host=args.host, port=args.port, max_file_size=args.max_file_size,
+                               dedup_hosts=tuple(args.dedup_hosts))
+    return 0
+
+
+def cmd_load_test(args):
+    import client
+    stats = client.run_load_test(args.host, args.port, connections=args.connections, senders=args.senders,
+                                 messages=args.messages, message_size=args.message_size, rate=args.rate)
+    print(stats.summary())
+    return 0 if stats.lost == 0 else 1
+
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Ping monitor, chat server and file transfer tools.")
+    parser.add_argument("--config", metavar="FILE", help="INI file with defaults, a [section] per command")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Log warnings and errors only")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+
+    def add_ping_options(command):
+        command.add_argument("--count", type=positive_int, default=1, help="Packets per host (default: 1)")
+        command.add_argument("--timeout", type=float, default=1, help="Seconds to wait per packet (default: 1)")
+
+    def add_hosts_options(command):
+        command.add_argument("hosts", nargs="*", metavar="HOST", help="Hosts to ping")
+        command.add_argument("--hosts-file", metavar="FILE", help="More hosts, one per line")
+        command.add_argument("--max-in-flight", type=positive_int, default=512,
+                             help="Pings running at the same time (default: 512)")
+        add_ping_options(command)
+
+    def add_address_options(command, what):
+        command.add_argument("--host", default=HOST, help=f"{what} (default: {HOST})")
+        command.add_argument("--port", type=int, default=PORT, help=f"Port (default: {PORT})")
+
+    def add_metrics_options(command):
+        command.add_argument("--metrics-port", type=int, metavar="PORT",
+                             help="Serve metrics at http://127.0.0.1:PORT/metrics")
+
+    command = commands.add_parser("ping", help="Ping one host once")
+    command.add_argument("host")
+    add_ping_options(command)
+    command.set_defaults(handler=cmd_ping)
+
+    command = commands.add_parser("sweep", help="Ping many hosts at once")
+    add_hosts_options(command)
+    command.add_argument("--csv", metavar="FILE", help="Append the results to a CSV file")
+    command.set_defaults(handler=cmd_sweep)
+
+    command = commands.add_parser("monitor", help="Ping hosts over and over")
+    add_hosts_options(command)
+    command.add_argument("--interval", type=float, default=60, help="Seconds between sweeps (default: 60)")
+    command.add_argument("--csv", metavar="FILE", help="Append the results to a CSV file")
+    command.add_argument("--alerts", action="store_true", help="Email when hosts go down or come back up")
+    add_metrics_options(command)
+    command.add_argument("--metrics-file", metavar="FILE", help="Write the metrics to FILE every 15 seconds")
+    command.set_defaults(handler=cmd_monitor)
+
+    command = commands.add_parser("chat-server", help="Run the chat server")
+    add_address_options(command, "Address to listen on")
+    command.add_argument("--mode", choices=("threads", "async"), default="threads",
+                         help="A thread per client or one asyncio event loop (default: threads)")
+    command.add_argument("--workers", type=positive_int, default=1,
+                         help="Event loop processes sharing the port, with --mode async (default: 1)")
+    command.add_argument("--max-queue", type=positive_int, default=1000,
+                         help="Messages queued per client, with --mode threads (default: 1000)")
+    command.add_argument("--max-buffer", type=positive_int, default=1024 * 1024,
+                         help="Bytes buffered per client, with --mode async (default: 1048576)")
+    command.add_argument("--policy", choices=("drop_oldest", "disconnect", "backpressure"), default="drop_oldest",
+                         help="What to do with clients that read too slowly (default: drop_oldest)")
+    add_metrics_options(command)
+    command.set_defaults(handler=cmd_chat_server)
+
+    command = commands.add_parser("send-file", help="Send a file to a receive-files server")
+    command.add_argument("file")
+    add_address_options(command, "Server")
+    command.add_argument("--connections", type=positive_int, default=4, help="Parallel connections (default: 4)")
+    command.add_argument("--retries", type=int, default=3, help="Resume attempts (default: 3)")
+    command.add_argument("--compression", choices=("zlib", "lzma"), help="Compress chunks that are worth it")
+    command.add_argument("--no-dedup", dest="dedup", action="store_false",
+                         help="Send every chunk even if the server has it already")
+    command.set_defaults(handler=cmd_send_file)
+
+    command = commands.add_parser("receive-files", help="Receive files sent with send-file")
+    add_address_options(command, "Address to listen on")
+    command.add_argument("--dir", default="received_files", help="Where to save them (default: received_files)")
+    command.add_argument("--workers", type=positive_int, default=16,
+                         help="Uploads received at the same time (default: 16)")
+    command.add_argument("--max-queued", type=int, default=64,
+                         help="Uploads waiting for a worker, more are rejected (default: 64)")
+    command.add_argument("--idle-timeout", type=float, default=30,
+                         help="Seconds a client may stay silent (default: 30)")
+    command.add_argument("--max-file-size", type=positive_int, default=16 * 1024 ** 3, metavar="BYTES",
+                         help="Largest file accepted (default: 16 GiB)")
+    command.add_argument("--dedup-hosts", nargs="*", default=["127.0.0.1", "::1"], metavar="ADDRESS",
+                         help="Clients that may reuse files and chunks the server already has "
+                              "(default: 127.0.0.1 ::1)")
+    add_metrics_options(command)
+    command.set_defaults(handler=cmd_receive_files)
+
+    command = commands.add_parser("load-test", help="Measure the throughput and latency of a chat server")
+    add_address_options(command, "Server")
+    command.add_argument("--connections", type=positive_int, default=20, help="Connections to open (default: 20)")
+    command.add_argument("--senders", type=positive_int, help="How many of them send (default: all)")
+    command.add_argument("--messages", type=positive_int, default=500, help="Messages per sender (default: 500)")
+    command.add_argument("--message-size", type=int, default=100, help="Bytes of padding per message (default: 100)")
+    command.add_argument("--rate", type=float, help="Messages per second per sender (default: as fast as possible)")
+    command.set_defaults(handler=cmd_load_test)
+    return parser
+
+
+def apply_config(parser, filename):
+    """
+    Makes the values in an INI file the defaults of the commands. Keys are
+    the long option names without the dashes (or the name of a positional
+    argument like hosts); values are converted by argparse like command line
+    values.
+    """
+    config = configparser.ConfigParser()
+    if not config.read(filename):
+        parser.error(f"Cannot read config file {filename}")
+    commands = next(action for action in parser._actions if isinstance(action, argparse._SubParsersAction))
+    for section in config.sections():
+        if section not in commands.choices:
+            parser.error(f"Unknown section [{section}] in {filename}")
+    for name, command in commands.choices.items():
+        options = {}
+        for action in command._actions:
+            for option in action.option_strings or [action.dest]:
+                options[option.lstrip('-')] = action
+        section = config[name] if config.has_section(name) else config[configparser.DEFAULTSECT]
+        defaults = {}
+        for key in section:
+            action = options.get(key)
+            if action is None or action.dest == "help":
+                if key in config.defaults():
+                    continue # [DEFAULT] values only apply to the commands that have the option
+                parser.error(f"Unknown option '{key}' in [{name}] of {filename}")
+            if action.nargs == 0: # --flag
+                value = action.const if section.getboolean(key) else not action.const
+            elif action.nargs == "*":
+                value = section[key].replace(',', ' ').split()
+            else:
+                value = section[key]
+                if action.choices is not None and value not in action.choices:
+                    parser.error(f"'{key}' in [{name}] of {filename} must be one of {', '.join(action.choices)}")
+            defaults[action.dest] = value
+        command.set_defaults(**defaults)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    # Read --config first, its values become the defaults for the full parse
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument("--config")
+    known, _ = config_parser.parse_known_args(argv)
+    if known.config:
+        apply_config(parser, known.config)
+    args = parser.parse_args(argv)
+    if args.quiet:
+        import logging
+        logging.basicConfig(level=logging.WARNING)
+        logging.getLogger().setLevel(logging.WARNING)
+    try:
+        return args.handler(args)
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,36 @@
 # client.py
+import sys
+import time
 import socket
+import asyncio
+import threading
+from array import array
+
+from protocol import DEFAULT_CODEC, RECV_SIZE, FrameReader, ProtocolError, encode_message
 
 HOST = '127.0.0.1'  # The server's hostname or IP address
 PORT = 65432        # The port used by the server
 
+# Load test (see run_load_test)
+LOAD_CONNECTIONS = 20 # Connections opened by the load test
+LOAD_MESSAGES = 500 # Messages sent by every sending connection
+LOAD_MESSAGE_SIZE = 100 # Bytes of padding in every message
+DRAIN_EVERY = 64 # Messages written before waiting for the socket buffer to drain
+DELIVERY_TIMEOUT = 10.0 # Seconds to wait for the last deliveries after sending
+PERCENTILES = (50, 90, 99, 99.9)
+
+def receive_messages(s, codec=DEFAULT_CODEC):
+    # Print every message the server forwards to us until the connection closes
+    frame_reader = FrameReader()
+    try:
+        while frame_reader.recv_into(s):
+            for payload in frame_reader.frames():
+                print(f"\nReceived from server: {codec.decode(payload)}")
+    except ProtocolError as e:
+        print(f"\nInvalid data from server: {e}")
+    except OSError:
+        pass # Socket closed by start_client
+
 def start_client():
     # Create a socket object using IPv4 (AF_INET) and TCP (SOCK_STREAM)
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -11,23 +38,206 @@ def start_client():
         s.connect((HOST, PORT))
         print(f"Connected to server {HOST}:{PORT}")
 
+        # Messages from other clients can arrive at any time, so read them in the background
+        receiver = threading.Thread(target=receive_messages, args=(s,), daemon=True)
+        receiver.start()
+
         while True:
             message = input("Enter message to send (type 'bye' to exit): ")
             if not message:
                 continue
 
-            # Send the message (must be bytes)
-            s.sendall(message.encode('utf-8'))
+            # Send the message as one length-prefixed frame
+            s.sendall(encode_message(message))
 
             if message.lower() == "bye":
                 print("Client closing connection.")
                 break
 
-            # Receive response from the server
-            data = s.recv(1024)
-            print(f"Received from server: {data.decode('utf-8')}")
+        s.shutdown(socket.SHUT_RDWR)
 
     print("Client closed.")
 
+def _percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+class LoadTestStats:
+    """
+    Outcome of a load test. A delivery is one message arriving at one
+    receiving connection; with n connections every message should be
+    delivered n - 1 times.
+    """
+    __slots__ = ('connections', 'senders', 'sent', 'expected', 'delivered', 'reordered', 'elapsed', 'latencies')
+
+    def __init__(self, connections, senders):
+        self.connections = connections
+        self.senders = senders
+        self.sent = 0
+        self.expected = 0 # Deliveries there should be
+        self.delivered = 0
+        self.reordered = 0 # Deliveries that arrived after a later message from the same sender
+        self.elapsed = 0.0 # Seconds from the first message sent to the last delivery
+        self.latencies = array('d') # Seconds from sending to delivery, one per delivery
+
+    @property
+    def lost(self):
+        return self.expected - self.delivered
+
+    def percentile(self, p):
+        """
+        Delivery latency in seconds that p percent of the deliveries were faster than.
+        """
+        return _percentile(sorted(self.latencies), p) if self.latencies else float('nan')
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        lines = [f"{self.connections} connections, {self.senders} sending: {self.sent} messages sent, "
+                 f"{self.delivered} of {self.expected} deliveries ({self.lost} lost, {self.reordered} out of order) "
+                 f"in {self.elapsed:.2f}s"]
+        if self.elapsed:
+            lines.append(f"throughput: {self.sent / self.elapsed:,.0f} messages/s sent, "
+                         f"{self.delivered / self.elapsed:,.0f} deliveries/s")
+        if latencies:
+            parts = [f"p{p:g} {_percentile(latencies, p) * 1000:.2f}" for p in PERCENTILES]
+            lines.append(f"latency ms: {', '.join(parts)}, max {latencies[-1] * 1000:.2f}")
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return (f"LoadTestStats(sent={self.sent}, delivered={self.delivered}, expected={self.expected}, "
+                f"p50={self.percentile(50) * 1000:.2f}ms, p99={self.percentile(99) * 1000:.2f}ms)")
+
+async def _open_connections(host, port, n):
+    connections = []
+    # In batches, so the server's listen backlog does not overflow
+    for batch_start in range(0, n, 100):
+        batch = [asyncio.open_connection(host, port) for _ in range(min(100, n - batch_start))]
+        connections.extend(await asyncio.gather(*batch))
+    return connections
+
+async def load_test(host=HOST, port=PORT, connections=LOAD_CONNECTIONS, senders=None, messages=LOAD_MESSAGES,
+                    message_size=LOAD_MESSAGE_SIZE, rate=None, codec=DEFAULT_CODEC, delivery_timeout=DELIVERY_TIMEOUT):
+    """
+    Measures how many messages the chat server delivers per second and how
+    long delivery takes, see run_load_test().
+    """
+    senders = connections if senders is None else min(senders, connections)
+    stats = LoadTestStats(connections, senders)
+    stats.expected = senders * messages * (connections - 1)
+    clock = time.perf_counter # All connections are in this process, so they share the clock
+    streams = await _open_connections(host, port, connections)
+    all_delivered = asyncio.Event()
+    ready = [False] * connections # Connection has received a warm-up message
+
+    async def receive(number, reader):
+        frame_reader = FrameReader()
+        last_seq = {} # sender -> highest sequence number received
+        latencies = stats.latencies
+        while True:
+            data = await reader.read(RECV_SIZE * 8)
+            if not data:
+                return
+            now = clock()
+            frame_reader.feed(data)
+            for payload in frame_reader.frames():
+                message = codec.decode(payload)
+                if not isinstance(message, dict) or "seq" not in message:
+                    continue # Someone else chatting on the server
+                sender = message["id"]
+                if sender < 0:
+                    ready[number] = True
+                    continue
+                seq = message["seq"]
+                if seq < last_seq.get(sender, -1):
+                    stats.reordered += 1
+                else:
+                    last_seq[sender] = seq
+                latencies.append(now - message["t"])
+                stats.delivered += 1
+            if stats.delivered >= stats.expected:
+                all_delivered.set()
+
+    async def send(number, writer, start):
+        padding = "x" * message_size
+        for seq in range(messages):
+            if rate:
+                # Open loop: messages are stamped with the time they were due, so
+                # a stalled server cannot hide its delay by slowing the client down
+                due = start + seq / rate
+                delay = due - clock()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                due = clock()
+            writer.write(encode_message({"id": number, "seq": seq, "t": due, "pad": padding}, codec))
+            stats.sent += 1
+            if seq % DRAIN_EVERY == DRAIN_EVERY - 1:
+                await writer.drain()
+        await writer.drain()
+
+    receivers = [asyncio.ensure_future(receive(number, reader)) for number, (reader, _) in enumerate(streams)]
+    try:
+        # The server may not have registered every connection yet: send warm-up
+        # messages until every other connection has received one
+        ready[0] = True
+        deadline = clock() + delivery_timeout
+        while connections > 1 and not all(ready):
+            if clock() > deadline:
+                raise RuntimeError(f"Only {sum(ready)} of {connections} connections joined the server")
+            streams[0][1].write(encode_message({"id": -1, "seq": 0, "t": 0.0}, codec))
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.05) # Let the last warm-up messages arrive
+
+        start = clock()
+        await asyncio.gather(*(send(number, streams[number][1], start) for number in range(senders)))
+        try:
+            await asyncio.wait_for(all_delivered.wait(), timeout=delivery_timeout)
+        except asyncio.TimeoutError:
+            pass # Reported as lost
+        stats.elapsed = clock() - start
+    finally:
+        for task in receivers:
+            task.cancel()
+        for _, writer in streams:
+            writer.close()
+    return stats
+
+def run_load_test(host=HOST, port=PORT, connections=LOAD_CONNECTIONS, senders=None, messages=LOAD_MESSAGES,
+                  message_size=LOAD_MESSAGE_SIZE, rate=None, codec=DEFAULT_CODEC, delivery_timeout=DELIVERY_TIMEOUT):
+    """
+    Load test for the chat server: opens many connections from this process
+    and sends messages from several of them at once, without waiting for
+    anything in between (pipelined). Every message carries its sender, a
+    sequence number and the time it was sent, so each connection measures the
+    delivery latency of every message it receives and notices lost and
+    reordered messages.
+
+    The client runs on one event loop; with very many connections it can
+    become the bottleneck before the server does.
+
+    Args:
+        connections (int): Connections to open.
+        senders (int): How many of them send (default: all).
+        messages (int): Messages sent by every sender.
+        message_size (int): Bytes of padding per message.
+        rate (float): Messages per second per sender, None for as fast as possible.
+        delivery_timeout (float): Longest wait for deliveries after the last message was sent.
+
+    Returns:
+        LoadTestStats: Counts, throughput and latencies.
+    """
+    return asyncio.run(load_test(host, port, connections=connections, senders=senders, messages=messages,
+                                 message_size=message_size, rate=rate, codec=codec,
+                                 delivery_timeout=delivery_timeout))
+
 if __name__ == "__main__":
-    start_client()
\ No newline at end of file
+    # python client.py                       - interactive chat
+    # python client.py load [connections] [messages per sender] [senders] [messages/s per sender]
+    if len(sys.argv) > 1 and sys.argv[1] == "load":
+        args = sys.argv[2:]
+        stats = run_load_test(connections=int(args[0]) if len(args) > 0 else LOAD_CONNECTIONS,
+                              messages=int(args[1]) if len(args) > 1 else LOAD_MESSAGES,
+                              senders=int(args[2]) if len(args) > 2 else None,
+                              rate=float(args[3]) if len(args) > 3 else None)
+        print(stats.summary())
+    else:
+        start_client()
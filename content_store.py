@@ -0,0 +1,142 @@
+# content_store.py
+# Content-addressed store of received files, so the file server does not have
+# to receive the same data twice.
+#
+# Every completed upload is hard-linked (or copied) into the store under its
+# SHA-256. An index file records the SHA-256 of every chunk of those files,
+# so single chunks can be reused too, e.g. when a new version of a file only
+# changed in a few places. Data taken from the store is always checked
+# against its hash first: files in the save directory can be changed or
+# deleted at any time, and then the store entry is simply dropped.
+
+import os
+import shutil
+import struct
+import hashlib
+import tempfile
+import threading
+
+INDEX_FILE = 'blocks.idx'
+INDEX_RECORD = struct.Struct('!32s32sQI') # Chunk SHA-256, file SHA-256, offset, length
+
+
+class ContentStore:
+    """
+    Files and their chunks, looked up by SHA-256.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.blocks = {} # Chunk digest -> (file hex digest, offset, length)
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            for offset in range(0, len(data) - INDEX_RECORD.size + 1, INDEX_RECORD.size):
+                block, file_hash, block_offset, length = INDEX_RECORD.unpack_from(data, offset)
+                self.blocks.setdefault(block, (file_hash.hex(), block_offset, length))
+
+    def file_path(self, file_hash):
+        return os.path.join(self.directory, file_hash)
+
+    def add_file(self, path, file_hash, chunk_size, block_hashes):
+        """
+        Adds a complete file to the store.
+
+        Args:
+            path (str): The file, which is hard-linked into the store if possible.
+            file_hash (str): Hex SHA-256 of the file.
+            chunk_size (int): Size of the chunks in block_hashes.
+            block_hashes (list): SHA-256 digest of every chunk.
+        """
+        stored = self.file_path(file_hash)
+        with self.lock:
+            if not os.path.exists(stored):
+                try:
+                    os.link(path, stored)
+                except OSError: # Other file system, or no hard links
+                    shutil.copyfile(path, stored)
+            size = os.path.getsize(stored)
+            records = []
+            for index, block in enumerate(block_hashes):
+                if block not in self.blocks:
+                    offset = index * chunk_size
+                    length = min(chunk_size, size - offset)
+                    self.blocks[block] = (file_hash, offset, length)
+                    records.append(INDEX_RECORD.pack(block, bytes.fromhex(file_hash), offset, length))
+            if records:
+                with open(self.index_path, 'ab') as f:
+                    f.write(b''.join(records))
+
+    def read_block(self, block_hash):
+        """
+        Returns the data of a chunk with this SHA-256 digest, or None if the
+        store does not have it (any more).
+        """
+        with self.lock:
+            entry = self.blocks.get(block_hash)
+        if entry is None:
+            return None
+        file_hash, offset, length = entry
+        try:
+            with open(self.file_path(file_hash), 'rb') as f:
+                f.seek(offset)
+                data = f.read(length)
+        except OSError:
+            data = b''
+        if len(data) != length or hashlib.sha256(data).digest() != block_hash:
+            with self.lock:
+                self.blocks.pop(block_hash, None)
+            return None
+        return data
+
+    def copy_file(self, file_hash, destination):
+        """
+        Copies the file with this SHA-256 to destination, atomically.
+
+        Returns:
+            bool: False if the store does not have the file (any more).
+        """
+        stored = self.file_path(file_hash)
+        directory = os.path.dirname(destination) or '.'
+        try:
+            source = open(stored, 'rb')
+        except OSError:
+            return False
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(destination)}.", suffix='.part')
+        try:
+            with source, open(fd, 'wb') as f:
+                for block in iter(lambda: source.read(1024 * 1024), b''):
+                    digest.update(block)
+                    f.write(block)
+            if digest.hexdigest() != file_hash:
+                # The file was changed after it was stored
+                os.remove(temp_path)
+                with self.lock:
+                    if os.path.exists(stored):
+                        os.remove(stored)
+                return False
+            os.replace(temp_path, destination)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return True
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_content_store(directory):
+    """
+    Returns the ContentStore for a directory, creating it the first time.
+    """
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            store = _stores[directory] = ContentStore(directory)
+        return store
@@ -1,7 +1,9 @@
-import ipaddress
+from ipaddr import check_ip
 
 def validate_ip_address(ip_string):
-    return False
+    # True for a valid IPv4 or IPv6 address; ipaddr.validate_lines checks whole files
+    address, _, _ = check_ip(ip_string)
+    return address is not None
 
 
 def calculate_wealth(assets, liabilities):
@@ -0,0 +1,239 @@
+# icmp.py
+# In-process ICMP echo ("ping") without starting the ping command.
+#
+# One socket is shared by all probes: every echo request gets its own sequence
+# number, replies are matched back to the request by (address, sequence) and
+# the round-trip time is measured in this process.
+
+import os
+import socket
+import struct
+import select
+import threading
+import time
+import itertools
+from array import array
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+PAYLOAD = b'python-day4-icmp' * 2 # 32 bytes, like the Windows ping default
+RECV_BUFFER_SIZE = 4 * 1024 * 1024 # Room for lots of replies arriving at once
+DRAIN_EVERY = 32 # Read waiting replies after this many requests are sent
+
+# Different probers in the same process get different identifiers
+_identifiers = itertools.count(os.getpid() & 0xFFFF)
+
+
+def checksum(data):
+    """
+    Internet checksum (RFC 1071) of the given bytes.
+
+    The words are summed in native byte order and the result is packed back
+    in native byte order, which gives the right bytes on any machine.
+    """
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(array('H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def is_ipv4_address(host):
+    """
+    True if host is an IPv4 address in dotted decimal notation.
+    """
+    try:
+        socket.inet_pton(socket.AF_INET, host)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def build_echo_request(identifier, sequence, payload=PAYLOAD):
+    """
+    Builds an ICMP echo request packet.
+    """
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    packet_checksum = checksum(header + payload)
+    return header[:2] + struct.pack('H', packet_checksum) + header[4:] + payload
+
+
+def open_icmp_socket():
+    """
+    Opens an ICMP socket. Tries a raw socket first (needs root or CAP_NET_RAW)
+    and falls back to the unprivileged datagram ICMP socket Linux offers when
+    the user's group is in net.ipv4.ping_group_range.
+
+    Returns:
+        tuple: (socket, bool is_raw)
+
+    Raises:
+        OSError: If neither kind of ICMP socket can be opened.
+    """
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), True
+    except PermissionError:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False
+
+
+class IcmpProber:
+    """
+    Sends ICMP echo requests to many hosts over a single socket.
+
+    Calls are serialized with a lock because the socket and the table of
+    outstanding requests are shared.
+    """
+
+    def __init__(self):
+        self.sock, self.is_raw = open_icmp_socket()
+        self.sock.setblocking(False)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+        except OSError:
+            pass # Keep the default buffer size
+        # Datagram ICMP sockets get their identifier from the kernel
+        self.identifier = next(_identifiers) & 0xFFFF
+        self._sequence = 0
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _next_sequence(self):
+        self._sequence = (self._sequence + 1) & 0xFFFF
+        return self._sequence
+
+    def ping(self, host, count=1, timeout=1, resolver=None):
+        """
+        Pings a single host.
+
+        Returns:
+            tuple: (list rtts, str error) - see ping_many.
+        """
+        return self.ping_many([host], count=count, timeout=timeout, resolver=resolver)[host]
+
+    def ping_many(self, host_list, count=1, timeout=1, resolver=None):
+        """
+        Pings all hosts at the same time.
+
+        Every host is sent `count` echo requests. Replies are collected until
+        all of them arrived or `timeout` seconds passed since the last request
+        of a round was sent.
+
+        Args:
+            host_list (list): IPv4 addresses or hostnames.
+            count (int): Number of echo requests per host.
+            timeout (float): Time to wait for replies, in seconds.
+            resolver (ResolverCache): Resolves the hostnames, all at once and
+                cached (see resolver.py). Without one they are looked up one
+                by one with gethostbyname. IPv4 addresses are never looked up.
+
+        Returns:
+            dict: host -> (list rtts, str error). rtts holds one entry per
+            request, the round-trip time in milliseconds or None if it was lost.
+            error is None, or a message if the host could not be pinged at all.
+        """
+        results = {}
+        addresses = {}
+        names = []
+        for host in dict.fromkeys(host_list):
+            results[host] = ([None] * count, None)
+            if is_ipv4_address(host):
+                addresses[host] = host
+            else:
+                names.append(host)
+        if names:
+            for host, (address, error) in self._resolve(names, resolver).items():
+                if address is not None and not is_ipv4_address(address):
+                    error = f"{host} has no IPv4 address"
+                if error is None:
+                    addresses[host] = address
+                else:
+                    results[host] = ([None] * count, error)
+
+        with self.lock:
+            for round_number in range(count):
+                # outstanding (address, sequence) -> (host, send time)
+                pending = {}
+                for sent, (host, address) in enumerate(addresses.items(), 1):
+                    sequence = self._next_sequence()
+                    packet = build_echo_request(self.identifier, sequence)
+                    pending[(address, sequence)] = (host, self._send(packet, address, pending, results, round_number))
+                    if sent % DRAIN_EVERY == 0:
+                        # Read replies as we go so the receive buffer does not overflow
+                        self._receive(pending, results, round_number)
+                deadline = time.perf_counter() + timeout
+                while pending:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    readable, _, _ = select.select([self.sock], [], [], remaining)
+                    if readable:
+                        self._receive(pending, results, round_number)
+        return results
+
+    @staticmethod
+    def _resolve(names, resolver):
+        # host -> (address, error), like ResolverCache.resolve_many
+        if resolver is not None:
+            return resolver.resolve_many(names)
+        resolved = {}
+        for host in names:
+            try:
+                resolved[host] = (socket.gethostbyname(host), None)
+            except (socket.gaierror, UnicodeError) as e:
+                resolved[host] = (None, f"Cannot resolve {host}: {e}")
+        return resolved
+
+    def _send(self, packet, address, pending, results, round_number):
+        """
+        Sends one packet, reading replies while the send buffer is full.
+        Returns the send time.
+        """
+        while True:
+            try:
+                sent_at = time.perf_counter()
+                self.sock.sendto(packet, (address, 0))
+                return sent_at
+            except (BlockingIOError, InterruptedError):
+                readable, _, _ = select.select([self.sock], [self.sock], [], 1)
+                if readable:
+                    self._receive(pending, results, round_number)
+            except OSError:
+                # e.g. network unreachable - the request is simply lost
+                return sent_at
+
+    def _receive(self, pending, results, round_number):
+        """
+        Reads every reply that is waiting on the socket and records its RTT.
+        """
+        while True:
+            try:
+                data, (address, _) = self.sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            received_at = time.perf_counter()
+
+            if self.is_raw:
+                data = data[(data[0] & 0x0F) * 4:] # Skip the IP header
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, identifier, sequence = struct.unpack('!BBHHH', data[:8])
+            if icmp_type != ICMP_ECHO_REPLY:
+                continue
+            if self.is_raw and identifier != self.identifier:
+                continue # A reply for some other program
+
+            entry = pending.pop((address, sequence), None)
+            if entry is None:
+                continue # Late or duplicate reply
+            host, sent_at = entry
+            results[host][0][round_number] = (received_at - sent_at) * 1000
@@ -1,10 +1,398 @@
 import ipaddress
+import socket
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
 
 def is_private_ip(ip_str):
     # Checks if a given IP address string is a provate (LAN) IP address
 
     try:
         ip = ipaddress.ip_address(ip_str)
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped # ::ffff:a.b.c.d is private if a.b.c.d is, as in newer Pythons
         return ip.is_private
     except ValueError:
-        return False # Not a valid IP address 
\ No newline at end of file
+        return False # Not a valid IP address
+
+IPV4_MAPPED = 0xffff << 32 # First IPv4-mapped IPv6 address, ::ffff:0.0.0.0
+
+# What is_private checks in Python 3.13: (networks, exceptions) per IP version. Only used when the
+# running ipaddress module does not have these lists where _private_networks() looks for them.
+_IS_PRIVATE_TABLES = (
+    (['0.0.0.0/8', '10.0.0.0/8', '127.0.0.0/8', '169.254.0.0/16', '172.16.0.0/12', '192.0.0.0/24',
+      '192.0.0.170/31', '192.0.2.0/24', '192.168.0.0/16', '198.18.0.0/15', '198.51.100.0/24', '203.0.113.0/24',
+      '240.0.0.0/4', '255.255.255.255/32'],
+     ['192.0.0.9/32', '192.0.0.10/32']),
+    (['::1/128', '::/128', '::ffff:0:0/96', '64:ff9b:1::/48', '100::/64', '2001::/23', '2001:db8::/32',
+      '2002::/16', 'fc00::/7', 'fe80::/10'],
+     ['2001:1::1/128', '2001:1::2/128', '2001:3::/32', '2001:4:112::/48', '2001:20::/28', '2001:30::/28']),
+)
+
+def _is_private_tables():
+    # The (networks, exceptions) of is_private per IP version. They are read from the
+    # ipaddress module of the running Python so both agree, but that is a private detail
+    # of the module; _IS_PRIVATE_TABLES is used where it is missing.
+    tables = []
+    for address_class, (networks, exceptions) in zip((ipaddress.IPv4Address, ipaddress.IPv6Address),
+                                                     _IS_PRIVATE_TABLES):
+        constants = getattr(address_class, '_constants', None)
+        private = getattr(constants, '_private_networks', None)
+        if private is None:
+            tables.append(([ipaddress.ip_network(cidr) for cidr in networks],
+                           [ipaddress.ip_network(cidr) for cidr in exceptions]))
+        else:
+            tables.append((private, getattr(constants, '_private_networks_exceptions', ())))
+    return tables
+
+def _private_networks(tables=None):
+    # The networks is_private checks, minus its exceptions. The IPv4-mapped
+    # range is left out: IpClassifier looks those up as IPv4.
+    networks = []
+    for private, exceptions in tables or _is_private_tables():
+        for network in private:
+            if network.version == 6 and int(network.network_address) == IPV4_MAPPED:
+                continue
+            parts = [network]
+            for exception in exceptions:
+                parts = [rest for part in parts if not part.subnet_of(exception)
+                         for rest in (part.address_exclude(exception) if exception.subnet_of(part) else [part])]
+            networks += (str(part) for part in parts)
+    return networks
+
+# The ranges ipaddress treats as private (is_private), plus a few other special ranges.
+# More specific networks win, so user lists can override parts of these.
+PRIVATE_NETWORKS = _private_networks()
+SHARED_NETWORKS = ['100.64.0.0/10'] # Carrier-grade NAT
+MULTICAST_NETWORKS = ['224.0.0.0/4', 'ff00::/8']
+
+PRIVATE = 'private'
+SHARED = 'shared'
+MULTICAST = 'multicast'
+INVALID = 'invalid' # Label for strings that are not IP addresses
+
+def address_to_int(ip_str):
+    """
+    Converts an IPv4 or IPv6 address string to (version, integer).
+
+    Returns:
+        tuple: (4 or 6, int), or (None, None) if it is not a valid address.
+    """
+    try:
+        if ':' in ip_str:
+            if '%' in ip_str:
+                ip_str = ip_str.split('%', 1)[0] # Drop the IPv6 scope id
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip_str), 'big')
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip_str), 'big')
+    except (OSError, ValueError, TypeError):
+        return None, None
+
+class IpClassifier:
+    """
+    Classifies many IP addresses against labelled networks at once.
+
+    The networks are flattened into sorted, non-overlapping intervals (one
+    index per IP version), where every interval carries the label of the most
+    specific network covering it. Looking up an address is then one binary
+    search, and addresses are converted to integers with inet_pton instead of
+    building an ipaddress object for each one. IPv4-mapped IPv6 addresses
+    (::ffff:a.b.c.d) get the label of their IPv4 address.
+    """
+
+    def __init__(self, include_defaults=True):
+        self.networks = [] # (network, label)
+        self.labels = [None] # Label of every code, code 0 is "no match"
+        self._index = None
+        if include_defaults:
+            self.add_networks(PRIVATE_NETWORKS, PRIVATE)
+            self.add_networks(SHARED_NETWORKS, SHARED)
+            self.add_networks(MULTICAST_NETWORKS, MULTICAST)
+
+    def add_network(self, cidr, label):
+        """
+        Adds a network like '10.1.0.0/16' or '2001:db8::/48' with a label.
+        """
+        self.networks.append((ipaddress.ip_network(cidr, strict=False), label))
+        if label not in self.labels:
+            self.labels.append(label)
+        self._index = None
+
+    def add_networks(self, cidrs, label):
+        for cidr in cidrs:
+            self.add_network(cidr, label)
+
+    def load_networks(self, filename, label):
+        """
+        Adds the networks listed in a file, one per line. Empty lines and
+        everything after a '#' are ignored.
+        """
+        with open(filename) as f:
+            self.add_networks((cidr for cidr in (line.split('#', 1)[0].strip() for line in f) if cidr), label)
+
+    def label_code(self, label):
+        return self.labels.index(label)
+
+    def _build(self):
+        # Sorted interval starts and the label code from each start on, per IP version
+        index = {}
+        for version in (4, 6):
+            networks = sorted(((int(net.network_address), int(net.broadcast_address), self.labels.index(label))
+                               for net, label in self.networks if net.version == version),
+                              key=lambda item: (item[0], -item[1]))
+            starts, codes = [], []
+
+            def mark(position, code):
+                if starts and starts[-1] == position:
+                    codes[-1] = code
+                else:
+                    starts.append(position)
+                    codes.append(code)
+                if len(codes) > 1 and codes[-1] == codes[-2]:
+                    starts.pop()
+                    codes.pop()
+
+            open_networks = [] # Networks containing the current position, innermost last
+            for start, end, code in networks:
+                while open_networks and open_networks[-1][1] < start:
+                    _, closed_end, _ = open_networks.pop()
+                    mark(closed_end + 1, open_networks[-1][2] if open_networks else 0)
+                open_networks.append((start, end, code))
+                mark(start, code)
+            while open_networks:
+                _, closed_end, _ = open_networks.pop()
+                mark(closed_end + 1, open_networks[-1][2] if open_networks else 0)
+            if not starts or starts[0] != 0:
+                starts.insert(0, 0)
+                codes.insert(0, 0)
+            if version == 6:
+                # The IPv4-mapped range holds a copy of the IPv4 intervals
+                starts4, codes4 = index[4]
+                end = IPV4_MAPPED + (1 << 32)
+                after = codes[bisect_right(starts, end) - 1]
+                first, last = bisect_left(starts, IPV4_MAPPED), bisect_left(starts, end)
+                starts[first:last] = [IPV4_MAPPED + start for start in starts4]
+                codes[first:last] = codes4
+                if first + len(starts4) == len(starts) or starts[first + len(starts4)] != end:
+                    starts.insert(first + len(starts4), end)
+                    codes.insert(first + len(starts4), after)
+            # Plain lists: bisect on a list is faster than on an array, which has to box every item it looks at
+            index[version] = (starts, codes)
+        self._index = index
+        return index
+
+    def classify(self, ip_str):
+        """
+        Returns the label of the most specific network containing the address,
+        None if there is none, or INVALID if it is not an IP address.
+        """
+        version, value = address_to_int(ip_str)
+        if version is None:
+            return INVALID
+        starts, codes = (self._index or self._build())[version]
+        return self.labels[codes[bisect_right(starts, value) - 1]]
+
+    def classify_many(self, addresses):
+        """
+        Classifies an iterable of address strings.
+
+        Returns:
+            list: The label of every address, like classify().
+        """
+        index = self._index or self._build()
+        starts4, codes4 = index[4]
+        starts6, codes6 = index[6]
+        labels = self.labels
+        inet_pton, from_bytes, AF_INET = socket.inet_pton, int.from_bytes, socket.AF_INET
+        result = []
+        append = result.append
+        for ip_str in addresses:
+            try:
+                if ':' not in ip_str:
+                    append(labels[codes4[bisect_right(starts4, from_bytes(inet_pton(AF_INET, ip_str), 'big')) - 1]])
+                    continue
+            except (OSError, TypeError):
+                append(INVALID)
+                continue
+            version, value = address_to_int(ip_str)
+            append(INVALID if version is None else labels[codes6[bisect_right(starts6, value) - 1]])
+        return result
+
+    def classify_ints(self, values, version=4):
+        """
+        Classifies addresses that are already integers.
+
+        Returns:
+            array: The label code of every address, see self.labels.
+        """
+        starts, codes = (self._index or self._build())[version]
+        return array('H', [codes[bisect_right(starts, value) - 1] for value in values])
+
+    def classify_packed(self, data, version=4):
+        """
+        Classifies packed addresses: 4 (IPv4) or 16 (IPv6) bytes each in
+        network byte order, e.g. straight from a flow log or a socket.
+
+        Returns:
+            array: The label code of every address, see self.labels.
+        """
+        if version == 4:
+            values = array('I') # 4 bytes on all common platforms
+            values.frombytes(data)
+            if socket.htonl(1) != 1: # Little-endian machine
+                values.byteswap()
+            return self.classify_ints(values, 4)
+        view = memoryview(data)
+        return self.classify_ints((int.from_bytes(view[i:i + 16], 'big') for i in range(0, len(view), 16)), 6)
+
+_default_classifier = None
+
+def get_default_classifier():
+    """
+    Returns a shared IpClassifier with the default networks.
+    """
+    global _default_classifier
+    if _default_classifier is None:
+        _default_classifier = IpClassifier()
+    return _default_classifier
+
+def are_private_ips(ip_strs):
+    """
+    Batch version of is_private_ip: returns a list of bools, one per address.
+    """
+    return [label == PRIVATE for label in get_default_classifier().classify_many(ip_strs)]
+
+# Validation
+
+_IPV4 = re.compile(r'(?:(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])\.){3}(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])')
+_HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+
+ValidatedAddress = namedtuple('ValidatedAddress', ['line', 'text', 'address', 'error', 'position'])
+ValidatedAddress.__doc__ = """
+One checked entry: the line number, the text (without surrounding whitespace),
+the normalized address or None, and for invalid entries the error message and
+the position of the offending character in text.
+"""
+
+def _ipv4_error(text, offset=0):
+    # Returns (error, position) for an invalid IPv4 address
+    position = 0
+    parts = text.split('.')
+    for number, part in enumerate(parts):
+        if number == 4:
+            return "IPv4 address has more than 4 octets", offset + position - 1
+        for i, char in enumerate(part):
+            if not '0' <= char <= '9':
+                return f"Unexpected character {char!r}", offset + position + i
+        if not part:
+            return "Empty octet", offset + position
+        if len(part) > 1 and part[0] == '0':
+            return "Octet with a leading zero", offset + position
+        if int(part) > 255:
+            return "Octet is bigger than 255", offset + position
+        position += len(part) + 1
+    if len(parts) < 4:
+        return "IPv4 address has fewer than 4 octets", offset + len(text)
+    return "Invalid IPv4 address", offset
+
+def _ipv6_error(text):
+    # Returns (error, position) for an invalid IPv6 address
+    address, _, scope = text.partition('%')
+    if '%' in text and not scope:
+        return "Empty scope id", len(text)
+    double_colon = address.find('::')
+    if double_colon != -1 and address.find('::', double_colon + 1) != -1:
+        return "More than one '::'", address.find('::', double_colon + 1)
+    groups = 0
+    position = 0
+    parts = address.split(':')
+    for number, part in enumerate(parts):
+        if '.' in part:
+            if number != len(parts) - 1:
+                return "Embedded IPv4 address is not at the end", position
+            error = _ipv4_error(part, position)
+            if _IPV4.fullmatch(part) is None:
+                return error
+            groups += 2
+            break
+        for i, char in enumerate(part):
+            if char not in _HEX_DIGITS:
+                return f"Unexpected character {char!r}", position + i
+        if len(part) > 4:
+            return "Group has more than 4 hex digits", position
+        if part:
+            groups += 1
+        elif 0 < number < len(parts) - 1 and position - 1 != double_colon and position - 2 != double_colon:
+            return "Empty group", position
+        position += len(part) + 1
+    if address.startswith(':') and not address.startswith('::'):
+        return "Address starts with a single ':'", 0
+    if address.endswith(':') and not address.endswith('::'):
+        return "Address ends with a single ':'", len(address) - 1
+    if groups > 8 or (groups == 8 and double_colon != -1):
+        return "IPv6 address has too many groups", len(address)
+    if groups < 8 and double_colon == -1:
+        return "IPv6 address has fewer than 8 groups", len(address)
+    return "Invalid IPv6 address", 0
+
+def check_ip(text):
+    """
+    Validates and normalizes one IP address, without raising exceptions.
+
+    IPv4 addresses must be four decimal octets without leading zeros, like
+    ipaddress accepts them. IPv6 addresses are normalized to the same string
+    as str(ipaddress.ip_address(text)) (compressed lower-case, RFC 5952) and
+    keep their scope id, if any. Anything but a str is invalid.
+
+    Returns:
+        tuple: (normalized address, None, None) if it is valid, otherwise
+        (None, error message, position of the offending character).
+    """
+    if not isinstance(text, str):
+        return None, "Not a string", 0
+    if _IPV4.fullmatch(text) is not None:
+        return text, None, None # Already normal: no leading zeros possible
+    if ':' not in text:
+        if not text:
+            return None, "Empty address", 0
+        return (None,) + _ipv4_error(text)
+    address, percent, scope = text.partition('%')
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, address)
+    except (OSError, ValueError):
+        return (None,) + _ipv6_error(text)
+    if percent and not scope:
+        return None, "Empty scope id", len(text)
+    normalized = socket.inet_ntop(socket.AF_INET6, packed)
+    if '.' in normalized:
+        # inet_ntop writes ::ffff:a.b.c.d and ::a.b.c.d in mixed notation; ipaddress only
+        # does for the first one, and only since Python 3.13, so let it decide
+        normalized = str(ipaddress.IPv6Address(packed))
+    return normalized + percent + scope, None, None
+
+def validate_lines(lines, first_line=1):
+    """
+    Validates addresses from an iterable of lines (e.g. an open file), one per
+    line. Surrounding whitespace, empty lines and lines starting with '#' are
+    skipped. Bad entries are reported, not raised.
+
+    Yields:
+        ValidatedAddress: One per address line.
+    """
+    ipv4_match = _IPV4.fullmatch
+    new = tuple.__new__ # Skips the Python-level __new__ of the namedtuple
+    for number, line in enumerate(lines, first_line):
+        text = line.strip()
+        if not text or text[0] == '#':
+            continue
+        if ipv4_match(text) is not None:
+            yield new(ValidatedAddress, (number, text, text, None, None))
+        else:
+            yield new(ValidatedAddress, (number, text) + check_ip(text))
+
+def validate_file(filename):
+    """
+    Validates the addresses in a file, see validate_lines().
+    """
+    with open(filename, encoding='utf-8', errors='replace') as f:
+        yield from validate_lines(f)
@@ -0,0 +1,470 @@
+# metrics.py
+# Runtime numbers for the monitor and the servers: counters, gauges and
+# latency histograms, exported in the Prometheus text format over HTTP and to
+# a snapshot file, plus an opt-in sampling profiler.
+#
+# Recording has to be cheap enough for the hottest loops, so counters and
+# histograms take no lock: every thread adds to its own cell, and the cells
+# are only summed up when the metrics are read. The cells of threads that
+# have ended are added to a base total and dropped.
+#
+#   PROBES = metrics.counter("ping_probes_total", "Pings sent", result="success")
+#   PROBES.inc()
+#   metrics.start_http_server(9108)  # curl http://127.0.0.1:9108/metrics
+
+import os
+import sys
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter as _StackCounter
+
+# Upper bounds in seconds of the default histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_PORT = 9108
+SNAPSHOT_INTERVAL = 15.0 # Seconds between two snapshot files
+PROFILE_INTERVAL = 0.01 # Seconds between two profiler samples
+COMPACT_CELLS = 64 # Cells of a metric before those of ended threads are folded together
+
+
+class _PerThread:
+    """
+    One list of numbers per thread. Only the owning thread writes to its list,
+    so no lock is needed; readers add up all of them.
+
+    A thread that has ended writes nothing any more, so its list is added to
+    `base` and dropped. This happens when the metric is read, and when a new
+    list would make the lists twice as many as after the last time, so a
+    server starting a thread per client keeps only the lists of live threads.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.local = threading.local()
+        self.cells = [] # (thread, cell)
+        self.base = [0] * size # Totals of the threads that have ended
+        self.compact_at = COMPACT_CELLS
+        self.lock = threading.Lock()
+
+    def new_cell(self):
+        cell = [0] * self.size
+        self.local.cell = cell
+        with self.lock:
+            self.cells.append((threading.current_thread(), cell))
+            if len(self.cells) >= self.compact_at:
+                self._compact()
+                self.compact_at = max(COMPACT_CELLS, 2 * len(self.cells))
+        return cell
+
+    def _compact(self):
+        # Called with the lock held
+        alive = []
+        for thread, cell in self.cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+            else:
+                self.base = [total + value for total, value in zip(self.base, cell)]
+        self.cells = alive
+
+    def totals(self):
+        with self.lock:
+            self._compact()
+            cells = [cell for _, cell in self.cells]
+            base = self.base
+        return [sum(values) for values in zip(base, *cells)]
+
+
+class Counter:
+    """
+    A number that only goes up, e.g. messages sent.
+    """
+    type = "counter"
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._cells = _PerThread(1)
+        self._local = self._cells.local
+
+    def inc(self, amount=1):
+        try:
+            self._local.cell[0] += amount
+        except AttributeError: # First use in this thread
+            self._cells.new_cell()[0] += amount
+
+    @property
+    def value(self):
+        return self._cells.totals()[0]
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Gauge:
+    """
+    A number that goes up and down, e.g. connected clients. With a function
+    the value is read from it whenever the metrics are collected.
+    """
+    type = "gauge"
+
+    def __init__(self, name, help, labels, function=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.function = function
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self):
+        return self.function() if self.function is not None else self._value
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Histogram:
+    """
+    Counts observations (e.g. latencies in seconds) in fixed buckets.
+    """
+    type = "histogram"
+
+    def __init__(self, name, help, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket, one for "bigger than all buckets", then the sum
+        self._cells = _PerThread(len(self.buckets) + 2)
+        self._local = self._cells.local
+
+    def observe(self, value):
+        try:
+            cell = self._local.cell
+        except AttributeError: # First use in this thread
+            cell = self._cells.new_cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self):
+        """
+        Context manager that observes how long its block took.
+        """
+        return _Timer(self)
+
+    def samples(self):
+        totals = self._cells.totals()
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), totals):
+            cumulative += count
+            yield self.name + "_bucket", dict(self.labels, le=_format_value(bound)), cumulative
+        yield self.name + "_count", self.labels, cumulative
+        yield self.name + "_sum", self.labels, totals[-1]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class NullMetric:
+    """
+    Stands in for any metric and records nothing.
+    """
+    value = 0
+
+    def inc(self, amount=1):
+        pass
+
+    dec = inc
+    set = inc
+    observe = inc
+
+    def time(self):
+        return _NULL_TIMER
+
+    def samples(self):
+        return iter(())
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) + ".0"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+class Registry:
+    """
+    All metrics of the process, by name and labels.
+    """
+
+    def __init__(self):
+        self.metrics = {} # (name, sorted labels) -> metric
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **options):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = self.metrics[key] = cls(name, help, labels, **options)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, help, **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, function=None, **labels):
+        gauge = self._get(Gauge, name, help, labels)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        described = set()
+        for metric in metrics:
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.type}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            except Exception as e: # A broken gauge function must not break the whole page
+                logging.warning(f"Could not read metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, **labels):
+    """
+    Returns the counter with this name and labels, creating it on first use.
+    """
+    return REGISTRY.counter(name, help, **labels)
+
+
+def gauge(name, help, function=None, **labels):
+    """
+    Returns the gauge with this name and labels, creating it on first use.
+    """
+    return REGISTRY.gauge(name, help, function=function, **labels)
+
+
+def histogram(name, help, buckets=DEFAULT_BUCKETS, **labels):
+    """
+    Returns the histogram with this name and labels, creating it on first use.
+    """
+    return REGISTRY.histogram(name, help, buckets=buckets, **labels)
+
+
+# Exporting
+# http.server and tempfile are imported when they are first used: every tool
+# imports this module, most never export anything.
+
+def _metrics_handler(registry):
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] == '/metrics':
+                body = registry.render().encode('utf-8')
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif self.path.split('?')[0] == '/profile' and _profiler is not None:
+                body = _profiler.render().encode('utf-8')
+                content_type = "text/plain; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # No log line per scrape
+
+    return MetricsHandler
+
+
+def start_http_server(port=METRICS_PORT, host='127.0.0.1', registry=REGISTRY):
+    """
+    Serves the metrics at http://host:port/metrics (and the profile at
+    /profile, if the profiler runs) from a background thread.
+
+    Returns:
+        ThreadingHTTPServer: Call shutdown() on it to stop serving.
+    """
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer((host, port), _metrics_handler(registry))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def write_snapshot(filename, registry=REGISTRY):
+    """
+    Writes all metrics to a file in the Prometheus text format, atomically,
+    e.g. for the node_exporter textfile collector.
+    """
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".metrics.", suffix=".tmp")
+    try:
+        with open(fd, 'w') as f:
+            f.write(registry.render())
+        os.replace(temp_path, filename)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def start_snapshots(filename, interval=SNAPSHOT_INTERVAL, registry=REGISTRY, stop_event=None):
+    """
+    Writes a snapshot file every `interval` seconds from a background thread
+    until stop_event is set.
+
+    Returns:
+        threading.Event: The stop event.
+    """
+    stop_event = stop_event or threading.Event()
+
+    def run():
+        while not stop_event.wait(interval):
+            try:
+                write_snapshot(filename, registry)
+            except OSError as e:
+                logging.error(f"Could not write metrics snapshot {filename}: {e}")
+        write_snapshot(filename, registry)
+
+    threading.Thread(target=run, name="metrics-snapshot", daemon=True).start()
+    return stop_event
+
+
+# Profiling
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads every `interval` seconds and counts
+    them, so the hot spots of a running process can be seen without
+    instrumenting anything. Costs nothing until it is started.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = _StackCounter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def render(self, limit=None):
+        """
+        Returns the samples in the "collapsed stack" format (one line per
+        stack with its count) that flame graph tools read.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common(limit))
+
+
+_profiler = None
+
+
+def start_profiler(interval=PROFILE_INTERVAL):
+    """
+    Starts the shared sampling profiler (opt-in). Its samples are served at
+    /profile by start_http_server.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler(interval).start()
+    return _profiler
+
+
+def stop_profiler():
+    """
+    Stops the shared profiler and returns it, with its samples, or None.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
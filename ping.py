@@ -1,20 +1,114 @@
-import subprocess
-import platform
-import re
+import os
 import logging
 import time
+import threading
+import atexit
 
 import csv
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-import smtplib
-from email.mime.text import MIMEText
+# asyncio, subprocess, smtplib/email and alerts take longer to import than
+# everything else together, so the functions that need them import them: a
+# single ping over ICMP (e.g. from cron) never loads them.
 
-import schedule
+import icmp
+import metrics
+from ping_result import PingResult
+from resolver import ResolverCache
+from result_sink import CSV_HEADER, CsvResultSink, result_to_row
+from ping_scheduler import HostScheduler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+IS_WINDOWS = os.name == 'nt' # Same as platform.system() == 'Windows', without importing platform
+
+# How many pings a sweep keeps running at the same time
+DEFAULT_MAX_IN_FLIGHT = 512
+
+# 'auto' pings from inside this process over an ICMP socket when one can be
+# opened and falls back to the ping command otherwise.
+# 'subprocess' always runs the ping command.
+PING_BACKEND = 'auto'
+
+# Resolve host names through a shared ResolverCache and ping the addresses,
+# so DNS lookups are not part of any ping (or its latency).
+RESOLVE_HOSTNAMES = True
+
+# Runtime numbers, see metrics.py
+PROBES = {outcome: metrics.counter("ping_probes_total", "Hosts probed, by outcome", result=outcome)
+          for outcome in ("success", "failure", "unresolved")}
+RTT_SECONDS = metrics.histogram("ping_rtt_seconds", "Average round-trip time of successful probes")
+SWEEP_SECONDS = metrics.histogram("ping_sweep_seconds", "Time taken by a whole sweep",
+                                  buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+_icmp_prober = None
+_icmp_executor = None # Runs the ICMP round of sweeps, see _sweep()
+_icmp_unavailable = False
+_icmp_lock = threading.Lock()
+_resolver = None
+
+
+def build_ping_command(host, count=1, timeout=1):
+    """
+    Builds the platform-specific ping command line for a host.
+    """
+    param = '-n' if IS_WINDOWS else '-c'
+    timeout_param = '-w' if IS_WINDOWS else '-W'
+    return ['ping', param, str(count), timeout_param, str(timeout), host]
+
+
+def get_icmp_prober():
+    """
+    Returns the shared in-process ICMP prober, or None if the ping command
+    has to be used instead.
+    """
+    global _icmp_prober, _icmp_unavailable
+    if PING_BACKEND != 'auto' or IS_WINDOWS or _icmp_unavailable:
+        return None
+    with _icmp_lock:
+        if _icmp_prober is None and not _icmp_unavailable:
+            try:
+                _icmp_prober = icmp.IcmpProber()
+            except OSError as e:
+                logging.info(f"In-process ICMP is not available ({e}), using the ping command instead.")
+                _icmp_unavailable = True
+    return _icmp_prober
+
+
+def get_resolver():
+    """
+    Returns the shared ResolverCache, or None if RESOLVE_HOSTNAMES is off.
+    """
+    global _resolver
+    if not RESOLVE_HOSTNAMES:
+        return None
+    with _icmp_lock:
+        if _resolver is None:
+            _resolver = ResolverCache()
+    return _resolver
+
+
+def _record_result(result):
+    if not result.resolved:
+        PROBES["unresolved"].inc()
+    elif result.success:
+        PROBES["success"].inc()
+        if result.avg == result.avg: # Not NaN
+            RTT_SECONDS.observe(result.avg / 1000)
+    else:
+        PROBES["failure"].inc()
+    return result
+
+
+def _log_result(result):
+    if result.success:
+        logging.info(f"Ping successful for {result.host}.")
+    else:
+        logging.warning(f"Ping failed for {result.host}.")
+        logging.debug(f"Ping output for {result.host}:\n{result.summary()}")
+
 
 def ping_host(host, count=1, timeout=1):
     """
@@ -29,10 +123,57 @@ def ping_host(host, count=1, timeout=1):
     Returns:
         tuple: (bool success, str raw_output)
     """
-    param = '-n' if platform.system().lower() == 'windows' else '-c'
-    timeout_param = '-w' if platform.system().lower() == 'windows' else '-W'
+    prober = get_icmp_prober()
+    if prober is not None:
+        rtts, error = prober.ping(host, count=count, timeout=timeout, resolver=get_resolver())
+        if error is None:
+            result = PingResult.from_rtts(host, rtts)
+            _log_result(result)
+            _record_result(result)
+            return result.success, result.summary()
+        # Could not resolve to IPv4 - let the ping command deal with it
+
+    success, raw_output = _run_ping_command(host, count=count, timeout=timeout)
+    _record_result(PingResult.from_output(host, success, raw_output, count=count))
+    return success, raw_output
 
-    command = ['ping', param, str(count), timeout_param, str(timeout), host]
+
+def probe_host(host, count=1, timeout=1, resolver=None):
+    """
+    Pings a given host and returns the outcome as a PingResult.
+
+    Args:
+        host (str): The IP address or hostname to ping.
+        count (int): The number of packets to send (default: 1).
+        timeout (int): Timeout in seconds for each packet (default: 1).
+        resolver (ResolverCache): Resolves host names first (default: get_resolver()).
+
+    Returns:
+        PingResult: Packet counts and round-trip statistics for the host.
+    """
+    resolver = resolver or get_resolver()
+    address = host
+    if resolver is not None:
+        address, error = resolver.lookup(host)
+        if address is None:
+            logging.error(f"{error}")
+            return _record_result(PingResult.unresolved(host, error, count=count))
+
+    prober = get_icmp_prober()
+    if prober is not None:
+        rtts, error = prober.ping(address, count=count, timeout=timeout)
+        if error is None:
+            result = PingResult.from_rtts(host, rtts, address=address)
+            _log_result(result)
+            return _record_result(result)
+
+    success, raw_output = _run_ping_command(address, count=count, timeout=timeout)
+    return _record_result(PingResult.from_output(host, success, raw_output, count=count, address=address))
+
+
+def _run_ping_command(host, count=1, timeout=1):
+    import subprocess
+    command = build_ping_command(host, count=count, timeout=timeout)
 
     try:
         # Run the ping command
@@ -57,11 +198,223 @@ def ping_host(host, count=1, timeout=1):
         logging.error(f"An unexpected error occurred while pinging {host}: {e}")
         return False, str(e)
 
+async def async_ping_host(host, count=1, timeout=1):
+    """
+    Asyncio version of ping_host. Runs the ping command without blocking the
+    event loop so that many hosts can be pinged at the same time.
+
+    Args:
+        host (str): The IP address or hostname to ping.
+        count (int): The number of packets to send (default: 1).
+        timeout (int): Timeout in seconds for each packet (default: 1).
+
+    Returns:
+        tuple: (bool success, str raw_output)
+    """
+    import asyncio
+    command = build_ping_command(host, count=count, timeout=timeout)
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    except FileNotFoundError:
+        logging.error("Ping command not found. Make sure ping is installed and in your PATH.")
+        return False, "FileNotFound"
+    except Exception as e:
+        logging.error(f"An unexpected error occurred while pinging {host}: {e}")
+        return False, str(e)
+
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout * (count + 2))
+    except asyncio.TimeoutError:
+        _kill_process(process)
+        await process.wait()
+        logging.error(f"Ping command timed out for {host}.")
+        return False, "TimeoutExpired"
+    except asyncio.CancelledError:
+        # The sweep ran out of time, don't leave the ping process behind
+        _kill_process(process)
+        await process.wait()
+        raise
+
+    raw_output = stdout.decode(errors='replace') + stderr.decode(errors='replace')
+
+    if process.returncode == 0:
+        logging.info(f"Ping successful for {host}.")
+        return True, raw_output
+    else:
+        logging.warning(f"Ping failed for {host}. Return code: {process.returncode}")
+        logging.debug(f"Ping output for {host}:\n{raw_output}")
+        return False, raw_output
+
+
+def _kill_process(process):
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass # Already finished
+
+
+async def sweep_hosts_async(host_list, count=1, timeout=1, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                            cycle_timeout=None, resolver=None):
+    """
+    Pings all hosts concurrently, with at most max_in_flight pings running at once.
+
+    The whole sweep is bounded by cycle_timeout (default: the time a single
+    ping_host call may take, times the number of waves of max_in_flight
+    pings the sweep needs). Hosts that were pinged but have not answered by
+    then are reported as failed with "CycleTimeout". Hosts whose ping never
+    started before the deadline were not probed at all: they are left out of
+    the results, so they are neither up nor down for the alerts and the CSV
+    log.
+
+    Args:
+        host_list (list): A list of IP addresses or hostnames to ping.
+        count (int): Number of packets per ping.
+        timeout (int): Timeout per packet.
+        max_in_flight (int): Maximum number of pings running at the same time.
+        cycle_timeout (float): Time limit in seconds for the whole sweep.
+            None sizes it to the number of hosts.
+        resolver (ResolverCache): Resolves host names before the sweep (default:
+            get_resolver()). Names that cannot be resolved are not pinged;
+            their results have resolved=False.
+
+    Returns:
+        dict: host -> PingResult for every host that was probed
+    """
+    start = time.perf_counter()
+    results = await _sweep(host_list, count, timeout, max_in_flight, cycle_timeout, resolver)
+    for result in results.values():
+        _record_result(result)
+    SWEEP_SECONDS.observe(time.perf_counter() - start)
+    return results
+
+
+async def _sweep(host_list, count, timeout, max_in_flight, cycle_timeout, resolver):
+    import asyncio
+    results = {}
+    loop = asyncio.get_running_loop()
+    resolver = resolver or get_resolver()
+    if resolver is not None:
+        # Mostly cache hits; the pings below only see addresses
+        targets = {}
+        for host, (address, error) in (await loop.run_in_executor(None, resolver.resolve_many, host_list)).items():
+            if address is None:
+                logging.error(error)
+                results[host] = PingResult.unresolved(host, error, count=count)
+            else:
+                targets[host] = address
+    else:
+        targets = {host: host for host in host_list}
+
+    # Several names can share an address, ping it once
+    hosts_by_address = {}
+    for host, address in targets.items():
+        hosts_by_address.setdefault(address, []).append(host)
+    address_list = list(hosts_by_address)
+
+    if cycle_timeout is None:
+        # Only max_in_flight pings run at once, so the hosts are pinged in waves
+        waves = -(-len(address_list) // max_in_flight)
+        cycle_timeout = timeout * (count + 2) * max(waves, 1)
+    deadline = loop.time() + cycle_timeout # For the ICMP round and the ping commands together
+
+    prober = get_icmp_prober()
+    if prober is not None and address_list:
+        # All hosts go out over the one ICMP socket, no processes needed. The round runs on an
+        # executor of its own: asyncio.run() would wait for a late one on the default executor.
+        global _icmp_executor
+        with _icmp_lock:
+            if _icmp_executor is None:
+                _icmp_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="icmp")
+        try:
+            icmp_results = await asyncio.wait_for(
+                loop.run_in_executor(_icmp_executor, prober.ping_many, address_list, count, timeout), cycle_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Sweep deadline of {cycle_timeout}s reached, {len(address_list)} host(s) did not "
+                            f"finish their ICMP round.")
+            for address in address_list:
+                for host in hosts_by_address[address]:
+                    results[host] = PingResult.from_output(host, False, "CycleTimeout", count=count, address=address)
+            return results
+        for address, (rtts, error) in icmp_results.items():
+            if error is None:
+                for host in hosts_by_address[address]:
+                    results[host] = PingResult.from_rtts(host, rtts, address=address)
+                    _log_result(results[host])
+        # Whatever could not be pinged over ICMP (e.g. IPv6) is left to the ping command
+        address_list = [address for address, (_, error) in icmp_results.items() if error is not None]
+
+    semaphore = asyncio.Semaphore(max_in_flight)
+    started = set()
+
+    async def probe(host):
+        async with semaphore:
+            started.add(host)
+            return await async_ping_host(host, count=count, timeout=timeout)
+
+    tasks = {address: asyncio.ensure_future(probe(address)) for address in address_list}
+    if not tasks:
+        return results
+    _, pending = await asyncio.wait(tasks.values(), timeout=max(0, deadline - loop.time()))
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+        not_probed = sum(1 for address, task in tasks.items() if task in pending and address not in started)
+        logging.warning(f"Sweep deadline of {cycle_timeout}s reached, {len(pending)} host(s) did not finish, "
+                        f"{not_probed} of them were not probed.")
+
+    for address, task in tasks.items():
+        if task in pending:
+            if address not in started:
+                continue # Never pinged: no result rather than a false "down"
+            success, raw_output = False, "CycleTimeout"
+        else:
+            success, raw_output = task.result()
+        for host in hosts_by_address[address]:
+            results[host] = PingResult.from_output(host, success, raw_output, count=count, address=address)
+    return results
+
+
+def sweep_hosts(host_list, count=1, timeout=1, max_in_flight=DEFAULT_MAX_IN_FLIGHT, cycle_timeout=None,
+                resolver=None):
+    """
+    Blocking wrapper around sweep_hosts_async for use from the monitor loops.
+
+    Returns:
+        dict: host -> PingResult
+    """
+    import asyncio
+    return asyncio.run(sweep_hosts_async(host_list, count=count, timeout=timeout, max_in_flight=max_in_flight,
+                                         cycle_timeout=cycle_timeout, resolver=resolver))
+
+def wait_for_next_cycle(cycle_start, interval_seconds):
+    """
+    Sleeps until interval_seconds after cycle_start (a time.monotonic() value),
+    so the time spent pinging does not stretch the cycle. If the cycle took
+    longer than the interval the missed cycles are skipped, not run back to back.
+
+    Returns:
+        float: Start time of the next cycle.
+    """
+    next_cycle = cycle_start + interval_seconds
+    now = time.monotonic()
+    if next_cycle <= now:
+        missed = int((now - cycle_start) // interval_seconds)
+        logging.warning(f"Cycle took {now - cycle_start:.1f}s, longer than the {interval_seconds}s interval. "
+                        f"Skipping {missed - 1} cycle(s).")
+        return cycle_start + missed * interval_seconds
+    logging.info(f"Waiting for {next_cycle - now:.1f} seconds before next cycle...")
+    time.sleep(next_cycle - now)
+    return next_cycle
+
 # Example usage:
 # ... (previous code for ping_host and imports) ...
 
 
-def monitor_hosts(host_list, interval_seconds=60, count=1, timeout=1):
+def monitor_hosts(host_list, interval_seconds=60, count=1, timeout=1, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                  store=None):
     """
     Continuously monitors a list of hosts.
 
@@ -70,73 +423,102 @@ def monitor_hosts(host_list, interval_seconds=60, count=1, timeout=1):
         interval_seconds (int): How often to ping each host (in seconds).
         count (int): Number of packets per ping.
         timeout (int): Timeout per packet.
+        max_in_flight (int): Maximum number of pings running at the same time.
+        store (PingStore): Optional ping_store.PingStore that keeps the history of every result.
     """
     logging.info(f"Starting host monitoring for: {host_list}")
+    next_cycle = time.monotonic()
     while True:
-        for host in host_list:
-            logging.info(f"Pinging {host}...")
-            success, output = ping_host(host, count=count, timeout=timeout)
-            if success:
-                # You might want to parse and store latency data here
-                logging.info(f"{host} is reachable.")
+        logging.info(f"Pinging {len(host_list)} hosts...")
+        results = sweep_hosts(host_list, count=count, timeout=timeout, max_in_flight=max_in_flight)
+        for host, result in results.items():
+            if store is not None:
+                store.add(result)
+            if result.success:
+                logging.info(f"{host} is reachable ({result.avg:.1f} ms).")
+            elif not result.resolved:
+                logging.error(f"{host} could not be resolved!")
             else:
                 logging.error(f"{host} is unreachable!")
                 # Add alert mechanisms here (email, SMS, etc.)
-        logging.info(f"Waiting for {interval_seconds} seconds before next cycle...")
-        time.sleep(interval_seconds)
-
-def log_ping_result_to_csv(host, success, raw_output, filename="ping_log.csv"):
-    """
-    Logs ping results to a CSV file.
-    """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    status = "Success" if success else "Failed"
-    latency = "N/A" # Default
-    packet_loss = "N/A" # Default
-
-    # Attempt to parse latency and packet loss from raw_output
-    if platform.system().lower() == 'windows':
-        latency_match = re.search(r"Average = (\d+)ms", raw_output)
-        if latency_match:
-            latency = f"{latency_match.group(1)}ms"
-        loss_match = re.search(r"Packets: Sent = \d+, Received = \d+, Lost = \d+ \((\d+)% loss\)", raw_output)
-        if loss_match:
-            packet_loss = f"{loss_match.group(1)}%"
-    else: # Linux/macOS
-        latency_match = re.search(r"min/avg/max/mdev = [\d.]+/([\d.]+)/[\d.]+/\S+ ms", raw_output)
-        if latency_match:
-            latency = f"{latency_match.group(1)}ms"
-        loss_match = re.search(r"(\d+)% packet loss", raw_output)
-        if loss_match:
-            packet_loss = f"{loss_match.group(1)}%"
-
-    data = [timestamp, host, status, latency, packet_loss, raw_output.strip().replace('\n', ' ')]
+        if store is not None:
+            store.flush()
+        next_cycle = wait_for_next_cycle(next_cycle, interval_seconds)
 
+def _append_csv_row(filename, header, row, host):
     try:
         with open(filename, 'a', newline='') as f:
             writer = csv.writer(f)
             # Write header if file is empty
             if f.tell() == 0:
-                writer.writerow(["Timestamp", "Host", "Status", "Latency", "Packet Loss", "Raw Output"])
-            writer.writerow(data)
+                writer.writerow(header)
+            writer.writerow(row)
         logging.debug(f"Logged result for {host} to {filename}")
     except Exception as e:
         logging.error(f"Error writing to CSV file {filename}: {e}")
 
+def log_result_to_csv(result, filename="ping_log.csv"):
+    """
+    Logs a single PingResult to a CSV file (columns: see result_sink.CSV_HEADER).
+    Opens and closes the file every time; for continuous monitoring use get_result_sink.
+    """
+    _append_csv_row(filename, CSV_HEADER, result_to_row(result), result.host)
+
+LEGACY_CSV_HEADER = ["Timestamp", "Host", "Status", "Latency", "Packet Loss", "Raw Output"]
+
+def log_ping_result_to_csv(host, success, raw_output, filename="ping_log.csv"):
+    """
+    Logs ping results to a CSV file, in the format it always had: latency
+    like "12.3ms", packet loss like "0%" and the raw ping output. New code
+    should hand a PingResult to log_result_to_csv or a result sink instead.
+    """
+    result = PingResult.from_output(host, success, raw_output)
+    timestamp, _, status, latency, packet_loss = result_to_row(result, include_raw_output=False)
+    row = [timestamp, host, "Success" if success else "Failed",
+           "N/A" if latency == "N/A" else latency + "ms",
+           f"{packet_loss}%" if result.sent else "N/A", raw_output.strip().replace('\n', ' ')]
+    _append_csv_row(filename, LEGACY_CSV_HEADER, row, host)
+
+_result_sinks = {}
+_result_sinks_lock = threading.Lock()
+
+def get_result_sink(filename, **options):
+    """
+    Returns the shared CsvResultSink for a file, creating it on first use.
+    Options (batch_size, max_bytes, include_raw_output, ...) are only used
+    when the sink is created. All sinks are flushed when the program exits.
+    """
+    with _result_sinks_lock:
+        sink = _result_sinks.get(filename)
+        if sink is None:
+            sink = _result_sinks[filename] = CsvResultSink(filename, **options)
+        return sink
+
+@atexit.register
+def close_result_sinks():
+    with _result_sinks_lock:
+        for sink in _result_sinks.values():
+            sink.close()
+        _result_sinks.clear()
+
 # Modify monitor_hosts to use CSV logging
-def monitor_hosts_with_csv(host_list, interval_seconds=60, count=1, timeout=1, log_file="ping_results.csv"):
+def monitor_hosts_with_csv(host_list, interval_seconds=60, count=1, timeout=1, log_file="ping_results.csv",
+                           max_in_flight=DEFAULT_MAX_IN_FLIGHT, include_raw_output=True, max_bytes=None):
     logging.info(f"Starting host monitoring (with CSV logging) for: {host_list}")
+    sink = get_result_sink(log_file, include_raw_output=include_raw_output, max_bytes=max_bytes)
+    next_cycle = time.monotonic()
     while True:
-        for host in host_list:
-            logging.info(f"Pinging {host}...")
-            success, output = ping_host(host, count=count, timeout=timeout)
-            log_ping_result_to_csv(host, success, output, filename=log_file)
-            if success:
+        logging.info(f"Pinging {len(host_list)} hosts...")
+        results = sweep_hosts(host_list, count=count, timeout=timeout, max_in_flight=max_in_flight)
+        for host, result in results.items():
+            sink.write(result)
+            if result.success:
                 logging.info(f"{host} is reachable.")
+            elif not result.resolved:
+                logging.error(f"{host} could not be resolved!")
             else:
                 logging.error(f"{host} is unreachable!")
-        logging.info(f"Waiting for {interval_seconds} seconds before next cycle...")
-        time.sleep(interval_seconds)
+        next_cycle = wait_for_next_cycle(next_cycle, interval_seconds)
 
 # Email configuration (replace with your actual details)
 EMAIL_SENDER = "your_email@example.com"
@@ -149,6 +531,8 @@ def send_alert_email(subject, body):
     """
     Sends an email alert.
     """
+    import smtplib
+    from email.mime.text import MIMEText
     try:
         msg = MIMEText(body)
         msg['Subject'] = subject
@@ -163,76 +547,93 @@ def send_alert_email(subject, body):
     except Exception as e:
         logging.error(f"Failed to send email alert: {e}")
 
+def create_alert_dispatcher(**options):
+    """
+    Creates an AlertDispatcher using the email configuration above.
+    Options (digest_interval, flap_threshold, ...) are passed on to AlertDispatcher.
+    """
+    from alerts import AlertDispatcher
+    return AlertDispatcher(SMTP_SERVER, SMTP_PORT, EMAIL_SENDER, EMAIL_RECEIVER, password=EMAIL_PASSWORD, **options)
+
 # Modify monitor_hosts to include email alerts
-def monitor_hosts_with_alerts(host_list, interval_seconds=60, count=1, timeout=1):
+def monitor_hosts_with_alerts(host_list, interval_seconds=60, count=1, timeout=1,
+                              max_in_flight=DEFAULT_MAX_IN_FLIGHT, dispatcher=None, sink=None):
+    """
+    Monitors hosts and emails when a host goes down or comes back up.
+    Alerts are sent by an AlertDispatcher in the background, so a slow mail
+    server never delays the pings. Pass your own dispatcher to change its settings,
+    and a sink (see get_result_sink) to log every result to CSV as well.
+    """
     logging.info(f"Starting host monitoring (with email alerts) for: {host_list}")
+    if dispatcher is None:
+        dispatcher = create_alert_dispatcher()
+    next_cycle = time.monotonic()
     while True:
-        for host in host_list:
-            logging.info(f"Pinging {host}...")
-            success, output = ping_host(host, count=count, timeout=timeout)
-            if not success:
-                subject = f"CRITICAL: Host {host} is DOWN!"
-                body = f"Ping to {host} failed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}.\n\nRaw Output:\n{output}"
-                logging.critical(body)
-                send_alert_email(subject, body)
+        logging.info(f"Pinging {len(host_list)} hosts...")
+        results = sweep_hosts(host_list, count=count, timeout=timeout, max_in_flight=max_in_flight)
+        for host, result in results.items():
+            dispatcher.report(result)
+            if sink is not None:
+                sink.write(result)
+            if not result.resolved:
+                logging.error(f"{host} could not be resolved!")
+            elif not result.success:
+                logging.error(f"{host} is unreachable!")
             else:
                 logging.info(f"{host} is reachable.")
-        logging.info(f"Waiting for {interval_seconds} seconds before next cycle...")
-        time.sleep(interval_seconds)
+        next_cycle = wait_for_next_cycle(next_cycle, interval_seconds)
 
 HOSTS_TO_MONITOR_SCHEDULE = ["8.8.8.8", "google.com"]
 
-def job_ping_hosts():
-    logging.info("Running scheduled ping job...")
-    for host in HOSTS_TO_MONITOR_SCHEDULE:
-        success, output = ping_host(host)
-        log_ping_result_to_csv(host, success, output, filename="scheduled_ping_results.csv")
-        if not success:
+def job_ping_hosts(hosts=None):
+    """
+    Pings the given hosts (default: HOSTS_TO_MONITOR_SCHEDULE) and logs the results.
+    Used as the job of run_scheduled_monitoring.
+    """
+    hosts = HOSTS_TO_MONITOR_SCHEDULE if hosts is None else hosts
+    logging.info(f"Running scheduled ping job for {len(hosts)} host(s)...")
+    results = sweep_hosts(hosts)
+    sink = get_result_sink("scheduled_ping_results.csv")
+    for host, result in results.items():
+        sink.write(result)
+        if not result.success:
             subject = f"ALERT: Scheduled Ping Failed for {host}"
-            body = f"Host {host} is unreachable at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}.\n\nOutput:\n{output}"
+            problem = "is unreachable" if result.resolved else "could not be resolved"
+            body = f"Host {host} {problem} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}.\n\nOutput:\n{result.summary()}"
             logging.error(body)
             # send_alert_email(subject, body) # Uncomment to enable email alerts   
 
+def run_scheduled_monitoring(host_list=None, interval_seconds=60, host_intervals=None, stop_event=None):
+    """
+    Runs job_ping_hosts on a HostScheduler: every host is pinged once per
+    interval at its own offset inside the interval, so the load is spread
+    evenly and the cadence does not drift by the time the pings take.
+
+    Args:
+        host_list (list): Hosts to monitor (default: HOSTS_TO_MONITOR_SCHEDULE).
+        interval_seconds (int): Default interval for every host.
+        host_intervals (dict): Optional host -> interval overrides.
+        stop_event (threading.Event): Set it to stop the loop.
+
+    Returns:
+        HostScheduler: The scheduler, with its lag/overrun statistics in .stats.
+    """
+    host_list = HOSTS_TO_MONITOR_SCHEDULE if host_list is None else host_list
+    host_intervals = host_intervals or {}
+    scheduler = HostScheduler(interval=interval_seconds)
+    for host in host_list:
+        scheduler.add_host(host, interval=host_intervals.get(host))
+    try:
+        scheduler.run(job_ping_hosts, stop_event=stop_event)
+    finally:
+        logging.info(f"Scheduler stopped: {scheduler.stats}")
+    return scheduler
+
 if __name__ == "__main__":
-    target_host = "8.8.8.8"  # Google's public DNS server
-    success, output = ping_host(target_host)
-
-    if success:
-        print(f"Successfully pinged {target_host}")
-        # You can parse the output here for more details if needed
-        # For example, to get average latency:
-        if platform.system().lower() == 'windows':
-            match = re.search(r"Average = (\d+)ms", output)
-            if match:
-                print(f"Average latency: {match.group(1)}ms")
-        else:   # Linux/macOS
-            match = re.search(r"min/avg/max/mdev = [\d.]+/([\d.]+)/[\d.]+/\S+ ms", output)
-            if match:
-                print(f"Average latency: {match.group(1)}ms")
-    else:
-        print(f"Failed to ping {target_host}")
-        print(f"Raw output:\n{output}")
-    hosts_to_monitor = ["8.8.8.8", "google.com", "192.168.1.1"] # Example hosts
-    # Be careful with 192.168.1.1 if it's not your gateway or doesn't exist
-
-    # Run the monitoring in a loop (uncomment to run)
-    # monitor_hosts(hosts_to_monitor, interval_seconds=10)
-    print("Run `monitor_hosts` function to start continuous monitoring.")
-    # Example for CSV logging:
-    # hosts_to_monitor = ["8.8.8.8", "google.com"]
-    # monitor_hosts_with_csv(hosts_to_monitor, interval_seconds=10, log_file="my_network_ping_log.csv")
-    print("Uncomment `monitor_hosts_with_csv` to start continuous monitoring with CSV logging.")
-    # Example for email alerts:
-    # IMPORTANT: Replace placeholder email credentials before running!
-    # hosts_to_monitor = ["google.com", "nonexistent-domain-12345.com"]
-    # monitor_hosts_with_alerts(hosts_to_monitor, interval_seconds=10)
-    print("Uncomment `monitor_hosts_with_alerts` and configure email settings to enable alerts.")
-     # Schedule the job
-    schedule.every(1).minute.do(job_ping_hosts)
-    # schedule.every().hour.do(job_ping_hosts)
-    # schedule.every().day.at("10:30").do(job_ping_hosts)
-
-    print("Scheduler started. Press Ctrl+C to stop.")
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
\ No newline at end of file
+    # python ping.py HOST pings one host, like `python cli.py ping HOST`.
+    # Sweeps and monitoring (with CSV logging, email alerts or metrics) are
+    # commands of cli.py, e.g.:
+    #   python cli.py monitor 8.8.8.8 example.com --interval 60 --csv ping_results.csv
+    import sys
+    import cli
+    sys.exit(cli.main(["ping"] + sys.argv[1:]))
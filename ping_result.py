@@ -0,0 +1,127 @@
+# ping_result.py
+# A small result object for one ping probe, created once when the probe
+# finishes so nobody has to parse ping output text again afterwards.
+
+import re
+import time
+import math
+from array import array
+
+NAN = float('nan')
+
+# Linux/macOS ping output
+_TIME_RE = re.compile(r"time[=<]([\d.]+) ?ms")
+_LINUX_COUNTS_RE = re.compile(r"(\d+) packets transmitted, (\d+) (?:packets )?received")
+_LINUX_RTT_RE = re.compile(r"min/avg/max/(?:mdev|stddev) = ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+) ms")
+# Windows ping output
+_WINDOWS_COUNTS_RE = re.compile(r"Packets: Sent = (\d+), Received = (\d+)")
+_WINDOWS_RTT_RE = re.compile(r"Minimum = (\d+)ms, Maximum = (\d+)ms, Average = (\d+)ms")
+
+
+class PingResult:
+    """
+    Outcome of pinging one host.
+
+    Attributes:
+        host (str): The host that was pinged.
+        timestamp (float): When the probe finished (seconds since the epoch).
+        success (bool): True if the host answered.
+        sent (int): Number of echo requests sent.
+        received (int): Number of replies received.
+        min, avg, max, mdev (float): Round-trip statistics in milliseconds, NaN if nothing came back.
+        rtts (array): Round-trip time of every packet in milliseconds, NaN for lost packets.
+        error (str): Why the host could not be pinged at all (e.g. "TimeoutExpired"), or None.
+        address (str): The address that was pinged, if the host name was resolved first.
+        resolved (bool): False if the host name could not be resolved, so it was not pinged at all.
+    """
+    __slots__ = ('host', 'timestamp', 'success', 'sent', 'received',
+                 'min', 'avg', 'max', 'mdev', 'rtts', 'error', 'address', 'resolved')
+
+    def __init__(self, host, rtts, success=None, timestamp=None, sent=None, received=None, error=None,
+                 address=None, resolved=True):
+        self.host = host
+        self.address = address
+        self.resolved = resolved
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.rtts = array('d', rtts)
+        answered = [rtt for rtt in self.rtts if not math.isnan(rtt)]
+        self.sent = len(self.rtts) if sent is None else sent
+        self.received = len(answered) if received is None else received
+        self.success = self.received > 0 if success is None else success
+        self.error = error
+        if answered:
+            self.min = min(answered)
+            self.max = max(answered)
+            self.avg = sum(answered) / len(answered)
+            self.mdev = math.sqrt(sum((rtt - self.avg) ** 2 for rtt in answered) / len(answered))
+        else:
+            self.min = self.avg = self.max = self.mdev = NAN
+
+    @classmethod
+    def from_rtts(cls, host, rtts, address=None):
+        """
+        Builds a result from a list of RTTs in milliseconds (None for lost packets),
+        as returned by icmp.IcmpProber.
+        """
+        return cls(host, [NAN if rtt is None else rtt for rtt in rtts], address=address)
+
+    @classmethod
+    def unresolved(cls, host, error, count=1):
+        """
+        Builds the result for a host name that could not be resolved.
+        """
+        return cls(host, [NAN] * count, success=False, sent=0, received=0, error=error, resolved=False)
+
+    @classmethod
+    def from_output(cls, host, success, raw_output, count=1, address=None):
+        """
+        Builds a result from the output of the ping command (Linux, macOS or Windows).
+        This is the only place where ping output is parsed.
+        """
+        rtts = [float(value) for value in _TIME_RE.findall(raw_output)]
+        counts = _LINUX_COUNTS_RE.search(raw_output) or _WINDOWS_COUNTS_RE.search(raw_output)
+        if counts is None:
+            # No statistics we can read: "TimeoutExpired", an error message, or
+            # output in another language. The exit code still tells whether the
+            # host answered; the round-trip times stay NaN.
+            if success:
+                return cls(host, [NAN] * count, success=True, sent=count, received=count, address=address)
+            return cls(host, [NAN] * count, success=False, error=raw_output.strip()[:200] or None, address=address)
+
+        sent, received = int(counts.group(1)), int(counts.group(2))
+        rtts = rtts[:received] + [NAN] * (sent - min(received, len(rtts)))
+        result = cls(host, rtts, success=success, sent=sent, received=received, address=address)
+
+        # Prefer the statistics ping printed itself, they include packets we could not match
+        linux_rtt = _LINUX_RTT_RE.search(raw_output)
+        windows_rtt = _WINDOWS_RTT_RE.search(raw_output)
+        if linux_rtt:
+            result.min, result.avg, result.max, result.mdev = (float(value) for value in linux_rtt.groups())
+        elif windows_rtt:
+            result.min, result.max, result.avg = (float(value) for value in windows_rtt.groups())
+        return result
+
+    @property
+    def packet_loss(self):
+        """
+        Packet loss in percent.
+        """
+        if not self.sent:
+            return 100.0
+        return 100.0 * (self.sent - self.received) / self.sent
+
+    def summary(self):
+        """
+        Ping-style summary text, e.g. for alert emails.
+        """
+        if self.error:
+            return self.error
+        lines = [f"--- {self.host} ping statistics ---",
+                 f"{self.sent} packets transmitted, {self.received} received, {self.packet_loss:.0f}% packet loss"]
+        if self.received and not math.isnan(self.avg):
+            lines.append(f"rtt min/avg/max/mdev = {self.min:.3f}/{self.avg:.3f}/{self.max:.3f}/{self.mdev:.3f} ms")
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return (f"PingResult(host={self.host!r}, success={self.success}, sent={self.sent}, "
+                f"received={self.received}, avg={self.avg:.3f})")
@@ -0,0 +1,175 @@
+# ping_scheduler.py
+# Spreads host probes over the monitoring interval instead of pinging every
+# host at the top of the minute.
+#
+# Every host gets its own phase inside its interval. The n-th host added with
+# an interval takes the n-th point of a low-discrepancy sequence, so however
+# many hosts there are they are spread evenly (a removed host's slot goes to
+# the next one added), and the same host list gets the same phases after a
+# restart. Deadlines are kept on the
+# monotonic clock and the next deadline is always "previous deadline +
+# interval", so the time a probe takes never shifts the schedule. A host that
+# falls more than a whole interval behind skips the missed runs instead of
+# firing them all at once.
+
+import time
+import heapq
+import logging
+import threading
+
+
+class SchedulerStats:
+    """
+    How late the scheduler ran hosts compared to their deadlines.
+    """
+    __slots__ = ('runs', 'total_lag', 'max_lag', 'overruns', 'skipped')
+
+    def __init__(self):
+        self.runs = 0
+        self.total_lag = 0.0 # seconds
+        self.max_lag = 0.0
+        self.overruns = 0 # Times a host was more than one interval late
+        self.skipped = 0 # Runs dropped because of overruns
+
+    @property
+    def mean_lag(self):
+        return self.total_lag / self.runs if self.runs else 0.0
+
+    def __repr__(self):
+        return (f"SchedulerStats(runs={self.runs}, mean_lag={self.mean_lag * 1000:.1f}ms, "
+                f"max_lag={self.max_lag * 1000:.1f}ms, overruns={self.overruns}, skipped={self.skipped})")
+
+
+def slot_phase(slot, interval):
+    """
+    Offset of the slot-th host inside its interval, in seconds: the van der
+    Corput sequence (0, 1/2, 1/4, 3/4, 1/8, ...) times the interval. The
+    first n slots always cover the interval evenly, whatever n is.
+    """
+    fraction, scale = 0.0, 0.5
+    while slot:
+        if slot & 1:
+            fraction += scale
+        slot >>= 1
+        scale /= 2
+    return fraction * interval
+
+
+class HostScheduler:
+    """
+    Decides when each host should be probed.
+
+    Args:
+        interval (float): Default seconds between two probes of the same host.
+        clock (callable): Time source, time.monotonic unless testing.
+    """
+
+    def __init__(self, interval=60, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.stats = SchedulerStats()
+        self.intervals = {} # host -> interval
+        self.deadlines = {} # host -> next deadline
+        self.slots = {} # host -> its slot among the hosts with the same interval
+        self._free_slots = {} # interval -> heap of slots of removed hosts
+        self._next_slot = {} # interval -> first slot never given out
+        self._heap = [] # (deadline, host), entries that don't match self.deadlines are stale
+        self._lock = threading.Lock()
+
+    def add_host(self, host, interval=None):
+        """
+        Starts scheduling a host, optionally with its own interval.
+        """
+        interval = interval or self.interval
+        with self._lock:
+            if host in self.slots:
+                self._release_slot(host)
+            self.intervals[host] = interval
+            self.slots[host] = slot = self._take_slot(interval)
+            now = self.clock()
+            # First deadline: the next time the clock passes the host's phase
+            phase = slot_phase(slot, interval)
+            deadline = now - now % interval + phase
+            if deadline < now:
+                deadline += interval
+            self.deadlines[host] = deadline
+            heapq.heappush(self._heap, (deadline, host))
+
+    def remove_host(self, host):
+        with self._lock:
+            if host in self.slots:
+                self._release_slot(host)
+            self.intervals.pop(host, None)
+            self.deadlines.pop(host, None) # Its heap entry is dropped when it comes up
+
+    def _take_slot(self, interval):
+        # The lowest free slot, so the slots in use stay the first n of the sequence
+        free = self._free_slots.get(interval)
+        if free:
+            return heapq.heappop(free)
+        slot = self._next_slot.get(interval, 0)
+        self._next_slot[interval] = slot + 1
+        return slot
+
+    def _release_slot(self, host):
+        heapq.heappush(self._free_slots.setdefault(self.intervals[host], []), self.slots.pop(host))
+
+    def next_deadline(self):
+        """
+        Monotonic time of the next probe, None if there are no hosts.
+        """
+        with self._lock:
+            while self._heap and self.deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def due(self):
+        """
+        Returns the hosts whose deadline has passed and schedules their next run.
+        """
+        hosts = []
+        with self._lock:
+            now = self.clock()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, host = heapq.heappop(self._heap)
+                if self.deadlines.get(host) != deadline:
+                    continue # Removed or re-added
+                interval = self.intervals[host]
+                lag = now - deadline
+                self.stats.runs += 1
+                self.stats.total_lag += lag
+                self.stats.max_lag = max(self.stats.max_lag, lag)
+                next_deadline = deadline + interval
+                if next_deadline <= now:
+                    # Behind by more than a whole interval: skip the missed runs
+                    missed = int((now - deadline) // interval)
+                    self.stats.overruns += 1
+                    self.stats.skipped += missed
+                    next_deadline = deadline + (missed + 1) * interval
+                self.deadlines[host] = next_deadline
+                heapq.heappush(self._heap, (next_deadline, host))
+                hosts.append(host)
+        return hosts
+
+    def run(self, job, stop_event=None, max_wait=1.0):
+        """
+        Calls job(hosts) with every batch of due hosts until stop_event is set.
+
+        Args:
+            job (callable): Receives the list of hosts to probe now.
+            stop_event (threading.Event): Set it to stop the loop.
+            max_wait (float): Longest sleep between checks (so new hosts and stop_event are noticed).
+        """
+        stop_event = stop_event or threading.Event()
+        skipped = self.stats.skipped
+        while not stop_event.is_set():
+            hosts = self.due()
+            if hosts:
+                job(hosts)
+                if self.stats.skipped > skipped:
+                    logging.warning(f"Scheduler fell behind, {self.stats.skipped - skipped} host run(s) skipped. {self.stats}")
+                    skipped = self.stats.skipped
+                continue
+            deadline = self.next_deadline()
+            wait = max_wait if deadline is None else min(max_wait, max(0.0, deadline - self.clock()))
+            stop_event.wait(wait)
@@ -0,0 +1,343 @@
+# ping_store.py
+# Append-only ping history, one set of columns per host.
+#
+# Every host has three arrays sorted by time: timestamps, latencies (average
+# RTT in ms, inf when nothing came back) and packet loss (%). Time ranges are
+# found with bisect and sliced out of the arrays in one go, and every hour also
+# keeps a latency histogram so percentiles over long ranges don't need to sort
+# millions of values.
+#
+# With a directory the samples are also appended to one binary file per host
+# and loaded again on start-up.
+
+import os
+import csv
+import math
+import heapq
+import logging
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+LOST = math.inf # Latency stored for probes that got no reply
+HOUR = 3600
+
+# Histogram buckets: 0.01 ms up to ~2 minutes, each bucket 5% wider than the previous one
+BUCKET_GROWTH = 1.05
+BUCKET_BOUNDS = [0.01 * BUCKET_GROWTH ** i for i in range(int(math.log(120000 / 0.01, BUCKET_GROWTH)) + 1)]
+N_BUCKETS = len(BUCKET_BOUNDS) + 1 # The last bucket holds lost probes
+
+# Percentiles over at most this many samples are computed exactly by sorting
+EXACT_PERCENTILE_LIMIT = 200000
+
+SERIES_SUFFIX = '.series'
+
+
+def _histogram_of(latencies):
+    """
+    Counts latencies per histogram bucket. Sorting once and bisecting for
+    every bucket bound keeps the work in C.
+    """
+    values = sorted(latencies)
+    counts = array('I', [0]) * N_BUCKETS
+    previous = 0
+    for i, bound in enumerate(BUCKET_BOUNDS):
+        position = bisect_right(values, bound, previous)
+        counts[i] = position - previous
+        previous = position
+    lost = bisect_left(values, LOST, previous)
+    counts[N_BUCKETS - 2] += lost - previous # Slower than the last bound
+    counts[N_BUCKETS - 1] = len(values) - lost
+    return counts
+
+
+def _exact_percentile(latencies, q):
+    values = sorted(latencies)
+    received = bisect_left(values, LOST)
+    if received == 0:
+        return math.nan
+    return values[min(received - 1, int(q / 100 * received))]
+
+
+class HostSeries:
+    """
+    Time-sorted columns for one host.
+
+    Samples older than the newest one (e.g. from an imported file) are kept
+    aside and merged into the columns in one go by merge(), which the
+    queries call first, instead of being inserted one at a time.
+    """
+    __slots__ = ('timestamps', 'latencies', 'losses', 'hour_histograms', 'unsorted')
+
+    def __init__(self):
+        self.timestamps = array('d')
+        self.latencies = array('d')
+        self.losses = array('d')
+        self.hour_histograms = {} # hour start -> array of bucket counts
+        self.unsorted = [] # (timestamp, latency, loss) older than timestamps[-1], not merged yet
+
+    def append(self, timestamp, latency, loss):
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            self.unsorted.append((timestamp, latency, loss))
+        else:
+            self.timestamps.append(timestamp)
+            self.latencies.append(latency)
+            self.losses.append(loss)
+
+        hour = int(timestamp // HOUR * HOUR)
+        histogram = self.hour_histograms.get(hour)
+        if histogram is None:
+            histogram = self.hour_histograms[hour] = array('I', [0]) * N_BUCKETS
+        histogram[N_BUCKETS - 1 if latency == LOST else min(bisect_left(BUCKET_BOUNDS, latency), N_BUCKETS - 2)] += 1
+
+    def merge(self):
+        """
+        Sorts the samples kept aside by append() into the columns. Only the
+        columns from the oldest of them on are rewritten.
+        """
+        if not self.unsorted:
+            return
+        samples = sorted(self.unsorted, key=lambda sample: sample[0])
+        self.unsorted = []
+        position = bisect_right(self.timestamps, samples[0][0])
+        tail = zip(self.timestamps[position:], self.latencies[position:], self.losses[position:])
+        # Stable: samples already stored stay before new ones with the same timestamp
+        timestamps, latencies, losses = zip(*heapq.merge(tail, samples, key=lambda sample: sample[0]))
+        del self.timestamps[position:], self.latencies[position:], self.losses[position:]
+        self.timestamps.extend(timestamps)
+        self.latencies.extend(latencies)
+        self.losses.extend(losses)
+
+    def bounds(self, start=None, end=None):
+        """
+        Index range of the samples with start <= timestamp < end.
+        """
+        lo = 0 if start is None else bisect_left(self.timestamps, start)
+        hi = len(self.timestamps) if end is None else bisect_left(self.timestamps, end)
+        return lo, hi
+
+
+class PingStore:
+    """
+    Ping history for many hosts.
+
+    Args:
+        directory (str): Where to keep the data files. None keeps everything in memory only.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.series = {} # host -> HostSeries
+        self.lock = threading.Lock()
+        self._unsaved = {} # host -> array of (timestamp, latency, loss) not written yet
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def add(self, result):
+        """
+        Stores a PingResult. Results of host names that could not be resolved
+        are skipped: the host was not pinged, so they say nothing about it.
+        """
+        if not result.resolved:
+            return
+        latency = result.avg if result.received else LOST
+        self.add_sample(result.host, result.timestamp, latency, result.packet_loss)
+
+    def add_sample(self, host, timestamp, latency, loss):
+        """
+        Stores one sample. latency is in milliseconds (LOST if there was no reply), loss in percent.
+        """
+        with self.lock:
+            series = self.series.get(host)
+            if series is None:
+                series = self.series[host] = HostSeries()
+            series.append(timestamp, latency, loss)
+            if self.directory is not None:
+                self._unsaved.setdefault(host, array('d')).extend((timestamp, latency, loss))
+
+    def hosts(self):
+        with self.lock:
+            return list(self.series)
+
+    def _series(self, host):
+        # Call with self.lock held: the host's series with all samples in order, or None
+        series = self.series.get(host)
+        if series is not None:
+            series.merge()
+        return series
+
+    def flush(self):
+        """
+        Appends the samples added since the last flush to the data files.
+        """
+        with self.lock:
+            unsaved, self._unsaved = self._unsaved, {}
+        for host, records in unsaved.items():
+            with open(self._path(host), 'ab') as f:
+                records.tofile(f)
+
+    def close(self):
+        if self.directory is not None:
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def range(self, host, start=None, end=None):
+        """
+        Samples for a host with start <= timestamp < end (epoch seconds, None: unbounded).
+
+        Returns:
+            tuple: (timestamps, latencies, losses) arrays. Lost probes have latency LOST (inf).
+        """
+        with self.lock:
+            series = self._series(host)
+            if series is None:
+                return array('d'), array('d'), array('d')
+            lo, hi = series.bounds(start, end)
+            return series.timestamps[lo:hi], series.latencies[lo:hi], series.losses[lo:hi]
+
+    def percentile(self, host, q, start=None, end=None):
+        """
+        The q-th percentile (0-100) of the latency of the probes that got a reply.
+
+        Up to EXACT_PERCENTILE_LIMIT samples the value is exact. Above that the
+        hourly histograms are used for whole hours inside the range, which is
+        accurate to one histogram bucket (5%).
+
+        Returns:
+            float: Latency in milliseconds, NaN if no probe got a reply.
+        """
+        with self.lock:
+            series = self._series(host)
+            if series is None:
+                return math.nan
+            lo, hi = series.bounds(start, end)
+            if hi - lo <= EXACT_PERCENTILE_LIMIT:
+                latencies = series.latencies[lo:hi]
+            else:
+                latencies = None
+                # Whole hours from the histograms, the partial hours at both ends are counted below
+                first_hour = int(math.ceil(series.timestamps[lo] / HOUR) * HOUR)
+                last_hour = int(series.timestamps[hi - 1] // HOUR * HOUR)
+                counts = array('q', [0]) * N_BUCKETS
+                for hour in range(first_hour, last_hour, HOUR):
+                    histogram = series.hour_histograms.get(hour)
+                    if histogram is not None:
+                        counts = array('q', map(int.__add__, counts, histogram))
+                head_end = bisect_left(series.timestamps, first_hour, lo, hi)
+                tail_start = max(head_end, bisect_left(series.timestamps, last_hour, lo, hi))
+                edges = (series.latencies[lo:head_end], series.latencies[tail_start:hi])
+        # Copies from here on, so the sorting does not hold up add_sample()
+        if latencies is not None:
+            return _exact_percentile(latencies, q)
+        for edge in edges:
+            counts = array('q', map(int.__add__, counts, _histogram_of(edge)))
+
+        received = sum(counts) - counts[N_BUCKETS - 1]
+        if received == 0:
+            return math.nan
+        target = min(received - 1, int(q / 100 * received))
+        seen = 0
+        for i in range(N_BUCKETS - 1):
+            seen += counts[i]
+            if seen > target:
+                return BUCKET_BOUNDS[i]
+        return BUCKET_BOUNDS[-1]
+
+    def rollup(self, host, bucket_seconds=60, start=None, end=None):
+        """
+        Downsamples a host's history into fixed time buckets (e.g. 60 for 1m, 3600 for 1h).
+
+        Returns:
+            list: One dict per non-empty bucket with keys start, samples,
+            received, avg, p50, p99, max (latencies in ms, NaN if nothing was
+            received) and loss (average packet loss in %).
+        """
+        timestamps, latencies, losses = self.range(host, start, end)
+        lo, hi = 0, len(timestamps)
+        buckets = []
+        while lo < hi:
+            bucket_start = timestamps[lo] // bucket_seconds * bucket_seconds
+            bucket_end = bisect_left(timestamps, bucket_start + bucket_seconds, lo, hi)
+            values = sorted(latencies[lo:bucket_end])
+            received = bisect_left(values, LOST)
+            samples = bucket_end - lo
+            answered = values[:received]
+            buckets.append({
+                'start': bucket_start,
+                'samples': samples,
+                'received': received,
+                'avg': math.fsum(answered) / received if received else math.nan,
+                'p50': answered[int(0.50 * received)] if received else math.nan,
+                'p99': answered[min(received - 1, int(0.99 * received))] if received else math.nan,
+                'max': answered[-1] if received else math.nan,
+                'loss': math.fsum(losses[lo:bucket_end]) / samples,
+            })
+            lo = bucket_end
+        return buckets
+
+    def import_csv(self, filename):
+        """
+        Loads a CSV log written by ping.py (old "12ms"/"0%" values or the
+        newer plain numbers) into the store.
+
+        Returns:
+            int: Number of rows imported.
+        """
+        imported = 0
+        parsed_times = {}
+        with open(filename, newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None) # Header
+            for row in reader:
+                if row[2:3] == ['Unresolved']:
+                    continue # Not pinged, see add()
+                try:
+                    timestamp = parsed_times.get(row[0])
+                    if timestamp is None:
+                        timestamp = parsed_times[row[0]] = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S").timestamp()
+                    latency_text = row[3][:-2] if row[3].endswith('ms') else row[3] # No removesuffix() on 3.8
+                    latency = float(latency_text) if latency_text not in ('N/A', '') else LOST
+                    loss_text = row[4].rstrip('%')
+                    loss = float(loss_text) if loss_text not in ('N/A', '') else (0.0 if row[2] == 'Success' else 100.0)
+                except (IndexError, ValueError):
+                    logging.warning(f"Skipping unreadable row in {filename}: {row}")
+                    continue
+                self.add_sample(row[1], timestamp, latency, loss)
+                imported += 1
+        logging.info(f"Imported {imported} rows from {filename}")
+        return imported
+
+    def _path(self, host):
+        return os.path.join(self.directory, quote(host, safe='') + SERIES_SUFFIX)
+
+    def _load(self):
+        for name in os.listdir(self.directory):
+            if not name.endswith(SERIES_SUFFIX):
+                continue
+            host = unquote(name[:-len(SERIES_SUFFIX)])
+            records = array('d')
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                records.frombytes(f.read())
+            records = records[:len(records) // 3 * 3] # Ignore a half-written last record
+            series = self.series[host] = HostSeries()
+            timestamps, latencies, losses = records[0::3], records[1::3], records[2::3]
+            if any(a > b for a, b in zip(timestamps, timestamps[1:])):
+                for sample in sorted(zip(timestamps, latencies, losses)):
+                    series.append(*sample)
+                continue
+            series.timestamps, series.latencies, series.losses = timestamps, latencies, losses
+            # Rebuild the hourly histograms
+            lo = 0
+            while lo < len(timestamps):
+                hour = int(timestamps[lo] // HOUR * HOUR)
+                hi = bisect_left(timestamps, hour + HOUR, lo)
+                series.hour_histograms[hour] = _histogram_of(latencies[lo:hi])
+                lo = hi
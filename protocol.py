@@ -0,0 +1,271 @@
+# protocol.py
+# Message framing and encoding for the chat server and client.
+#
+# Every message is sent as a frame: a 4-byte big-endian length followed by
+# that many bytes of payload. This way messages bigger than one recv(), or
+# several messages arriving in one recv(), are split up correctly.
+#
+# Payloads are encoded with BinaryCodec, a small tagged binary format for
+# None, bools, ints, floats, strings, bytes, lists and dicts. Unlike pickle it
+# cannot run code when decoding data from the network, and malformed data
+# raises ProtocolError.
+
+import struct
+
+HEADER = struct.Struct('!I')
+HEADER_SIZE = HEADER.size
+MAX_FRAME_SIZE = 16 * 1024 * 1024 # Bigger frames are refused
+MAX_DEPTH = 32 # How deeply lists/dicts may be nested
+
+RECV_SIZE = 8192 # At least this much room is made for every recv_into()
+
+
+class ProtocolError(ValueError):
+    """
+    Raised for frames or payloads that break the protocol.
+    """
+
+
+def encode_frame(payload):
+    """
+    Returns the frame (length header + payload) for an encoded payload.
+    """
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame of {len(payload)} bytes is bigger than {MAX_FRAME_SIZE}")
+    return HEADER.pack(len(payload)) + payload
+
+
+class FrameReader:
+    """
+    Splits received bytes into frames.
+
+    Data is received straight into one reusable bytearray (recv_into) and
+    every payload is handed out as a memoryview of that buffer, so no bytes
+    are copied per message. A payload view is only valid until the next
+    frame is read - decode it (or copy it) right away.
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE, initial_size=RECV_SIZE):
+        self.max_frame_size = max_frame_size
+        self.initial_size = initial_size
+        self.buffer = bytearray(initial_size)
+        self.start = 0 # First byte not handed out yet
+        self.end = 0 # End of the received data
+        self._needed = HEADER_SIZE # Bytes needed from start to complete the next frame
+
+    def recv_into(self, sock):
+        """
+        Receives from a socket into the buffer.
+
+        Returns:
+            int: Number of bytes received, 0 if the other side closed the connection.
+        """
+        self._make_room(max(RECV_SIZE, self._needed - (self.end - self.start)))
+        with memoryview(self.buffer) as view:
+            received = sock.recv_into(view[self.end:])
+        self.end += received
+        return received
+
+    def feed(self, data):
+        """
+        Adds bytes that were received some other way (e.g. from asyncio).
+        """
+        self._make_room(len(data))
+        self.buffer[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def frames(self):
+        """
+        Yields the payload of every complete frame in the buffer, as a memoryview.
+
+        Raises:
+            ProtocolError: If a frame is larger than max_frame_size.
+        """
+        view = memoryview(self.buffer)
+        try:
+            while self.end - self.start >= HEADER_SIZE:
+                (length,) = HEADER.unpack_from(self.buffer, self.start)
+                if length > self.max_frame_size:
+                    raise ProtocolError(f"Frame of {length} bytes is bigger than {self.max_frame_size}")
+                frame_end = self.start + HEADER_SIZE + length
+                if frame_end > self.end:
+                    self._needed = HEADER_SIZE + length
+                    break
+                payload = view[self.start + HEADER_SIZE:frame_end]
+                self.start = frame_end
+                self._needed = HEADER_SIZE
+                try:
+                    yield payload
+                finally:
+                    payload.release()
+        finally:
+            view.release()
+        if self.start == self.end:
+            self.start = self.end = 0
+            if len(self.buffer) > 4 * self.initial_size:
+                # Give back the memory of an unusually big frame
+                self.buffer = bytearray(self.initial_size)
+
+    def _make_room(self, size):
+        if len(self.buffer) - self.end >= size:
+            return
+        # Move the unfinished frame to the front of the buffer...
+        pending = self.end - self.start
+        if self.start:
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+        # ...and grow the buffer if that is still not enough
+        if len(self.buffer) - self.end < size:
+            self.buffer.extend(bytes(self.end + size - len(self.buffer)))
+
+
+# Type tags of BinaryCodec
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _BYTES, _LIST, _DICT, _BIGINT = range(10)
+_INT64 = struct.Struct('!q')
+_FLOAT64 = struct.Struct('!d')
+_LENGTH = struct.Struct('!I')
+
+
+class BinaryCodec:
+    """
+    Encodes messages made of None, bool, int, float, str, bytes, list/tuple
+    and dict into bytes and back.
+    """
+
+    def encode(self, message):
+        parts = []
+        self._encode(message, parts, 0)
+        return b''.join(parts)
+
+    def decode(self, payload):
+        """
+        Decodes a payload (bytes or memoryview).
+
+        Raises:
+            ProtocolError: If the payload is malformed.
+        """
+        try:
+            message, offset = self._decode(payload, 0, 0)
+        except (struct.error, UnicodeDecodeError, IndexError) as e:
+            raise ProtocolError(f"Malformed payload: {e}") from None
+        if offset != len(payload):
+            raise ProtocolError(f"{len(payload) - offset} unexpected bytes after the message")
+        return message
+
+    def _encode(self, value, parts, depth):
+        if depth > MAX_DEPTH:
+            raise ProtocolError("Message is nested too deeply")
+        if value is None:
+            parts.append(b'\x00')
+        elif value is True:
+            parts.append(b'\x02')
+        elif value is False:
+            parts.append(b'\x01')
+        elif isinstance(value, str):
+            data = value.encode('utf-8')
+            parts.append(b'\x05' + _LENGTH.pack(len(data)))
+            parts.append(data)
+        elif isinstance(value, int):
+            if -2 ** 63 <= value < 2 ** 63:
+                parts.append(b'\x03' + _INT64.pack(value))
+            else:
+                data = value.to_bytes((value.bit_length() + 8) // 8, 'big', signed=True)
+                parts.append(b'\x09' + _LENGTH.pack(len(data)))
+                parts.append(data)
+        elif isinstance(value, float):
+            parts.append(b'\x04' + _FLOAT64.pack(value))
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            parts.append(b'\x06' + _LENGTH.pack(len(value)))
+            parts.append(bytes(value))
+        elif isinstance(value, (list, tuple)):
+            parts.append(b'\x07' + _LENGTH.pack(len(value)))
+            for item in value:
+                self._encode(item, parts, depth + 1)
+        elif isinstance(value, dict):
+            parts.append(b'\x08' + _LENGTH.pack(len(value)))
+            for key, item in value.items():
+                self._encode(key, parts, depth + 1)
+                self._encode(item, parts, depth + 1)
+        else:
+            raise ProtocolError(f"Cannot encode a {type(value).__name__}")
+
+    def _decode(self, data, offset, depth):
+        if depth > MAX_DEPTH:
+            raise ProtocolError("Message is nested too deeply")
+        tag = data[offset]
+        offset += 1
+        if tag == _STR:
+            (length,) = _LENGTH.unpack_from(data, offset)
+            offset += 4
+            if offset + length > len(data):
+                raise ProtocolError("String runs past the end of the payload")
+            return str(data[offset:offset + length], 'utf-8'), offset + length
+        if tag == _INT:
+            return _INT64.unpack_from(data, offset)[0], offset + 8
+        if tag == _NONE:
+            return None, offset
+        if tag == _FALSE:
+            return False, offset
+        if tag == _TRUE:
+            return True, offset
+        if tag == _FLOAT:
+            return _FLOAT64.unpack_from(data, offset)[0], offset + 8
+        if tag in (_BYTES, _BIGINT):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            offset += 4
+            if offset + length > len(data):
+                raise ProtocolError("Value runs past the end of the payload")
+            raw = bytes(data[offset:offset + length])
+            if tag == _BIGINT:
+                return int.from_bytes(raw, 'big', signed=True), offset + length
+            return raw, offset + length
+        if tag in (_LIST, _DICT):
+            (count,) = _LENGTH.unpack_from(data, offset)
+            offset += 4
+            if count > len(data) - offset:
+                raise ProtocolError("More items than bytes left in the payload")
+            if tag == _LIST:
+                items = []
+                for _ in range(count):
+                    item, offset = self._decode(data, offset, depth + 1)
+                    items.append(item)
+                return items, offset
+            result = {}
+            for _ in range(count):
+                key, offset = self._decode(data, offset, depth + 1)
+                item, offset = self._decode(data, offset, depth + 1)
+                try:
+                    result[key] = item
+                except TypeError:
+                    raise ProtocolError(f"Unusable dict key of type {type(key).__name__}") from None
+            return result, offset
+        raise ProtocolError(f"Unknown type tag {tag}")
+
+
+class MsgpackCodec:
+    """
+    Codec using the msgpack package, if it is installed.
+    """
+
+    def __init__(self):
+        import msgpack
+        self.msgpack = msgpack
+
+    def encode(self, message):
+        return self.msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, payload):
+        try:
+            return self.msgpack.unpackb(payload, raw=False)
+        except Exception as e:
+            raise ProtocolError(f"Malformed payload: {e}") from None
+
+
+DEFAULT_CODEC = BinaryCodec()
+
+
+def encode_message(message, codec=DEFAULT_CODEC):
+    """
+    Encodes a message and returns the complete frame, ready for sendall().
+    """
+    return encode_frame(codec.encode(message))
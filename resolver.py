@@ -0,0 +1,228 @@
+# resolver.py
+# Resolves monitored hostnames once and keeps the addresses in a cache, so
+# the monitor pings addresses and no ping waits for a DNS lookup.
+#
+# Entries are kept for their TTL. Once most of the TTL has passed the next
+# lookup still returns the cached address but starts a refresh in the
+# background, so hosts that are looked up every cycle never see a cache miss.
+# Misses are resolved concurrently on a thread pool, and a cycle waits at most
+# `timeout` seconds for them. Failed lookups are cached for a shorter time and
+# counted separately, so "cannot resolve" is never mistaken for "unreachable".
+# The cache holds at most `max_entries` names and forgets the least recently
+# used ones first.
+
+import time
+import socket
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+DEFAULT_TTL = 300.0 # Seconds to keep an address when the resolver gives no TTL
+NEGATIVE_TTL = 30.0 # Seconds to remember that a name could not be resolved
+REFRESH_AHEAD = 0.75 # Refresh in the background after this fraction of the TTL
+RESOLVE_TIMEOUT = 2.0 # Longest a lookup of many names waits for the resolver
+MAX_ENTRIES = 100000 # Names kept in the cache
+
+
+def system_resolve(host):
+    """
+    Resolves a hostname with the system resolver (getaddrinfo), IPv4 first.
+
+    Returns:
+        tuple: (list of addresses, TTL in seconds or None if unknown)
+
+    Raises:
+        OSError: If the name cannot be resolved.
+    """
+    infos = socket.getaddrinfo(host, None, type=socket.SOCK_RAW)
+    addresses = [info[4][0] for info in infos if info[0] == socket.AF_INET]
+    addresses += [info[4][0] for info in infos if info[0] == socket.AF_INET6]
+    return list(dict.fromkeys(addresses)), None
+
+
+def is_ip_address(host):
+    """
+    True if host is an IPv4 or IPv6 address rather than a name.
+    """
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except (OSError, ValueError):
+            pass
+    return False
+
+
+class ResolverStats:
+    """
+    What the resolver cache did.
+    """
+    __slots__ = ('hits', 'misses', 'refreshes', 'failures', 'timeouts', 'evictions')
+
+    def __init__(self):
+        self.hits = 0 # Answered from the cache
+        self.misses = 0 # Had to wait for the resolver
+        self.refreshes = 0 # Background refreshes started
+        self.failures = 0 # Lookups that failed
+        self.timeouts = 0 # Lookups a caller stopped waiting for
+        self.evictions = 0 # Names dropped to stay within max_entries
+
+    def __repr__(self):
+        return (f"ResolverStats(hits={self.hits}, misses={self.misses}, refreshes={self.refreshes}, "
+                f"failures={self.failures}, timeouts={self.timeouts}, evictions={self.evictions})")
+
+
+class CacheEntry:
+    """
+    The cached answer for one name.
+    """
+    __slots__ = ('address', 'error', 'expires', 'refresh_at', 'future', 'failures')
+
+    def __init__(self):
+        self.address = None
+        self.error = None
+        self.expires = 0.0
+        self.refresh_at = 0.0
+        self.future = None # Lookup in progress
+        self.failures = 0 # Failed lookups in a row
+
+
+class ResolverCache:
+    """
+    TTL cache in front of a resolver function.
+
+    Args:
+        resolve (callable): host -> (list of addresses, TTL or None), raising
+            OSError on failure. system_resolve by default; tests pass a stub.
+        ttl (float): TTL used when resolve() does not return one.
+        negative_ttl (float): How long a failed lookup is remembered.
+        refresh_ahead (float): Fraction of the TTL after which entries are refreshed in the background.
+        max_workers (int): Lookups running at the same time.
+        timeout (float): Longest resolve_many() waits for lookups that are not cached.
+        max_entries (int): Names kept; the least recently used ones are dropped first.
+        clock (callable): Time source, time.monotonic unless testing.
+    """
+
+    def __init__(self, resolve=system_resolve, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL,
+                 refresh_ahead=REFRESH_AHEAD, max_workers=8, timeout=RESOLVE_TIMEOUT, max_entries=MAX_ENTRIES,
+                 clock=time.monotonic):
+        self.resolve = resolve
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refresh_ahead = refresh_ahead
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.clock = clock
+        self.stats = ResolverStats()
+        self.entries = OrderedDict() # host -> CacheEntry, least recently used first
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resolver")
+
+    def resolve_many(self, host_list):
+        """
+        Returns the address of every host, from the cache where possible.
+
+        IP addresses are returned as they are. Names that are not cached are
+        resolved concurrently, waiting at most self.timeout seconds; names
+        still being resolved after that are reported as failed for now and
+        cached as soon as the answer arrives.
+
+        Returns:
+            dict: host -> (address, error). address is None if the host could
+            not be resolved, and error says why.
+        """
+        results = {}
+        waiting = {}
+        now = self.clock()
+        with self._lock:
+            for host in dict.fromkeys(host_list):
+                if is_ip_address(host):
+                    results[host] = (host, None)
+                    continue
+                entry = self.entries.get(host)
+                if entry is not None:
+                    self.entries.move_to_end(host)
+                if entry is not None and now < entry.expires:
+                    self.stats.hits += 1
+                    results[host] = (entry.address, entry.error)
+                    if now >= entry.refresh_at and entry.future is None:
+                        self.stats.refreshes += 1
+                        self._start_lookup(host, entry)
+                    continue
+                if entry is None:
+                    entry = self.entries[host] = CacheEntry()
+                    if len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False) # A lookup still running for it just finishes
+                        self.stats.evictions += 1
+                self.stats.misses += 1
+                if entry.future is None:
+                    self._start_lookup(host, entry)
+                waiting[host] = entry.future
+
+        if waiting:
+            done, _ = wait(waiting.values(), timeout=self.timeout)
+            for host, future in waiting.items():
+                if future in done:
+                    results[host] = future.result()
+                else:
+                    with self._lock:
+                        self.stats.timeouts += 1
+                    results[host] = (None, f"Resolving {host} took longer than {self.timeout}s")
+        return results
+
+    def lookup(self, host):
+        """
+        Returns (address, error) for one host, see resolve_many().
+        """
+        return self.resolve_many([host])[host]
+
+    def _start_lookup(self, host, entry):
+        # Called with self._lock held
+        entry.future = self._executor.submit(self._lookup, host, entry)
+
+    def _lookup(self, host, entry):
+        try:
+            addresses, ttl = self.resolve(host)
+            if not addresses:
+                raise OSError("no addresses")
+            error = None
+        except (OSError, UnicodeError) as e:
+            addresses, ttl, error = None, None, f"Cannot resolve {host}: {e}"
+        now = self.clock()
+        with self._lock:
+            entry.future = None
+            if error is None:
+                ttl = self.ttl if ttl is None else ttl
+                entry.address, entry.error, entry.failures = addresses[0], None, 0
+                entry.expires = now + ttl
+                entry.refresh_at = now + ttl * self.refresh_ahead
+            else:
+                self.stats.failures += 1
+                entry.failures += 1
+                if entry.address is not None and now < entry.expires:
+                    # A refresh failed: keep the address until it expires and try again a bit later
+                    entry.refresh_at = min(now + self.negative_ttl, entry.expires)
+                else:
+                    entry.address, entry.error = None, error
+                    entry.expires = entry.refresh_at = now + self.negative_ttl
+            result = (entry.address, entry.error)
+            failures = entry.failures
+        if error is not None:
+            logging.warning(f"{error} ({failures} failure(s) in a row)")
+        return result
+
+    def failed_hosts(self):
+        """
+        Returns host -> number of failed lookups in a row, for names that fail right now.
+        """
+        with self._lock:
+            return {host: entry.failures for host, entry in self.entries.items() if entry.failures}
+
+    def close(self):
+        # Cancels the lookups that have not started (shutdown(cancel_futures=True) needs Python 3.9)
+        with self._lock:
+            for entry in self.entries.values():
+                if entry.future is not None:
+                    entry.future.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,186 @@
+# result_sink.py
+# Writes PingResults to a CSV file from a background thread.
+#
+# Probes only put results on a queue; the writer thread keeps the file open,
+# writes the queued rows in batches and rotates the file when it gets too big
+# or too old.
+
+import os
+import csv
+import time
+import queue
+import math
+import logging
+import threading
+from datetime import datetime
+
+CSV_HEADER = ["Timestamp", "Host", "Status", "Latency (ms)", "Packet Loss (%)", "Raw Output"]
+
+_STOP = object() # Tells the writer thread to finish
+
+
+_last_timestamp = (None, "")
+
+def _format_timestamp(timestamp):
+    # Results come in bursts with the same second, so remember the last one
+    # Every sink thread shares it: read the tuple once, never half of an old one and half of a new one
+    global _last_timestamp
+    second = int(timestamp)
+    last = _last_timestamp
+    if last[0] != second:
+        last = _last_timestamp = (second, datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S"))
+    return last[1]
+
+
+def result_to_row(result, include_raw_output=True):
+    """
+    Turns a PingResult into a CSV row (see CSV_HEADER).
+    Latency is the average round-trip time in milliseconds, packet loss is in percent.
+    """
+    timestamp = _format_timestamp(result.timestamp)
+    status = "Success" if result.success else ("Failed" if result.resolved else "Unresolved")
+    latency = f"{result.avg:.3f}" if result.received and not math.isnan(result.avg) else "N/A"
+    packet_loss = f"{result.packet_loss:.0f}"
+    row = [timestamp, result.host, status, latency, packet_loss]
+    if include_raw_output:
+        row.append(result.summary().replace('\n', ' '))
+    return row
+
+
+class CsvResultSink:
+    """
+    Long-lived CSV writer for ping results.
+
+    Args:
+        filename (str): CSV file to append to.
+        batch_size (int): Write as soon as this many rows are queued.
+        flush_interval (float): Write queued rows at least this often (seconds).
+        max_bytes (int): Rotate the file when it reaches this size (None: never).
+        rotate_seconds (float): Rotate the file when it is this old (None: never).
+        backup_count (int): How many rotated files to keep (filename.1, filename.2, ...).
+        include_raw_output (bool): Write the "Raw Output" column.
+        max_queue (int): Results waiting to be written. When the queue is full
+            new results are dropped (and counted) instead of blocking the probes.
+    """
+
+    def __init__(self, filename, batch_size=1000, flush_interval=1.0, max_bytes=None, rotate_seconds=None,
+                 backup_count=5, include_raw_output=True, max_queue=100000):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.include_raw_output = include_raw_output
+        self.header = CSV_HEADER if include_raw_output else CSV_HEADER[:-1]
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self._file = None
+        self._writer = None
+        self._opened_at = 0
+        self._open()
+        self._thread = threading.Thread(target=self._run, name=f"CsvResultSink({filename})", daemon=True)
+        self._thread.start()
+
+    def write(self, result):
+        """
+        Queues a PingResult for writing. Never blocks.
+        """
+        try:
+            self.queue.put_nowait(result)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """
+        Writes everything still queued and closes the file.
+        """
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open(self):
+        self._file = open(self.filename, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        self._opened_at = time.monotonic()
+        # Write header if file is empty
+        if self._file.tell() == 0:
+            self._writer.writerow(self.header)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write_batch(batch)
+        if self._file is not None:
+            self._file.close()
+
+    def _reopen(self):
+        # After a failed open (e.g. during rotation) every batch tries again
+        try:
+            self._open()
+            return True
+        except OSError as e:
+            self._file = self._writer = None
+            logging.error(f"Could not open CSV file {self.filename}: {e}")
+            return False
+
+    def _write_batch(self, batch):
+        if self._file is None and not self._reopen():
+            self.dropped += len(batch)
+            return
+        try:
+            self._writer.writerows(result_to_row(result, self.include_raw_output) for result in batch)
+            self._file.flush()
+            self.written += len(batch)
+            logging.debug(f"Wrote {len(batch)} results to {self.filename}")
+            if self._should_rotate():
+                self._rotate()
+        except Exception as e:
+            logging.error(f"Error writing to CSV file {self.filename}: {e}")
+
+    def _should_rotate(self):
+        if self.max_bytes is not None and self._file.tell() >= self.max_bytes:
+            return True
+        if self.rotate_seconds is not None and time.monotonic() - self._opened_at >= self.rotate_seconds:
+            return True
+        return False
+
+    def _rotate(self):
+        """
+        filename -> filename.1 -> filename.2 ..., like logging's RotatingFileHandler.
+        """
+        self._file.close()
+        try:
+            for i in range(self.backup_count - 1, 0, -1):
+                source = f"{self.filename}.{i}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.filename}.{i + 1}")
+            if self.backup_count > 0:
+                os.replace(self.filename, f"{self.filename}.1")
+            else:
+                os.remove(self.filename)
+            logging.info(f"Rotated CSV file {self.filename}")
+        except OSError as e:
+            logging.error(f"Could not rotate CSV file {self.filename}, appending to it: {e}")
+        self._reopen()
@@ -1,17 +1,305 @@
 import socket
+import select
+import selectors
 import threading
-import pickle
 import time
+import sys
+import asyncio
+import itertools
+import multiprocessing
+from collections import deque
+
+import metrics
+from protocol import DEFAULT_CODEC, RECV_SIZE, FrameReader, ProtocolError, encode_frame
 
 HOST = '127.0.0.1'  # Standard loopback interface address (localhost)
 PORT = 65432        # Port to listen on (non-privileged ports are > 1023)
+METRICS_PORT = 9109 # Serves http://127.0.0.1:9109/metrics, None to disable
+
+# What to do when a client does not read its messages fast enough
+DROP_OLDEST = 'drop_oldest'    # Throw away the oldest queued message
+DISCONNECT = 'disconnect'      # Disconnect the client
+BACKPRESSURE = 'backpressure'  # Make the sender wait (up to a timeout, then disconnect)
+
+# Messages are sent to every other client, except for these control messages
+# (dicts with a "type"):
+#   {"type": "hello"}                          -> {"type": "welcome", "id": <your client id>}
+#   {"type": "subscribe", "topic": "news"}     -> receive what is published to "news"
+#   {"type": "unsubscribe", "topic": "news"}
+#   {"type": "publish", "topic": "news", ...}  -> the message goes to the subscribers of "news"
+#   {"type": "direct", "to": 7, ...}           -> the message goes to client 7 only
+# Published and direct messages are forwarded with "from": <sender's client id>
+# added. Bad control messages are answered with {"type": "error", "reason": ...}.
+MAX_TOPIC_LENGTH = 256
+MAX_SUBSCRIPTIONS = 1000 # Topics one client may subscribe to
+
+# Runtime numbers, see metrics.py
+CLIENTS = metrics.gauge("chat_clients", "Connected chat clients")
+MESSAGES_RECEIVED = metrics.counter("chat_messages_received_total", "Messages received from clients")
+MESSAGES_FORWARDED = metrics.counter("chat_messages_forwarded_total", "Messages queued or written for other clients")
+MESSAGES_DROPPED = metrics.counter("chat_messages_dropped_total", "Messages thrown away for slow clients")
+SLOW_CLIENTS = metrics.counter("chat_slow_clients_total", "Clients disconnected for not reading fast enough")
+# Timing a fan-out costs as much as a good part of the fan-out itself, so only one in TIMING_SAMPLE is timed
+TIMING_SAMPLE = 64
+BROADCAST_SECONDS = metrics.histogram("chat_broadcast_seconds",
+                                      f"Time to fan one message out to all clients (1 in {TIMING_SAMPLE} timed)")
+PUBLISH_SECONDS = metrics.histogram("chat_publish_seconds", f"Time to deliver a message to its topic's subscribers "
+                                                           f"(1 in {TIMING_SAMPLE} timed)")
+
+# Where there is no MSG_DONTWAIT (Windows) the client sockets are made non-blocking instead
+SEND_FLAGS = getattr(socket, 'MSG_DONTWAIT', 0)
+FLUSH_BATCH = 64 # Messages sent to one client before the writer moves on to the next
+
+_backlog = threading.local() # BACKPRESSURE outboxes that went over their limit in this thread
+
+def _backlogged():
+    outboxes = getattr(_backlog, 'outboxes', None)
+    if outboxes is None:
+        outboxes = _backlog.outboxes = set()
+    return outboxes
+
+def recv_into(frame_reader, conn):
+    """
+    FrameReader.recv_into that also waits when conn is non-blocking (see SEND_FLAGS).
+    """
+    while True:
+        try:
+            return frame_reader.recv_into(conn)
+        except BlockingIOError:
+            select.select([conn], [], [])
+
+class OutboxWriter:
+    """
+    Sends the queued messages of all clients from one thread.
+
+    Sockets are written without blocking. A client whose socket buffer is
+    full is watched with a selector and written to again once it has room,
+    so a slow client only delays its own messages.
+    """
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self._ready = {} # Outboxes with new messages, or released, in the order they came
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self._run, name="OutboxWriter", daemon=True)
+        self.thread.start()
+
+    def notify(self, outbox):
+        """
+        Tells the writer thread that an outbox has something to do.
+        """
+        with self.lock:
+            wake = not self._ready
+            self._ready[outbox] = None
+        if wake:
+            self._wakeup_send.send(b'\0')
+
+    def _run(self):
+        while True:
+            for key, _ in self.selector.select():
+                if key.data is not None:
+                    self._service(key.data) # Has room again
+                    continue
+                try:
+                    while self._wakeup_recv.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                with self.lock:
+                    ready, self._ready = self._ready, {}
+                for outbox in ready:
+                    self._service(outbox)
+
+    def _service(self, outbox):
+        more = outbox.flush()
+        if more and not outbox.watched:
+            self.selector.register(outbox.conn, selectors.EVENT_WRITE, outbox)
+            outbox.watched = True
+        elif not more and outbox.watched:
+            self.selector.unregister(outbox.conn)
+            outbox.watched = False
+        if outbox.released and outbox.closed:
+            # Closed here, after unregistering, so that a new client cannot get the same fd while it is watched
+            outbox.conn.close()
+
+class ClientOutbox:
+    """
+    Messages waiting to be sent to one client, sent by the shared OutboxWriter.
+    put() never blocks: with BACKPRESSURE a full outbox takes the message
+    anyway and the sending client's thread waits afterwards (see
+    Server.handle_client), so the other recipients are not held up.
+
+    The queued messages are already-encoded frames (bytes objects), shared
+    by all the outboxes they were put in.
+    """
+    def __init__(self, conn, addr, writer, max_messages=1000, policy=DROP_OLDEST, backpressure_timeout=5.0,
+                 client_id=None):
+        self.conn = conn
+        self.addr = addr
+        self.writer = writer
+        self.client_id = client_id
+        self.max_messages = max_messages
+        self.policy = policy
+        self.backpressure_timeout = backpressure_timeout
+        self.messages = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.released = False # handle_client is done with conn, the writer closes it
+        self.watched = False # Registered with the writer's selector, only used by the writer thread
+        self.dropped = 0
+        self._sending = None # memoryview of the rest of the message being sent, only used by the writer thread
+        if not SEND_FLAGS:
+            conn.setblocking(False)
+
+    def put(self, data):
+        """
+        Queues data for the client. Returns False if the client is (now) disconnected.
+        """
+        with self.condition:
+            if self.closed:
+                return False
+            if len(self.messages) >= self.max_messages:
+                if self.policy == DROP_OLDEST:
+                    self.messages.popleft()
+                    self.dropped += 1
+                    MESSAGES_DROPPED.inc()
+                elif self.policy == BACKPRESSURE:
+                    _backlogged().add(self) # Queued anyway, the sender waits in handle_client
+                else:
+                    self._disconnect_slow()
+                    return False
+            # A non-empty outbox is already being sent, or watched until the client has room
+            wake = not self.messages
+            self.messages.append(data)
+        if wake:
+            self.writer.notify(self)
+        return True
+
+    def wait_for_room(self, timeout):
+        """
+        Waits until fewer than max_messages are queued, and disconnects the
+        client if that takes longer than timeout seconds.
+
+        Returns:
+            bool: False if the client is disconnected.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.messages) < self.max_messages or self.closed, timeout):
+                self._disconnect_slow()
+            return not self.closed
+
+    def flush(self):
+        """
+        Sends queued messages until the socket buffer is full. Only called
+        by the writer thread.
+
+        Returns:
+            bool: True if there is more to send once the socket has room.
+        """
+        for _ in range(FLUSH_BATCH):
+            if self._sending is None:
+                with self.condition:
+                    if self.closed or not self.messages:
+                        return False
+                    self._sending = memoryview(self.messages.popleft())
+                    if len(self.messages) < self.max_messages:
+                        self.condition.notify_all() # Room for a sender in wait_for_room()
+            elif self.closed:
+                self._sending = None
+                return False
+            try:
+                sent = self.conn.send(self._sending, SEND_FLAGS)
+            except BlockingIOError:
+                return True
+            except OSError as e:
+                print(f"Error sending to {self.addr}: {e}")
+                self._sending = None
+                self.close()
+                return False
+            self._sending = self._sending[sent:] if sent < len(self._sending) else None
+        return True # Let the other clients have a turn
+
+    def close(self):
+        with self.condition:
+            self._close_locked()
+
+    def release(self):
+        """
+        Closes the outbox and hands the connection to the writer thread, which closes it.
+        """
+        self.close()
+        self.released = True
+        self.writer.notify(self)
+
+    def _disconnect_slow(self):
+        print(f"Client {self.addr} is too slow, disconnecting.")
+        SLOW_CLIENTS.inc()
+        self._close_locked()
+
+    def _close_locked(self):
+        if not self.closed:
+            self.closed = True
+            self.messages.clear()
+            self.condition.notify_all()
+            try:
+                # Wakes up the recv() in handle_client, which then cleans up
+                self.conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass # Already disconnected
+
+def parse_control_message(message):
+    """
+    Checks a message for one of the control types described at the top.
+
+    Returns:
+        tuple: (type, argument, error). type is None for a chat message that
+        goes to everyone. argument is the topic or the client id.
+    """
+    kind = message.get("type") if isinstance(message, dict) else None
+    if kind in ("subscribe", "unsubscribe", "publish"):
+        topic = message.get("topic")
+        if not isinstance(topic, str) or not 0 < len(topic) <= MAX_TOPIC_LENGTH:
+            return kind, None, f"Topic must be a string of 1 to {MAX_TOPIC_LENGTH} characters"
+        return kind, topic, None
+    if kind == "direct":
+        client_id = message.get("to")
+        if not isinstance(client_id, int) or isinstance(client_id, bool):
+            return kind, None, "'to' must be a client id"
+        return kind, client_id, None
+    if kind == "hello":
+        return kind, None, None
+    return None, None, None
 
 class Server:
-    def __init__(self, host, port):
+    """
+    Chat server with a thread per client that reads its messages, and one
+    OutboxWriter thread that sends to all of them.
+
+    Besides the list of all clients it keeps a subscription index, topic ->
+    frozenset of the outboxes subscribed to it. The sets are never changed,
+    only replaced (under topics_lock), so publishing reads the current set
+    without any lock and only touches the subscribers of its topic.
+    """
+    def __init__(self, host, port, max_queue=1000, slow_consumer_policy=DROP_OLDEST, codec=DEFAULT_CODEC,
+                 backpressure_timeout=5.0):
         self.host = host
         self.port = port
-        self.clients = []  # List to store connected client sockets and their addresses
-        self.lock = threading.Lock() # Lock for thread-safe access to self.clients
+        self.codec = codec # Encodes/decodes message payloads, see protocol.py
+        self._timed = itertools.cycle((True,) + (False,) * (TIMING_SAMPLE - 1)) # Which fan-outs to time
+        self.clients = {}  # conn -> address of every connected client
+        self.outboxes = {}  # conn -> ClientOutbox with the messages waiting for that client
+        self.clients_by_id = {}  # client id -> ClientOutbox
+        self.lock = threading.Lock() # Lock for thread-safe access to the three dicts above
+        self.topics = {} # topic -> frozenset of the subscribed outboxes
+        self.subscriptions = {} # conn -> set of the topics it subscribed to
+        self.topics_lock = threading.Lock() # Held to change self.topics and self.subscriptions
+        self.max_queue = max_queue
+        self.slow_consumer_policy = slow_consumer_policy
+        self.backpressure_timeout = backpressure_timeout
+        self._everyone = None # Tuple of all outboxes for broadcasts, rebuilt after clients come or go
+        self._ids = itertools.count(1)
 
     def start(self):
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -19,56 +307,399 @@ class Server:
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen()
         print(f"Server listening on {self.host}:{self.port}")
+        self.writer = OutboxWriter()
 
         while True:
             conn, addr = self.server_socket.accept()
             print(f"Connected by {addr}")
-            with self.lock:
-                self.clients.append((conn, addr))
+            self.add_client(conn, addr,
+                            ClientOutbox(conn, addr, self.writer, max_messages=self.max_queue,
+                                         policy=self.slow_consumer_policy,
+                                         backpressure_timeout=self.backpressure_timeout, client_id=next(self._ids)))
             # Start a new thread to handle this client
             client_handler = threading.Thread(target=self.handle_client, args=(conn, addr))
             client_handler.start()
 
+    def add_client(self, conn, addr, outbox):
+        with self.lock:
+            self.clients[conn] = addr
+            self.outboxes[conn] = outbox
+            self.clients_by_id[outbox.client_id] = outbox
+            self._everyone = None
+        CLIENTS.inc()
+
+    def remove_client(self, conn):
+        with self.topics_lock:
+            for topic in self.subscriptions.pop(conn, ()):
+                self._unsubscribe_locked(topic, self.outboxes[conn])
+        with self.lock:
+            del self.clients[conn]
+            outbox = self.outboxes.pop(conn)
+            del self.clients_by_id[outbox.client_id]
+            self._everyone = None
+        CLIENTS.dec()
+        return outbox
+
     def handle_client(self, conn, addr):
+        frame_reader = FrameReader()
+        try:
+            # Receive data from the client; 0 bytes means it disconnected
+            while recv_into(frame_reader, conn):
+                for payload in frame_reader.frames():
+                    message = self.codec.decode(payload)
+                    MESSAGES_RECEIVED.inc()
+                    print(f"Received from {addr}: {message}")
+                    self.handle_message(message, conn)
+                    backlogged = _backlogged()
+                    if backlogged:
+                        # BACKPRESSURE: stop reading from this sender until the slow clients catch up
+                        self._wait_for(list(backlogged))
+                        backlogged.clear()
+
+        except ProtocolError as e:
+            print(f"Invalid data from {addr}: {e}")
+        except Exception as e:
+            print(f"Error handling client {addr}: {e}")
+        finally:
+            print(f"Client {addr} disconnected.")
+            self.remove_client(conn).release() # The writer thread closes conn
+            _backlogged().clear()
+
+    def _wait_for(self, outboxes):
+        deadline = time.monotonic() + self.backpressure_timeout
+        for outbox in outboxes:
+            outbox.wait_for_room(max(0, deadline - time.monotonic()))
+
+    def handle_message(self, message, conn):
+        kind, argument, error = parse_control_message(message)
+        if kind is None:
+            # Forward the message to other clients
+            self.broadcast_message(message, sender_conn=conn)
+            return
+        outbox = self.outboxes[conn]
+        if error is not None:
+            self.reply(outbox, {"type": "error", "reason": error})
+        elif kind == "hello":
+            self.reply(outbox, {"type": "welcome", "id": outbox.client_id})
+        elif kind == "subscribe":
+            self.subscribe(conn, argument)
+        elif kind == "unsubscribe":
+            self.unsubscribe(conn, argument)
+        elif kind == "publish":
+            self.publish(argument, dict(message, **{"from": outbox.client_id}), sender_conn=conn)
+        elif not self.send_direct(argument, dict(message, **{"from": outbox.client_id})):
+            self.reply(outbox, {"type": "error", "reason": f"No client with id {argument}"})
+
+    def reply(self, outbox, message):
+        outbox.put(encode_frame(self.codec.encode(message)))
+
+    def subscribe(self, conn, topic):
+        with self.topics_lock:
+            topics = self.subscriptions.setdefault(conn, set())
+            if topic in topics:
+                return
+            full = len(topics) >= MAX_SUBSCRIPTIONS
+            if not full:
+                topics.add(topic)
+                # Copy on write: a publish that already has the old set finishes with it
+                self.topics[topic] = self.topics.get(topic, frozenset()) | {self.outboxes[conn]}
+        if full: # Replied without the lock, like every put()
+            self.reply(self.outboxes[conn], {"type": "error", "reason": f"More than {MAX_SUBSCRIPTIONS} topics"})
+
+    def unsubscribe(self, conn, topic):
+        with self.topics_lock:
+            topics = self.subscriptions.get(conn)
+            if topics is not None and topic in topics:
+                topics.discard(topic)
+                self._unsubscribe_locked(topic, self.outboxes[conn])
+
+    def _unsubscribe_locked(self, topic, outbox):
+        subscribers = self.topics[topic] - {outbox}
+        if subscribers:
+            self.topics[topic] = subscribers
+        else:
+            del self.topics[topic]
+
+    def broadcast_message(self, message, sender_conn):
+        start = time.perf_counter() if next(self._timed) else None
+        # Encode once, every client gets the same bytes object
+        data = encode_frame(self.codec.encode(message))
+        everyone = self._everyone
+        if everyone is None:
+            # Hold the lock only to copy the outboxes, not while sending
+            with self.lock:
+                everyone = self._everyone = tuple(self.outboxes.values())
+        sender = self.outboxes.get(sender_conn)
+        forwarded = 0
+        for outbox in everyone:
+            if outbox is not sender and outbox.put(data):
+                forwarded += 1
+            # A client that was disconnected is removed by its handle_client thread
+        MESSAGES_FORWARDED.inc(forwarded)
+        if start is not None:
+            BROADCAST_SECONDS.observe(time.perf_counter() - start)
+        print(f"Forwarded message to {forwarded} clients: {message}")
+
+    def publish(self, topic, message, sender_conn=None):
+        """
+        Sends a message to the subscribers of a topic, except the sender.
+        Costs the same however many other clients are connected.
+        """
+        start = time.perf_counter() if next(self._timed) else None
+        subscribers = self.topics.get(topic, ()) # A snapshot, see subscribe()
+        sender = self.outboxes.get(sender_conn)
+        forwarded = 0
+        if subscribers:
+            data = encode_frame(self.codec.encode(message))
+            for outbox in subscribers:
+                if outbox is not sender and outbox.put(data):
+                    forwarded += 1
+        MESSAGES_FORWARDED.inc(forwarded)
+        if start is not None:
+            PUBLISH_SECONDS.observe(time.perf_counter() - start)
+        print(f"Published message to {forwarded} subscribers of {topic!r}")
+        return forwarded
+
+    def send_direct(self, client_id, message):
+        """
+        Sends a message to one client. Returns False if there is no such client.
+        """
+        outbox = self.clients_by_id.get(client_id)
+        if outbox is None or not outbox.put(encode_frame(self.codec.encode(message))):
+            return False
+        MESSAGES_FORWARDED.inc()
+        print(f"Sent message to client {client_id}")
+        return True
+
+class AsyncServer:
+    """
+    Same chat protocol as Server, but all connections are handled by one
+    asyncio event loop instead of one thread per client.
+
+    With reuse_port=True several processes can listen on the same port
+    (SO_REUSEPORT) and the kernel spreads new connections over them; see
+    start_workers. Messages are then only forwarded to the clients connected
+    to the same process.
+
+    Messages for a client are buffered by its transport. Once max_buffer
+    bytes are waiting for a client that does not read, the slow-consumer
+    policy applies like in Server, except that DROP_OLDEST drops the new
+    message: bytes already handed to the transport cannot be taken back.
+    """
+    def __init__(self, host, port, reuse_port=False, codec=DEFAULT_CODEC, max_buffer=1024 * 1024,
+                 slow_consumer_policy=DROP_OLDEST, backpressure_timeout=5.0):
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.codec = codec
+        self._timed = itertools.cycle((True,) + (False,) * (TIMING_SAMPLE - 1)) # Which fan-outs to time
+        self.max_buffer = max_buffer
+        self.slow_consumer_policy = slow_consumer_policy
+        self.backpressure_timeout = backpressure_timeout
+        self._backlogged = set() # Writers over max_buffer that the current sender has to wait for
+        self.clients = {}  # writer -> address of every connected client
+        self.client_ids = {}  # writer -> client id
+        self.clients_by_id = {}  # client id -> writer
+        self.topics = {}  # topic -> set of the subscribed writers
+        self.subscriptions = {}  # writer -> set of the topics it subscribed to
+        self._ids = itertools.count(1)
+
+    def start(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_client, self.host, self.port,
+                                            reuse_address=True, reuse_port=self.reuse_port or None,
+                                            backlog=4096)
+        print(f"Server listening on {self.host}:{self.port} (asyncio)")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        print(f"Connected by {addr}")
+        self.clients[writer] = addr
+        client_id = self.client_ids[writer] = next(self._ids)
+        self.clients_by_id[client_id] = writer
+        # drain() waits until the buffer is back under max_buffer
+        writer.transport.set_write_buffer_limits(high=self.max_buffer)
+        CLIENTS.inc()
+        frame_reader = FrameReader()
         try:
             while True:
                 # Receive data from the client
-                data = conn.recv(4096)
+                data = await reader.read(RECV_SIZE)
                 if not data:
                     break # Client disconnected
 
-                try:
-                    message = pickle.loads(data)
+                frame_reader.feed(data)
+                for payload in frame_reader.frames():
+                    message = self.codec.decode(payload)
+                    MESSAGES_RECEIVED.inc()
                     print(f"Received from {addr}: {message}")
+                    self.handle_message(message, writer)
+                    if self._backlogged:
+                        # BACKPRESSURE: stop reading from this sender until the slow clients catch up
+                        backlogged, self._backlogged = self._backlogged, set()
+                        await self._wait_for(backlogged)
 
-                    # Forward the message to other clients
-                    self.broadcast_message(message, sender_conn=conn)
-
-                except pickle.UnpicklingError:
-                    print(f"Could not unpickle data from {addr}. Data: {data}")
-                    break
-
+        except ProtocolError as e:
+            print(f"Invalid data from {addr}: {e}")
         except Exception as e:
             print(f"Error handling client {addr}: {e}")
         finally:
             print(f"Client {addr} disconnected.")
-            with self.lock:
-                self.clients.remove((conn, addr))
-            conn.close()
+            self.clients.pop(writer, None)
+            del self.clients_by_id[self.client_ids.pop(writer)]
+            for topic in self.subscriptions.pop(writer, ()):
+                self._unsubscribe(topic, writer)
+            CLIENTS.dec()
+            writer.close()
+
+    def handle_message(self, message, writer):
+        # Only one coroutine runs at a time, so none of this needs a lock
+        kind, argument, error = parse_control_message(message)
+        if kind is None:
+            # Forward the message to other clients
+            self.broadcast_message(message, sender_writer=writer)
+            return
+        client_id = self.client_ids[writer]
+        if error is not None:
+            self.reply(writer, {"type": "error", "reason": error})
+        elif kind == "hello":
+            self.reply(writer, {"type": "welcome", "id": client_id})
+        elif kind == "subscribe":
+            topics = self.subscriptions.setdefault(writer, set())
+            if argument not in topics:
+                if len(topics) >= MAX_SUBSCRIPTIONS:
+                    self.reply(writer, {"type": "error", "reason": f"More than {MAX_SUBSCRIPTIONS} topics"})
+                else:
+                    topics.add(argument)
+                    self.topics.setdefault(argument, set()).add(writer)
+        elif kind == "unsubscribe":
+            topics = self.subscriptions.get(writer)
+            if topics is not None and argument in topics:
+                topics.discard(argument)
+                self._unsubscribe(argument, writer)
+        elif kind == "publish":
+            self.publish(argument, dict(message, **{"from": client_id}), sender_writer=writer)
+        elif not self.send_direct(argument, dict(message, **{"from": client_id})):
+            self.reply(writer, {"type": "error", "reason": f"No client with id {argument}"})
+
+    def reply(self, writer, message):
+        self._deliver(writer, encode_frame(self.codec.encode(message)))
+
+    def _deliver(self, writer, data):
+        """
+        Writes data for one client, unless the client is gone or too slow.
+        Returns True if the data was written.
+        """
+        if writer.is_closing():
+            return False
+        if writer.transport.get_write_buffer_size() >= self.max_buffer:
+            if self.slow_consumer_policy == DROP_OLDEST:
+                MESSAGES_DROPPED.inc()
+                return False
+            if self.slow_consumer_policy == BACKPRESSURE:
+                self._backlogged.add(writer) # Written anyway, the sender waits in handle_client
+            else:
+                self._disconnect_slow(writer)
+                return False
+        writer.write(data) # Buffered by the transport, never blocks
+        return True
+
+    def _disconnect_slow(self, writer):
+        print(f"Client {self.clients.get(writer)} is too slow, disconnecting.")
+        SLOW_CLIENTS.inc()
+        writer.transport.abort() # Throws the buffer away; handle_client of that client cleans up
+
+    async def _wait_for(self, writers):
+        for writer in writers:
+            try:
+                await asyncio.wait_for(writer.drain(), self.backpressure_timeout)
+            except asyncio.TimeoutError:
+                self._disconnect_slow(writer)
+            except ConnectionError:
+                pass # Gone already
+
+    def _unsubscribe(self, topic, writer):
+        subscribers = self.topics[topic]
+        subscribers.discard(writer)
+        if not subscribers:
+            del self.topics[topic]
+
+    def broadcast_message(self, message, sender_writer):
+        start = time.perf_counter() if next(self._timed) else None
+        # Only one coroutine runs at a time, so no lock is needed
+        data = encode_frame(self.codec.encode(message))
+        forwarded = 0
+        for client_writer, client_addr in list(self.clients.items()):
+            if client_writer is not sender_writer: # Don't send back to the sender
+                if self._deliver(client_writer, data):
+                    forwarded += 1
+                    print(f"Forwarded message to {client_addr}: {message}")
+        MESSAGES_FORWARDED.inc(forwarded)
+        if start is not None:
+            BROADCAST_SECONDS.observe(time.perf_counter() - start)
+
+    def publish(self, topic, message, sender_writer=None):
+        start = time.perf_counter() if next(self._timed) else None
+        forwarded = 0
+        subscribers = self.topics.get(topic)
+        if subscribers:
+            data = encode_frame(self.codec.encode(message))
+            for client_writer in subscribers:
+                if client_writer is not sender_writer and self._deliver(client_writer, data):
+                    forwarded += 1
+        MESSAGES_FORWARDED.inc(forwarded)
+        if start is not None:
+            PUBLISH_SECONDS.observe(time.perf_counter() - start)
+        print(f"Published message to {forwarded} subscribers of {topic!r}")
+        return forwarded
+
+    def send_direct(self, client_id, message):
+        client_writer = self.clients_by_id.get(client_id)
+        if client_writer is None or client_writer.is_closing():
+            return False
+        if self._deliver(client_writer, encode_frame(self.codec.encode(message))):
+            MESSAGES_FORWARDED.inc()
+        print(f"Sent message to client {client_id}")
+        return True
+
+
+def _run_worker(host, port, options):
+    AsyncServer(host, port, reuse_port=True, **options).start()
+
+
+def start_workers(host, port, workers, **options):
+    """
+    Starts `workers` processes running AsyncServer on the same port
+    (SO_REUSEPORT) so that more than one CPU core is used. Options
+    (max_buffer, slow_consumer_policy, ...) are passed on to AsyncServer.
+    """
+    processes = [multiprocessing.Process(target=_run_worker, args=(host, port, options), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    print(f"Started {workers} worker processes on {host}:{port}")
+    for process in processes:
+        process.join()
 
-    def broadcast_message(self, message, sender_conn):
-        with self.lock:
-            for client_conn, client_addr in self.clients:
-                if client_conn != sender_conn: # Don't send back to the sender
-                    try:
-                        client_conn.sendall(pickle.dumps(message))
-                        print(f"Forwarded message to {client_addr}: {message}")
-                    except Exception as e:
-                        print(f"Error sending to {client_addr}: {e}")
-                        # Remove problematic client (optional, but good for robustness)
-                        self.clients.remove((client_conn, client_addr))
-                        client_conn.close()
 
 if __name__ == "__main__":
-    server = Server(HOST, PORT)
-    server.start()
\ No newline at end of file
+    # python server.py           - one thread per client
+    # python server.py async     - one asyncio event loop
+    # python server.py async 4   - four event loop processes sharing the port
+    mode = sys.argv[1] if len(sys.argv) > 1 else "threads"
+    workers = int(sys.argv[2]) if mode == "async" and len(sys.argv) > 2 else 1
+    if METRICS_PORT is not None and workers == 1:
+        # Worker processes each have their own numbers, so there is no single endpoint for them
+        metrics.start_http_server(METRICS_PORT)
+    if mode == "async":
+        if workers > 1:
+            start_workers(HOST, PORT, workers)
+        else:
+            AsyncServer(HOST, PORT).start()
+    else:
+        server = Server(HOST, PORT)
+        server.start()
\ No newline at end of file
@@ -1,16 +1,207 @@
 import socket
 import os
+import sys
+import threading
+
+from protocol import FrameReader, HEADER, encode_message
+from transfer import (BUFFER_SIZE, SENDFILE_CHUNK, SOCKET_BUFFER_SIZE, CHUNK_SIZE, PARALLEL_CONNECTIONS,
+                      TRANSFER_MAGIC, TRANSFER_VERSION, Progress, set_socket_buffers, file_checksums,
+                      read_message, compress_chunk)
 
 # Configuration
 HOST = '127.0.0.1'  # The server's hostname or IP address
 PORT = 65432        # The port used by the server
-BUFFER_SIZE = 4096  # How much data to send at once
 
-def run_file_client():
+def send_file(s, file_to_send, use_sendfile=True, buffer_size=BUFFER_SIZE):
+    """
+    Sends the filename (with a newline terminator) and then the file content.
+
+    With use_sendfile the kernel copies the file straight into the socket
+    (socket.sendfile / os.sendfile), without reading it into Python. Otherwise
+    the file is read into one reusable buffer and sent from there.
+
+    Returns:
+        int: Number of file bytes sent.
+    """
+    filename = os.path.basename(file_to_send)
+    file_size = os.path.getsize(file_to_send)
+
+    # 1. Send filename (with a newline terminator)
+    print(f"Sending filename '{filename}'...")
+    s.sendall(f"{filename}\n".encode('utf-8'))
+
+    # 2. Open file for reading in binary mode
+    print(f"Opening file '{file_to_send}' ({file_size} bytes) for sending...")
+    progress = Progress("Sent", total=file_size)
+    with open(file_to_send, 'rb') as f:
+        if use_sendfile:
+            # socket.sendfile falls back to a read/send loop where os.sendfile is not available
+            while progress.done < file_size:
+                sent = s.sendfile(f, offset=progress.done, count=min(SENDFILE_CHUNK, file_size - progress.done))
+                if sent == 0:
+                    break # File got shorter while sending
+                progress.update(sent)
+        else:
+            buffer = bytearray(buffer_size)
+            view = memoryview(buffer)
+            while True:
+                bytes_read = f.readinto(buffer)
+                if not bytes_read:
+                    # File is done reading
+                    break
+                s.sendall(view[:bytes_read])
+                progress.update(bytes_read)
+    progress.finish()
+    return progress.done
+
+def _open_transfer(host, port, offer, socket_buffer_size):
+    # Connects, offers the file and returns the socket, its reader and the receiver's "have" reply
+    s = socket.create_connection((host, port))
+    try:
+        set_socket_buffers(s, socket_buffer_size)
+        s.sendall(TRANSFER_MAGIC + bytes([TRANSFER_VERSION]) + encode_message(offer))
+        reader = FrameReader()
+        reply = read_message(s, reader)
+        if reply.get("type") != "have":
+            raise ConnectionError(f"Receiver refused the file: {reply.get('reason', reply)}")
+        return s, reader, reply
+    except BaseException:
+        s.close()
+        raise
+
+def _send_chunks(s, reader, file_to_send, indexes, crcs, chunk_size, file_size, compression, progress, stats):
+    # Sends some chunks on one connection and returns the receiver's ack
+    codec, level = compression
+    buffer = bytearray(chunk_size) if codec is not None else None
+    with open(file_to_send, 'rb') as f:
+        for index in indexes:
+            offset = index * chunk_size
+            length = min(chunk_size, file_size - offset)
+            message = {"type": "chunk", "index": index, "crc": crcs[index]}
+            if codec is None:
+                s.sendall(encode_message(message) + HEADER.pack(length))
+                if s.sendfile(f, offset=offset, count=length) != length:
+                    raise OSError(f"'{file_to_send}' changed while it was being sent")
+                wire_bytes = length
+            else:
+                f.seek(offset)
+                if f.readinto(buffer) < length:
+                    raise OSError(f"'{file_to_send}' changed while it was being sent")
+                data = memoryview(buffer)[:length]
+                compressed = compress_chunk(data, codec, level)
+                if compressed is not None:
+                    message["codec"] = codec
+                    data = compressed
+                s.sendall(encode_message(message) + HEADER.pack(len(data)))
+                s.sendall(data)
+                wire_bytes = len(data)
+            with stats["lock"]:
+                progress.update(length)
+                stats["wire_bytes"] += wire_bytes
+    s.sendall(encode_message({"type": "end"}))
+    ack = read_message(s, reader)
+    if ack.get("type") != "ack":
+        raise ConnectionError(f"Receiver refused the chunks: {ack.get('reason', ack)}")
+    return ack
+
+def send_file_chunked(file_to_send, host=HOST, port=PORT, connections=PARALLEL_CONNECTIONS, chunk_size=CHUNK_SIZE,
+                      retries=3, dedup=True, compression=None, compression_level=None,
+                      socket_buffer_size=SOCKET_BUFFER_SIZE):
+    """
+    Sends a file with the chunked transfer protocol (see transfer.py).
+
+    The chunks the receiver does not have yet are split into contiguous
+    stripes sent over up to `connections` parallel connections. Every chunk
+    carries a CRC-32 and the receiver checks the SHA-256 of the whole file.
+    If a connection fails, or chunks arrive damaged, the transfer is resumed
+    (up to `retries` times) by sending only the chunks still missing.
+
+    Args:
+        dedup (bool): Let the receiver reuse files and chunks it already has.
+        compression (str): "zlib" or "lzma" to compress the chunks that are
+            worth it, None to send them as they are.
+        compression_level (int): zlib level or lzma preset, None for the default.
+
+    Returns:
+        int: Number of chunk bytes sent over the wire. This is less than the
+        file size if the receiver already had part of the file or chunks
+        were compressed.
+
+    Raises:
+        ConnectionError: If the file could not be transferred completely.
+    """
+    filename = os.path.basename(file_to_send)
+    file_size = os.path.getsize(file_to_send)
+    print(f"Computing checksums of '{file_to_send}' ({file_size} bytes)...")
+    file_hash, crcs, blocks = file_checksums(file_to_send, chunk_size, block_hashes=dedup)
+    offer = {"type": "offer", "name": filename, "size": file_size, "chunk_size": chunk_size, "hash": file_hash,
+             "dedup": dedup}
+    if dedup:
+        offer["blocks"] = blocks
+    if compression is not None:
+        offer["compression"] = compression
+    progress = Progress(f"Sent '{filename}'", total=file_size)
+    stats = {"lock": threading.Lock(), "wire_bytes": 0}
+
+    for attempt in range(retries + 1):
+        if attempt:
+            print(f"\nResuming '{filename}' (attempt {attempt + 1} of {retries + 1})...")
+        try:
+            first = _open_transfer(host, port, offer, socket_buffer_size)
+        except (OSError, ValueError) as e:
+            print(f"Could not start the transfer: {e}")
+            continue
+        missing = [index for index, has in enumerate(first[2]["chunks"]) if not has]
+        if not missing:
+            first[0].close()
+            progress.finish()
+            return stats["wire_bytes"]
+        # The receiver decides whether compression is used
+        agreed = (first[2].get("compression"), compression_level)
+
+        # Contiguous stripes keep the writes on the receiving side sequential
+        n_stripes = min(connections, len(missing))
+        per_stripe = -(-len(missing) // n_stripes)
+        stripes = [missing[i:i + per_stripe] for i in range(0, len(missing), per_stripe)]
+        acks = [None] * len(stripes)
+
+        def run_stripe(number):
+            s = None
+            try:
+                if number == 0:
+                    s, reader, _ = first
+                else:
+                    s, reader, _ = _open_transfer(host, port, offer, socket_buffer_size)
+                acks[number] = _send_chunks(s, reader, file_to_send, stripes[number], crcs, chunk_size,
+                                            file_size, agreed, progress, stats)
+            except (OSError, ValueError) as e:
+                print(f"\nConnection {number + 1} failed: {e}")
+            finally:
+                if s is not None:
+                    s.close()
+
+        threads = [threading.Thread(target=run_stripe, args=(number,)) for number in range(len(stripes))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if any(ack is not None and ack.get("complete") for ack in acks):
+            progress.finish()
+            return stats["wire_bytes"]
+        bad = sum(len(ack["bad"]) for ack in acks if ack is not None)
+        if bad:
+            print(f"\n{bad} chunks arrived damaged.")
+
+    progress.finish()
+    raise ConnectionError(f"Could not transfer '{filename}' after {retries + 1} attempts")
+
+def run_file_client(file_to_send=None, use_sendfile=True, socket_buffer_size=SOCKET_BUFFER_SIZE):
     """
     Connects to the server and sends a specified file.
     """
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        set_socket_buffers(s, socket_buffer_size)
         try:
             s.connect((HOST, PORT))
             print(f"Connected to server at {HOST}:{PORT}")
@@ -21,46 +212,21 @@ def run_file_client():
             print(f"Could not connect to server: {e}")
             return
 
-        file_to_send = input("Enter the path to the file you want to send: ")
+        if file_to_send is None:
+            file_to_send = input("Enter the path to the file you want to send: ")
 
         if not os.path.exists(file_to_send):
             print(f"Error: File '{file_to_send}' not found.")
             return
-        
+
         if not os.path.isfile(file_to_send):
             print(f"Error: '{file_to_send}' is not a regular file.")
             return
 
-        filename = os.path.basename(file_to_send)
-        file_size = os.path.getsize(file_to_send)
-
-
         try:
-            # 1. Send filename (with a newline terminator)
-            print(f"Sending filename '{filename}'...")
-            s.sendall(f"{filename}\n".encode('utf-8'))
-            
-            # Add a small delay, sometimes helpful for socket buffer flushing
-            # (though not strictly necessary with proper socket usage)
-            # import time
-            # time.sleep(0.1) 
-
-            # 2. Open file for reading in binary mode
-            print(f"Opening file '{file_to_send}' ({file_size} bytes) for sending...") 
-            with open(file_to_send,'rb') as f:
-                sent_bytes = 0
-                while True:
-                    bytes_read = f.read = f.read (BUFFER_SIZE)
-                    if not bytes_read:
-                        # File is done reading
-                        break
-                    s.sendall(bytes_read)
-                    sent_bytes +=len(bytes_read)
-                    # Optional: print prograss
-                    print(f"\rSent {sent_bytes}/{file_size} bytes...", end='')
-        
-            print(f"\nSuccessfully sent '{filename}'.")
-        
+            send_file(s, file_to_send, use_sendfile=use_sendfile)
+            print(f"Successfully sent '{os.path.basename(file_to_send)}'.")
+
         except Exception as e:
             print(f"An error occurred during file transfer: {e}")
         finally:
@@ -71,5 +237,24 @@ def run_file_client():
             #s.close()
             print("Client socket closed.")
 
+def run_chunked_file_client(file_to_send=None, connections=PARALLEL_CONNECTIONS,
+                            socket_buffer_size=SOCKET_BUFFER_SIZE):
+    """
+    Sends a file to the server with the chunked, resumable transfer protocol.
+    """
+    if file_to_send is None:
+        file_to_send = input("Enter the path to the file you want to send: ")
+
+    if not os.path.isfile(file_to_send):
+        print(f"Error: File '{file_to_send}' not found or not a regular file.")
+        return
+
+    try:
+        sent = send_file_chunked(file_to_send, connections=connections, socket_buffer_size=socket_buffer_size)
+        print(f"Successfully sent '{os.path.basename(file_to_send)}' ({sent} bytes over the wire).")
+    except Exception as e:
+        print(f"An error occurred during file transfer: {e}")
+
 if __name__ == '__main__':
-    run_file_client()
\ No newline at end of file
+    # python socket_ftp.py [file] - asks for the file if it is not given
+    run_chunked_file_client(sys.argv[1] if len(sys.argv) > 1 else None)
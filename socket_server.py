@@ -2,64 +2,510 @@
 
 import socket
 import os
+import zlib
+import struct
+import hashlib
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from content_store import get_content_store
+from protocol import MAX_FRAME_SIZE, FrameReader, ProtocolError, encode_message, DEFAULT_CODEC
+from transfer import (BUFFER_SIZE, SOCKET_BUFFER_SIZE, TRANSFER_MAGIC, TRANSFER_VERSION, COMPRESSORS, Progress,
+                      set_socket_buffers, chunk_count, read_message, decompress_chunk)
 
 HOST = '127.0.0.1'  # Standard loopback interface address (localhost)
 PORT = 65432        # Port to listen on (non-privileged ports are > 1023)
 FILE_SAVE_DIR = 'received_files' # Directory where received files will be saved
+MAX_FILENAME_LENGTH = 1024
+MAX_WORKERS = 16 # Uploads received at the same time
+MAX_QUEUED = 64 # Accepted uploads waiting for a worker; more connections are rejected
+IDLE_TIMEOUT = 30 # Seconds a client may stay silent before it is disconnected
+MAX_FILE_SIZE = 16 * 1024 ** 3 # Largest accepted upload in bytes, None for no limit
+MIN_CHUNK_SIZE = 64 * 1024 # Smallest chunk size a chunked transfer may use
+MAX_CHUNKS = 1 << 20 # Most chunks one chunked transfer may have
+PARTIAL_MAX_AGE = 7 * 24 * 3600 # Seconds before the files of an abandoned upload are removed, None to keep them
+PARTIAL_EXPIRY_INTERVAL = 3600 # Seconds between looking for abandoned uploads while the server runs
+METRICS_PORT = 9110 # Serves http://127.0.0.1:9110/metrics, None to disable
+CONTENT_STORE_DIR = '.store' # Content store inside the save directory (see content_store.py), None to disable
+DEDUP_HOSTS = ('127.0.0.1', '::1') # Clients that may have files and chunks taken from the content store
+
+# Runtime numbers, see metrics.py
+UPLOADS = {outcome: metrics.counter("upload_connections_total", "Upload connections, by outcome", result=outcome)
+           for outcome in ("complete", "incomplete", "failed", "rejected")}
+UPLOAD_BYTES = metrics.counter("upload_received_bytes_total", "File data received (after decompression)")
+BAD_CHUNKS = metrics.counter("upload_bad_chunks_total", "Chunks that failed their CRC check")
+ACTIVE_UPLOADS = metrics.gauge("upload_active", "Uploads being received right now")
+UPLOAD_SECONDS = metrics.histogram("upload_duration_seconds", "Time from accepting an upload to closing it",
+                                   buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+
+class UploadError(Exception):
+    """
+    Raised when an upload breaks a per-connection limit.
+    """
+
+def receive_file(conn, addr, save_dir=FILE_SAVE_DIR, buffer_size=BUFFER_SIZE, max_file_size=MAX_FILE_SIZE):
+    """
+    Receives one file: a filename ending with a newline, then the file
+    content until the client closes its side.
+
+    Everything is received into one preallocated buffer with recv_into() and
+    written to the file straight from that buffer. The data goes to a
+    temporary file in save_dir that is renamed to the real name only when
+    the upload is complete, so nobody ever sees a half-written file.
+
+    Returns:
+        str: Path of the saved file, or None if no filename was received.
+    """
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+
+    # Step 1: Receive the filename
+    # The first recv may already contain the start of the file after the newline.
+    received = 0
+    while True:
+        newline = buffer.find(b'\n', 0, received)
+        if newline != -1:
+            break
+        if received >= MAX_FILENAME_LENGTH:
+            print(f"Filename from {addr} is too long. Closing connection.")
+            return None
+        n = conn.recv_into(view[received:])
+        if not n:
+            print(f"No filename data received from {addr}. Closing connection.")
+            return None
+        received += n
+
+    # Basic security: Sanitize the filename to prevent directory traversal
+    filename = os.path.basename(buffer[:newline].decode('utf-8').strip())
+    # Names starting with a dot are refused like in _check_offer: the .part/.state files and the store use them
+    if '\0' in filename or not filename or filename.startswith('.'):
+        print(f"Bad filename from {addr}. Closing connection.")
+        return None
+    save_path = os.path.join(save_dir, filename)
+
+    print(f"Receiving file '{filename}' from {addr}, saving to '{save_path}'")
+    progress = Progress(f"Received '{filename}' from {addr}", overwrite=False)
+    # Step 2: Receive the file content and write it
+    fd, temp_path = tempfile.mkstemp(dir=save_dir, prefix=f".{filename}.", suffix='.part')
+    try:
+        with open(fd, 'wb') as f: # Open in binary write mode
+            leftover = view[newline + 1:received]
+            f.write(leftover)
+            progress.update(len(leftover))
+            UPLOAD_BYTES.inc(len(leftover))
+            while True:
+                bytes_read = conn.recv_into(view)
+                if not bytes_read: # If recv_into() returns 0 the client is done
+                    break
+                f.write(view[:bytes_read]) # Write the received bytes straight from the buffer
+                progress.update(bytes_read)
+                UPLOAD_BYTES.inc(bytes_read)
+                if max_file_size is not None and progress.done > max_file_size:
+                    raise UploadError(f"File is bigger than the limit of {max_file_size} bytes")
+        os.replace(temp_path, save_path) # Atomic: the file appears complete or not at all
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    progress.finish()
+    return save_path
+
+class PartialFile:
+    """
+    A file received in chunks, possibly over several connections at once.
+
+    Chunks are written with os.pwrite() at their offset in a .part file. The
+    CRC-32 of every written chunk goes to a .state file next to it, so a
+    transfer that was cut off can be resumed, also after a server restart.
+    When the last chunk arrives the SHA-256 of the whole file is checked and
+    the .part file is renamed to its real name, and added to the content
+    store if there is one.
+    """
+    STATE = struct.Struct('!BI') # Written flag, CRC-32
+
+    def __init__(self, save_dir, name, size, chunk_size, file_hash, store=None):
+        self.save_path = os.path.join(save_dir, name)
+        base = os.path.join(save_dir, f".{name}.{file_hash[:16]}")
+        self.part_path = base + '.part'
+        self.state_path = base + '.state'
+        self.size = size
+        self.chunk_size = chunk_size
+        self.file_hash = file_hash
+        self.store = store
+        self.n_chunks = chunk_count(size, chunk_size)
+        self.have = bytearray(self.n_chunks)
+        self.missing = self.n_chunks
+        self.complete = False
+        self.scanned = False # Chunks already taken from the content store
+        self.users = 0 # Connections using this file
+        self.writing = 0 # Chunks being written right now
+        self.lock = threading.Condition()
+        self.fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.state_fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+        os.ftruncate(self.fd, size)
+        self._load_state()
+
+    def _load_state(self):
+        # Keep the chunks of an earlier connection whose data is still intact
+        state = os.pread(self.state_fd, self.n_chunks * self.STATE.size, 0)
+        for index in range(len(state) // self.STATE.size):
+            written, crc = self.STATE.unpack_from(state, index * self.STATE.size)
+            if written and zlib.crc32(os.pread(self.fd, self.chunk_length(index), index * self.chunk_size)) == crc:
+                self.have[index] = 1
+                self.missing -= 1
+
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def write_chunk(self, index, data, crc):
+        """
+        Checks a chunk against its CRC-32 and writes it.
+
+        Returns:
+            bool: False if the chunk is damaged.
+        """
+        if len(data) != self.chunk_length(index) or zlib.crc32(data) != crc:
+            return False
+        with self.lock:
+            if self.have[index] or self.complete:
+                return True # Already written by another connection
+            self.writing += 1
+        try:
+            os.pwrite(self.fd, data, index * self.chunk_size)
+            os.pwrite(self.state_fd, self.STATE.pack(1, crc), index * self.STATE.size)
+        finally:
+            with self.lock:
+                self.writing -= 1
+                last = False
+                if not self.have[index]:
+                    self.have[index] = 1
+                    self.missing -= 1
+                    last = self.missing == 0
+                self.lock.notify_all()
+        if last:
+            self.finish()
+        return True
+
+    def finish(self):
+        """
+        Checks the whole file and moves it into place once every chunk is written.
+        If the SHA-256 does not match, all chunks are marked missing again.
+        """
+        with self.lock:
+            self.lock.wait_for(lambda: self.writing == 0)
+            if self.complete or self.missing:
+                return
+            digest = hashlib.sha256()
+            blocks = []
+            with open(self.part_path, 'rb') as f:
+                for block in iter(lambda: f.read(self.chunk_size), b''):
+                    digest.update(block)
+                    blocks.append(hashlib.sha256(block).digest())
+            if digest.hexdigest() != self.file_hash:
+                print(f"'{self.save_path}' does not match its hash, receiving it again.")
+                self.have = bytearray(self.n_chunks)
+                self.missing = self.n_chunks
+                os.ftruncate(self.state_fd, 0)
+                return
+            self.close()
+            os.replace(self.part_path, self.save_path) # Atomic: the file appears complete or not at all
+            os.remove(self.state_path)
+            self.complete = True
+            if self.store is not None:
+                try:
+                    self.store.add_file(self.save_path, self.file_hash, self.chunk_size, blocks)
+                except OSError as e:
+                    print(f"Could not add '{self.save_path}' to the content store: {e}")
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            os.close(self.state_fd)
+            self.fd = self.state_fd = None
+
+# Files being received in chunks, by (save_dir, name, size, chunk_size, hash)
+_partial_files = {}
+_partial_files_lock = threading.Lock()
+_next_expiry = {} # save_dir -> time.monotonic() of the next remove_abandoned_uploads() from open_partial_file()
+
+def remove_abandoned_uploads(save_dir, max_age=PARTIAL_MAX_AGE):
+    """
+    Removes the .part and .state files of uploads that have not been
+    written to for max_age seconds. Every .part file has the full size of
+    its upload, so abandoned ones would otherwise fill the disk.
 
-def start_server():
+    Returns:
+        int: Number of files removed.
+    """
+    if max_age is None:
+        return 0
+    oldest = time.time() - max_age
+    removed = 0
+    with _partial_files_lock:
+        in_use = {path for partial in _partial_files.values() for path in (partial.part_path, partial.state_path)}
+        with os.scandir(save_dir) as entries:
+            for entry in entries:
+                if not entry.name.startswith('.') or not entry.name.endswith(('.part', '.state')):
+                    continue
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < oldest and entry.path not in in_use:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    pass # Removed or finished in the meantime
+    if removed:
+        print(f"Removed {removed} files of abandoned uploads from '{save_dir}'.")
+    return removed
+
+def open_partial_file(save_dir, name, size, chunk_size, file_hash, store=None):
+    key = (save_dir, name, size, chunk_size, file_hash)
+    if time.monotonic() >= _next_expiry.get(save_dir, 0):
+        _next_expiry[save_dir] = time.monotonic() + PARTIAL_EXPIRY_INTERVAL
+        remove_abandoned_uploads(save_dir)
+    with _partial_files_lock:
+        partial = _partial_files.get(key)
+        if partial is None or partial.complete:
+            partial = _partial_files[key] = PartialFile(save_dir, name, size, chunk_size, file_hash, store)
+        partial.users += 1
+        return partial
+
+def release_partial_file(partial):
+    with _partial_files_lock:
+        partial.users -= 1
+        if partial.users == 0:
+            # Nobody is sending this file any more: the .state file remembers what arrived
+            partial.close()
+            key = (os.path.dirname(partial.save_path), os.path.basename(partial.save_path),
+                   partial.size, partial.chunk_size, partial.file_hash)
+            if _partial_files.get(key) is partial:
+                del _partial_files[key]
+
+def _check_offer(offer, max_file_size):
+    # Returns the reason an offer is refused, or None
+    if offer.get("type") != "offer":
+        return "Expected an offer"
+    name, size, chunk_size, file_hash = (offer.get(k) for k in ("name", "size", "chunk_size", "hash"))
+    if not isinstance(name, str) or not os.path.basename(name) or os.path.basename(name).startswith('.'):
+        return "Bad filename"
+    if not isinstance(size, int) or size < 0:
+        return "Bad size"
+    if max_file_size is not None and size > max_file_size:
+        return f"File is bigger than the limit of {max_file_size} bytes"
+    if not isinstance(chunk_size, int) or not MIN_CHUNK_SIZE <= chunk_size <= MAX_FRAME_SIZE:
+        return "Bad chunk size"
+    if chunk_count(size, chunk_size) > MAX_CHUNKS:
+        return f"Too many chunks (at most {MAX_CHUNKS})"
+    if not isinstance(file_hash, str) or len(file_hash) != 64 or not set(file_hash) <= set('0123456789abcdef'):
+        return "Bad hash"
+    blocks = offer.get("blocks")
+    if blocks is not None and (not isinstance(blocks, bytes) or len(blocks) != 32 * chunk_count(size, chunk_size)):
+        return "Bad block hashes"
+    return None
+
+def receive_file_chunked(conn, addr, save_dir=FILE_SAVE_DIR, max_file_size=MAX_FILE_SIZE, codec=DEFAULT_CODEC,
+                         dedup_hosts=DEDUP_HOSTS):
+    """
+    Receives chunks of one file with the chunked transfer protocol (see
+    transfer.py). Other connections may be sending other chunks of the
+    same file at the same time.
+
+    Only clients in dedup_hosts get files and chunks from the content
+    store. Anybody else could get a copy of any stored file just by
+    offering its hash, so their offers are received in full.
+
+    Returns:
+        str: Path of the saved file if it is complete now, otherwise None.
+    """
+    prefix = bytearray(len(TRANSFER_MAGIC) + 1)
+    view = memoryview(prefix)
+    received = 0
+    while received < len(prefix):
+        n = conn.recv_into(view[received:])
+        if not n:
+            return None
+        received += n
+    if prefix[-1] != TRANSFER_VERSION:
+        conn.sendall(encode_message({"type": "error", "reason": f"Unsupported protocol version {prefix[-1]}"}))
+        return None
+
+    reader = FrameReader()
+    offer = read_message(conn, reader, codec)
+    reason = _check_offer(offer, max_file_size)
+    if reason is not None:
+        print(f"Refusing transfer from {addr}: {reason}")
+        conn.sendall(encode_message({"type": "error", "reason": reason}))
+        return None
+
+    filename = os.path.basename(offer["name"])
+    dedup = bool(offer.get("dedup")) and addr[0] in dedup_hosts
+    compression = offer.get("compression") if offer.get("compression") in COMPRESSORS else None
+    store = get_content_store(os.path.join(save_dir, CONTENT_STORE_DIR)) if CONTENT_STORE_DIR else None
+    save_path = os.path.join(save_dir, filename)
+    if dedup and store is not None and store.copy_file(offer["hash"], save_path):
+        print(f"'{filename}' from {addr} is already in the content store, nothing to receive.")
+        n_chunks = chunk_count(offer["size"], offer["chunk_size"])
+        conn.sendall(encode_message({"type": "have", "chunks": b'\x01' * n_chunks, "compression": None}))
+        return save_path
+
+    partial = open_partial_file(save_dir, filename, offer["size"], offer["chunk_size"], offer["hash"], store)
+    try:
+        blocks = offer.get("blocks")
+        with partial.lock:
+            # Only the first connection of a transfer looks for its chunks in the store
+            scan, partial.scanned = not partial.scanned, True
+        if scan and dedup and store is not None and blocks is not None:
+            # Take the chunks the store already has from there
+            for index in range(partial.n_chunks):
+                if not partial.have[index]:
+                    data = store.read_block(blocks[32 * index:32 * (index + 1)])
+                    if data is not None:
+                        partial.write_chunk(index, data, zlib.crc32(data))
+        if not partial.missing:
+            partial.finish() # Nothing left to send (an empty file, or every chunk arrived earlier)
+        print(f"Receiving chunks of '{filename}' from {addr} ({partial.missing} of {partial.n_chunks} missing)")
+        conn.sendall(encode_message({"type": "have", "chunks": bytes(partial.have), "compression": compression}))
+
+        written = 0
+        bad = []
+        chunk = None # (index, crc) of the chunk whose data comes in the next frame
+        progress = Progress(f"Received chunks of '{filename}' from {addr}", overwrite=False)
+        while True:
+            for payload in reader.frames():
+                if chunk is not None:
+                    index, crc, chunk_codec = chunk
+                    chunk = None
+                    try:
+                        if chunk_codec is not None:
+                            payload = decompress_chunk(payload, chunk_codec, partial.chunk_length(index))
+                        ok = partial.write_chunk(index, payload, crc)
+                    except ProtocolError:
+                        ok = False
+                    if ok:
+                        written += 1
+                        progress.update(len(payload))
+                        UPLOAD_BYTES.inc(len(payload))
+                    else:
+                        bad.append(index)
+                        BAD_CHUNKS.inc()
+                    continue
+                message = codec.decode(payload)
+                if message.get("type") == "chunk":
+                    index, crc, chunk_codec = message.get("index"), message.get("crc"), message.get("codec")
+                    if not isinstance(index, int) or not 0 <= index < partial.n_chunks or not isinstance(crc, int):
+                        raise ProtocolError(f"Bad chunk {index}")
+                    if chunk_codec is not None and chunk_codec != compression:
+                        raise ProtocolError(f"Compression {chunk_codec!r} was not agreed on")
+                    chunk = (index, crc, chunk_codec)
+                elif message.get("type") == "end":
+                    progress.finish()
+                    conn.sendall(encode_message({"type": "ack", "written": written, "bad": bad,
+                                                 "complete": partial.complete}))
+                    return partial.save_path if partial.complete else None
+                else:
+                    raise ProtocolError(f"Unexpected message {message.get('type')!r}")
+            if not reader.recv_into(conn):
+                progress.finish()
+                print(f"Transfer of '{filename}' from {addr} was cut off, {partial.missing} chunks missing.")
+                return None
+    finally:
+        release_partial_file(partial)
+
+def handle_connection(conn, addr, save_dir=FILE_SAVE_DIR, idle_timeout=IDLE_TIMEOUT, max_file_size=MAX_FILE_SIZE,
+                      dedup_hosts=DEDUP_HOSTS):
+    """
+    Receives one upload on an accepted connection and closes it.
+    """
+    with conn: # 'with' statement ensures the socket is closed automatically
+        print(f"Connected by {addr}")
+        conn.settimeout(idle_timeout)
+        start = time.perf_counter()
+        outcome = "failed"
+        ACTIVE_UPLOADS.inc()
+        try:
+            # Clients using the chunked protocol start with TRANSFER_MAGIC, older ones with the filename
+            head = conn.recv(len(TRANSFER_MAGIC), socket.MSG_PEEK | getattr(socket, 'MSG_WAITALL', 0))
+            if head == TRANSFER_MAGIC:
+                filename = receive_file_chunked(conn, addr, save_dir=save_dir, max_file_size=max_file_size,
+                                                dedup_hosts=dedup_hosts)
+            else:
+                filename = receive_file(conn, addr, save_dir=save_dir, max_file_size=max_file_size)
+            if filename is not None:
+                print(f"Successfully received and saved '{filename}' from {addr}")
+                outcome = "complete"
+            else:
+                outcome = "incomplete"
+
+        except socket.timeout:
+            print(f"Client {addr} was idle for {idle_timeout}s, upload cancelled.")
+        except Exception as e:
+            print(f"Error during file transfer for {addr}: {e}")
+        finally:
+            ACTIVE_UPLOADS.dec()
+            UPLOADS[outcome].inc()
+            UPLOAD_SECONDS.observe(time.perf_counter() - start)
+            print(f"Connection from {addr} closed.")
+
+def start_server(socket_buffer_size=SOCKET_BUFFER_SIZE, max_workers=MAX_WORKERS, max_queued=MAX_QUEUED,
+                 idle_timeout=IDLE_TIMEOUT, save_dir=FILE_SAVE_DIR, stop_event=None, host=HOST, port=PORT,
+                 max_file_size=MAX_FILE_SIZE, dedup_hosts=DEDUP_HOSTS):
+    """
+    Receives files from many clients at the same time.
+
+    Up to max_workers uploads are received in parallel by a thread pool and
+    up to max_queued more wait for a free worker. Connections beyond that are
+    closed right away. Uploads bigger than max_file_size bytes are cancelled.
+    Deduplication is only done for clients with an address in dedup_hosts.
+    Files of uploads abandoned for PARTIAL_MAX_AGE seconds are removed.
+    Set stop_event to stop the server.
+    """
     # Create the directory to save received files if it doesn't exist
-    if not os.path.exists(FILE_SAVE_DIR):
-        os.makedirs(FILE_SAVE_DIR)
-        print(f"Created directory: {FILE_SAVE_DIR}")
+    if not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+        print(f"Created directory: {save_dir}")
+    remove_abandoned_uploads(save_dir)
+    _next_expiry[save_dir] = time.monotonic() + PARTIAL_EXPIRY_INTERVAL
+
+    # Every upload holds a slot from being accepted until it is finished
+    slots = threading.BoundedSemaphore(max_workers + max_queued)
+
+    def run_upload(conn, addr):
+        try:
+            handle_connection(conn, addr, save_dir=save_dir, idle_timeout=idle_timeout, max_file_size=max_file_size,
+                              dedup_hosts=dedup_hosts)
+        finally:
+            slots.release()
 
     # Create a TCP/IP socket
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload") as workers:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # Allow reuse of address
+        # Accepted connections inherit the buffer sizes of the listening socket
+        set_socket_buffers(s, socket_buffer_size)
         # Bind the socket to the host and port
-        s.bind((HOST, PORT))
-        # Listen for incoming connections (allow up to 1 pending connection)
-        s.listen()
-        print(f"Server listening on {HOST}:{PORT}")
+        s.bind((host, port))
+        # Listen for incoming connections
+        s.listen(max_workers + max_queued)
+        if stop_event is not None:
+            s.settimeout(0.5) # Wake up now and then to check stop_event
+        print(f"Server listening on {host}:{port} ({max_workers} workers)")
 
-        while True:
+        while stop_event is None or not stop_event.is_set():
             # Accept a new connection
-            conn, addr = s.accept()
-            with conn: # 'with' statement ensures the socket is closed automatically
-                print(f"Connected by {addr}")
-                try:
-                    # Step 1: Receive the filename
-                    # We expect the filename to be sent first, and it should be relatively small.
-                    # A more robust protocol might send the length of the filename first.
-                    filename_data = conn.recv(1024) # Receive up to 1024 bytes for the filename
-                    if not filename_data:
-                        print(f"No filename data received from {addr}. Closing connection.")
-                        continue # Go back to listening for a new client
-
-                    filename = filename_data.decode('utf-8')
-                    # Basic security: Sanitize the filename to prevent directory traversal
-                    filename = os.path.basename(filename)
-                    save_path = os.path.join(FILE_SAVE_DIR, filename)
-
-                    print(f"Receiving file: '{filename}'")
-                    print(f"Saving to: '{save_path}'")
-                    with open(save_path.rstrip(), 'w') as f:
-        # The 'with' statement ensures the file is properly closed.
-        # Writing nothing to it results in an empty file.
-                     pass
-                    # Step 2: Receive the file content and write it
-                    with open(save_path.rstrip(), 'wb') as f: # Open in binary write mode
-                        while True:
-                            bytes_read =conn.recv(4096)
-                            print (bytes_read) # Read data in chunks of 4KB
-                            if not bytes_read: # If recv() return empty bytes
-                                break
-                            f.write (bytes_read) # Write the received bytes to
-                    print(f"Successfully received and saved '{filename}' from {addr}")
-
-                except Exception as e:
-                    print(f"Error during file transfer for {addr}: {e}")
-                finally:
-                    print(f"Connection from {addr} closed.")
+            try:
+                conn, addr = s.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            if not slots.acquire(blocking=False):
+                print(f"Too many uploads, rejecting {addr}.")
+                UPLOADS["rejected"].inc()
+                conn.close()
+                continue
+            workers.submit(run_upload, conn, addr)
 
 if __name__ == "__main__":
-    start_server()
\ No newline at end of file
+    if METRICS_PORT is not None:
+        metrics.start_http_server(METRICS_PORT)
+    start_server()
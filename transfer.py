@@ -0,0 +1,207 @@
+# transfer.py
+# Helpers shared by the file sender (socket_ftp.py) and receiver (socket_server.py).
+
+import time
+import zlib
+import socket
+import hashlib
+
+try:
+    import lzma
+except ImportError: # Python can be built without it
+    lzma = None
+
+from protocol import DEFAULT_CODEC, ProtocolError
+
+BUFFER_SIZE = 1024 * 1024 # Read/write chunk size for the copy loops
+SOCKET_BUFFER_SIZE = None # SO_SNDBUF / SO_RCVBUF in bytes (e.g. 4 MiB), None keeps the OS default
+SENDFILE_CHUNK = 64 * 1024 * 1024 # Bytes per sendfile() call, progress is reported in between
+PROGRESS_INTERVAL = 1.0 # Seconds between two progress lines
+
+
+def set_socket_buffers(sock, size=SOCKET_BUFFER_SIZE):
+    """
+    Sets the kernel send and receive buffer sizes of a socket.
+    """
+    if size is None:
+        return
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, size)
+        except OSError:
+            pass # Keep the OS default
+
+
+class Progress:
+    """
+    Prints transfer progress at most once every `interval` seconds instead of for every chunk.
+
+    By default every line overwrites the previous one (with a carriage
+    return), which suits one transfer per terminal. With overwrite=False every
+    update is a line of its own, written in one go, so the lines of
+    transfers running at the same time (e.g. in the server) do not get mixed.
+    """
+
+    def __init__(self, label, total=None, interval=PROGRESS_INTERVAL, overwrite=True):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.overwrite = overwrite
+        self.done = 0
+        self.started = time.monotonic()
+        self._last_print = self.started
+
+    def update(self, size):
+        self.done += size
+        now = time.monotonic()
+        if now - self._last_print >= self.interval:
+            self._last_print = now
+            self._print(now, end='')
+
+    def finish(self):
+        self._print(time.monotonic(), end='\n')
+
+    def _print(self, now, end):
+        elapsed = max(now - self.started, 1e-9)
+        of_total = f"/{self.total}" if self.total is not None else ""
+        line = f"{self.label} {self.done}{of_total} bytes ({self.done / elapsed / 1e6:.1f} MB/s)"
+        if self.overwrite:
+            print("\r" + line, end=end, flush=True)
+        else:
+            print(line + "\n", end="", flush=True)
+
+
+# Chunked transfer protocol (version 2)
+#
+# The sender starts every connection with TRANSFER_MAGIC and the version byte,
+# followed by protocol.py frames. The magic starts with a NUL byte, which no
+# filename sent with the older protocol (filename, newline, data) can hold. Control messages are BinaryCodec dicts:
+#
+#   sender   -> {"type": "offer", "name", "size", "chunk_size", "hash",
+#                "dedup": bool, "blocks": bytes, "compression": str}
+#   receiver -> {"type": "have", "chunks": bytes with 1 for every chunk it already has,
+#                "compression": str or None}
+#   sender   -> {"type": "chunk", "index", "crc", "codec"} followed by one frame with the chunk data
+#               ... more chunks ...
+#   sender   -> {"type": "end"}
+#   receiver -> {"type": "ack", "written", "bad": [indexes], "complete": bool}
+#
+# "hash" is the SHA-256 of the whole file, "crc" the CRC-32 of one chunk.
+# Several connections may send chunks of the same file at once, and a
+# transfer that was cut off is resumed by sending only the missing chunks.
+# The receiver answers {"type": "error", "reason"} and closes the
+# connection if something is wrong.
+#
+# The optional offer fields:
+# - "dedup": the receiver may take the file, or single chunks, from the
+#   content store of files it received before (content_store.py) instead of
+#   having them sent again. "blocks" holds the SHA-256 digests of all chunks
+#   one after the other, so chunks can be found even if the file changed.
+# - "compression": the codec ("zlib" or "lzma") the sender would like to use.
+#   The receiver answers with the codec it accepts. Each chunk is then
+#   compressed on its own, so chunks can still be sent in parallel and
+#   resumed, and a chunk carries "codec" only if compressing it was worth it.
+
+TRANSFER_MAGIC = b'\x00XFER'
+TRANSFER_VERSION = 2
+CHUNK_SIZE = 4 * 1024 * 1024 # Bytes per chunk
+PARALLEL_CONNECTIONS = 4 # Connections used to send one file
+
+
+def chunk_count(size, chunk_size):
+    return (size + chunk_size - 1) // chunk_size
+
+
+COMPRESSORS = ("zlib", "lzma") if lzma is not None else ("zlib",)
+DEFAULT_COMPRESSION_LEVEL = {"zlib": 6, "lzma": 1}
+COMPRESSION_SAMPLE = 64 * 1024 # Bytes test-compressed to decide whether a chunk is worth compressing
+MIN_COMPRESSION_SAVING = 0.1 # Chunks that shrink less than this are sent uncompressed
+_DECOMPRESS_ERRORS = (zlib.error, EOFError) + ((lzma.LZMAError,) if lzma is not None else ())
+
+
+def file_checksums(path, chunk_size=CHUNK_SIZE, block_hashes=False):
+    """
+    Reads a file once and computes its SHA-256 and the CRC-32 of every chunk.
+
+    Args:
+        block_hashes (bool): Also compute the SHA-256 of every chunk.
+
+    Returns:
+        tuple: (hex SHA-256 of the file, list of chunk CRC-32s,
+        concatenated chunk SHA-256 digests or None)
+    """
+    digest = hashlib.sha256()
+    crcs = []
+    blocks = [] if block_hashes else None
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb') as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+            crcs.append(zlib.crc32(view[:size]))
+            if blocks is not None:
+                blocks.append(hashlib.sha256(view[:size]).digest())
+    return digest.hexdigest(), crcs, None if blocks is None else b''.join(blocks)
+
+
+def compress_chunk(data, codec, level=None):
+    """
+    Compresses one chunk.
+
+    A small sample is compressed first, so data that does not compress
+    (media, archives, encrypted files) costs little time.
+
+    Returns:
+        bytes: The compressed chunk, or None if compressing it is not worth it.
+    """
+    if level is None:
+        level = DEFAULT_COMPRESSION_LEVEL[codec]
+    limit = len(data) * (1 - MIN_COMPRESSION_SAVING)
+    sample = data[:COMPRESSION_SAMPLE]
+    if len(zlib.compress(sample, 1)) > len(sample) * (1 - MIN_COMPRESSION_SAVING):
+        return None
+    if codec == "zlib":
+        compressed = zlib.compress(data, level)
+    else:
+        compressed = lzma.compress(data, preset=level)
+    return compressed if len(compressed) <= limit else None
+
+
+def decompress_chunk(data, codec, length):
+    """
+    Decompresses one chunk that must come out as exactly `length` bytes.
+
+    Raises:
+        ProtocolError: If the data is not a valid compressed chunk of that length.
+    """
+    if codec == "zlib":
+        decompressor = zlib.decompressobj()
+    elif codec == "lzma" and lzma is not None:
+        decompressor = lzma.LZMADecompressor()
+    else:
+        raise ProtocolError(f"Unknown compression {codec!r}")
+    try:
+        # Never produce more than one chunk, whatever the data claims
+        result = decompressor.decompress(data, length + 1)
+    except _DECOMPRESS_ERRORS as e:
+        raise ProtocolError(f"Damaged compressed chunk: {e}") from None
+    if len(result) != length or not decompressor.eof:
+        raise ProtocolError("Compressed chunk does not have the right length")
+    return result
+
+
+def read_message(sock, reader, codec=DEFAULT_CODEC):
+    """
+    Returns the next control message received on sock, read through a FrameReader.
+
+    Raises:
+        ConnectionError: If the connection is closed first.
+    """
+    while True:
+        for payload in reader.frames():
+            return codec.decode(payload)
+        if not reader.recv_into(sock):
+            raise ConnectionError("Connection closed by the other side")